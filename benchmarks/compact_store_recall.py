@@ -0,0 +1,130 @@
+"""Recall@k against memory for the compact vector store settings.
+
+Ground truth is exact cosine search over the full float32 vectors. Each
+setting (quantization, truncation, rescoring) is scored by how many of the
+true top-k neighbours it returns, next to the bytes it keeps per vector.
+
+    # Synthetic clustered vectors (no API calls):
+    python benchmarks/compact_store_recall.py
+
+    # Your own corpus: chunk and embed a docs directory once with OpenAI
+    # (OPENAI_API_KEY), saving the vectors for later runs:
+    python benchmarks/compact_store_recall.py --docs-dir ~/docs --save-vectors corpus.npy
+    python benchmarks/compact_store_recall.py --vectors corpus.npy
+
+Queries are chunks held out of the corpus, so each stands in for a question
+phrased like the documents.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from innieme.compact_index import CompactIndex  # noqa: E402
+
+SETTINGS = [
+    # (label, quantization, dimensions, rescore)
+    ("sq8", "sq8", None, None),
+    ("sq8 + flat rescore", "sq8", None, "flat"),
+    ("pq", "pq", None, None),
+    ("pq + sq8 rescore", "pq", None, "sq8"),
+    ("pq + fp16 rescore", "pq", None, "fp16"),
+    ("sq8, 512 dims", "sq8", 512, None),
+    ("sq8, 256 dims", "sq8", 256, None),
+    ("pq + sq8 rescore, 512 dims", "pq", 512, "sq8"),
+]
+
+
+def synthetic_vectors(n: int, d: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors around a few hundred centres, clustered like text embeddings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(10, n // 50), d))
+    x = centres[rng.integers(0, len(centres), n)] + 0.6 * rng.standard_normal((n, d))
+    return x.astype(np.float32)
+
+
+def embed_docs_dir(docs_dir: str) -> np.ndarray:
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import OpenAIEmbeddingsFactory
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+    factory = OpenAIEmbeddingsFactory(os.environ["OPENAI_API_KEY"])
+    processor = DocumentProcessor("benchmark", docs_dir, factory, FAISSVectorStoreFactory())
+
+    async def chunk_texts():
+        texts = []
+        for path in processor._find_documents().files:
+            texts.extend(c.text for c in (await processor._extract_text(path)) or [])
+        return texts
+
+    texts = asyncio.run(chunk_texts())
+    print(f"Embedding {len(texts)} chunks from {docs_dir}...")
+    return np.asarray(factory.create_embeddings().embed_documents(texts), dtype=np.float32)
+
+
+def normalise(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", help=".npy file of corpus embeddings")
+    parser.add_argument("--docs-dir", help="chunk and embed this directory with OpenAI")
+    parser.add_argument("--save-vectors", help="save the embedded corpus here")
+    parser.add_argument("--size", type=int, default=20000, help="synthetic corpus size")
+    parser.add_argument("--dims", type=int, default=1536, help="synthetic vector dimensions")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5, help="the k of recall@k (retrieval_top_k)")
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors)
+    elif args.docs_dir:
+        vectors = embed_docs_dir(args.docs_dir)
+    else:
+        vectors = synthetic_vectors(args.size, args.dims)
+        print("Synthetic vectors are not Matryoshka-trained: truncated settings will look far\n"
+              "worse than on real text-embedding-3-* vectors. Use --docs-dir for those.\n")
+    if args.save_vectors:
+        np.save(args.save_vectors, vectors)
+
+    rng = np.random.default_rng(1)
+    held_out = rng.choice(len(vectors), size=min(args.queries, len(vectors) // 10), replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    corpus, queries = normalise(vectors[mask]), normalise(vectors[held_out])
+    truth = exact_top_k(corpus, queries, args.k)
+    n, d = corpus.shape
+    print(f"{n} vectors x {d} dims, {len(queries)} queries, recall@{args.k}\n")
+    print(f"{'setting':<30} {'bytes/vec':>10} {'total MB':>9} {'recall':>7} {'ms/query':>9}")
+    print(f"{'float32 (exact)':<30} {d * 4:>10} {n * d * 4 / 1e6:>9.1f} {1.0:>7.3f} {'':>9}")
+
+    for label, quantization, dims, rescore in SETTINGS:
+        if dims and dims >= d:
+            continue
+        data, query_data = corpus, queries
+        if dims:
+            data, query_data = normalise(corpus[:, :dims]), normalise(queries[:, :dims])
+        index = CompactIndex(quantization, rescore=rescore, rescore_factor=args.rescore_factor)
+        index.add(data)
+        started = time.perf_counter()
+        _, found = index.search(query_data, args.k)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = np.mean([len(set(t) & set(f)) / args.k for t, f in zip(truth, found)])
+        size = index.memory_bytes()
+        print(f"{label:<30} {size // n:>10} {size / 1e6:>9.1f} {recall:>7.3f} {elapsed_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""End-to-end scan and query benchmark, offline.
+
+Generates a synthetic corpus of Markdown, DOCX and PDF files, scans it with
+the ``fake`` embedding backend, then answers questions through
+``Topic.process_query`` with a deterministic PydanticAI ``FunctionModel`` in
+place of the LLM. No API keys or network access are needed, so runs are
+comparable across machines and releases.
+
+    python benchmarks/end_to_end.py
+    python benchmarks/end_to_end.py --docs 500 --queries 500 --concurrency 8 \\
+        --vector-store faiss --json results.json
+
+Reports scan throughput (documents and chunks per second), peak RSS after
+the scan and after the queries, and p50/p95/p99 latency per query stage:
+``retrieval`` (embedding the question and searching the index), ``llm``
+(the agent run, including prompt assembly; ``--llm-latency-ms`` adds a
+simulated provider delay) and ``total``. Fake embeddings are random, so the
+numbers measure this project's own overhead, not retrieval quality.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import wraps
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+WORDS = (
+    "service cluster invoice report incident deploy config release quarter region "
+    "customer support ticket database backup restore policy access token network "
+    "latency storage budget forecast audit schedule handbook onboarding vendor "
+    "contract renewal dashboard metric alert escalation runbook migration"
+).split()
+FORMATS = ("md", "docx", "pdf")
+
+
+def paragraph(rng: random.Random, sentences: int = 5) -> str:
+    return " ".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+
+def write_pdf(path: str, paragraphs):
+    """A minimal text PDF: Helvetica, one line per ~90 characters, 60 per page."""
+    lines = []
+    for text in paragraphs:
+        words, line = text.split(), ""
+        for word in words:
+            if len(line) + len(word) > 90:
+                lines.append(line)
+                line = ""
+            line = f"{line} {word}".strip()
+        lines.extend([line, ""])
+    pages = [lines[i:i + 60] for i in range(0, len(lines), 60)] or [[]]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        stream = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({line}) Tj T*" for line in page) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+        content = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path: str, paragraphs):
+    import docx
+
+    document = docx.Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    document.save(path)
+
+
+def generate_corpus(root: str, docs: int, paragraphs: int, formats, seed: int = 0) -> int:
+    """Write ``docs`` files under ``root``, cycling through ``formats``; returns total bytes."""
+    rng = random.Random(seed)
+    for i in range(docs):
+        fmt = formats[i % len(formats)]
+        subdir = os.path.join(root, f"section-{i % 10}")
+        os.makedirs(subdir, exist_ok=True)
+        path = os.path.join(subdir, f"doc-{i:05d}.{fmt}")
+        texts = [paragraph(rng) for _ in range(paragraphs)]
+        if fmt == "md":
+            with open(path, "w") as f:
+                f.write(f"# Document {i}\n\n" + "\n\n".join(texts) + "\n")
+        elif fmt == "docx":
+            write_docx(path, texts)
+        else:
+            write_pdf(path, texts)
+    return sum(
+        os.path.getsize(os.path.join(d, name)) for d, _, names in os.walk(root) for name in names
+    )
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        @wraps(func)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - started)
+        return timed
+
+    def summary(self):
+        return {
+            stage: {
+                "count": len(values),
+                **{f"p{p}_ms": float(np.percentile(values, p) * 1000) for p in (50, 95, 99)},
+                "mean_ms": float(np.mean(values) * 1000),
+            }
+            for stage, values in self.samples.items()
+        }
+
+
+def stub_model(latency: float):
+    """A FunctionModel answering every question the same way, after ``latency`` seconds."""
+    from pydantic_ai.messages import ModelResponse, TextPart
+    from pydantic_ai.models.function import FunctionModel
+
+    async def answer(messages, info):
+        if latency:
+            await asyncio.sleep(latency)
+        return ModelResponse(parts=[TextPart("A deterministic benchmark answer.")])
+
+    return FunctionModel(answer)
+
+
+def build_topic(docs_dir: str, vector_store: str):
+    from innieme.discord_bot_config import DiscordBotConfig, OutieConfig, TopicConfig
+    from innieme.innie import Topic
+
+    bot = DiscordBotConfig(
+        discord_token="benchmark", embeddings_api_key="benchmark", llm_api_key="benchmark",
+        embedding_model="fake", vector_store=vector_store, outies=[],
+    )
+    outie = OutieConfig(outie_id=1, topics=[], bot=bot)
+    bot.outies.append(outie)
+    topic = TopicConfig(name="benchmark", role="You answer questions about the documents.",
+                        docs_dir=docs_dir, channels=[], outie=outie)
+    outie.topics.append(topic)
+    return Topic(outie, topic)
+
+
+async def run(args, docs_dir: str):
+    results = {}
+    rss_before = peak_rss_mb()
+    topic = build_topic(docs_dir, args.vector_store)
+    processor = topic.document_processor
+
+    started = time.perf_counter()
+    await topic.scan_and_vectorize()
+    scan_seconds = time.perf_counter() - started
+    chunks = sum(len(ids) for ids in processor._source_ids.values())
+    results["scan"] = {
+        "seconds": scan_seconds,
+        "documents": args.docs,
+        "chunks": chunks,
+        "documents_per_second": args.docs / scan_seconds,
+        "chunks_per_second": chunks / scan_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    timer = StageTimer()
+    engine = topic.conversation_engine
+    processor.search_documents = timer.wrap("retrieval", processor.search_documents)
+    engine._generate_response = timer.wrap("llm", engine._generate_response)
+    process_query = timer.wrap("total", topic.process_query)
+
+    rng = random.Random(1)
+    questions = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))) + "?"
+                 for _ in range(args.queries)]
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def ask(i: int, question: str):
+        async with limit:
+            # Each question in its own thread, so history does not grow.
+            await process_query(i, question, [{"role": "user", "content": question}])
+
+    with engine.agent.override(model=stub_model(args.llm_latency_ms / 1000)):
+        started = time.perf_counter()
+        await asyncio.gather(*(ask(i, q) for i, q in enumerate(questions)))
+        query_seconds = time.perf_counter() - started
+
+    results["queries"] = {
+        "count": args.queries,
+        "concurrency": args.concurrency,
+        "queries_per_second": args.queries / query_seconds,
+        "stages": timer.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    results["baseline_rss_mb"] = rss_before
+    return results
+
+
+def version() -> str:
+    try:
+        from importlib.metadata import version as package_version
+        return package_version("innieme")
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200, help="documents to generate")
+    parser.add_argument("--paragraphs", type=int, default=12, help="paragraphs per document")
+    parser.add_argument("--formats", default="md,docx,pdf", help="comma-separated, cycled through")
+    parser.add_argument("--docs-dir", help="keep the generated corpus here (default a temporary directory)")
+    parser.add_argument("--vector-store", default="chroma", choices=["chroma", "faiss", "compact"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1, help="questions in flight at once")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated LLM response time")
+    parser.add_argument("--json", help="write the results here as JSON")
+    args = parser.parse_args()
+
+    formats = [f.strip().lstrip(".") for f in args.formats.split(",") if f.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unsupported formats: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_dir = args.docs_dir or os.path.join(tmp, "docs")
+        started = time.perf_counter()
+        corpus_bytes = generate_corpus(docs_dir, args.docs, args.paragraphs, formats)
+        print(f"Generated {args.docs} documents ({corpus_bytes / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - started:.1f}s")
+        results = asyncio.run(run(args, docs_dir))
+
+    results["corpus"] = {"documents": args.docs, "paragraphs": args.paragraphs,
+                         "formats": formats, "bytes": corpus_bytes}
+    results["environment"] = {
+        "innieme": version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "vector_store": args.vector_store,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+    scan, queries = results["scan"], results["queries"]
+    print(f"\nScan: {scan['documents']} documents, {scan['chunks']} chunks in {scan['seconds']:.2f}s "
+          f"({scan['documents_per_second']:.1f} docs/s, {scan['chunks_per_second']:.0f} chunks/s), "
+          f"peak RSS {scan['peak_rss_mb']:.0f} MB")
+    print(f"Queries: {queries['count']} at concurrency {queries['concurrency']}, "
+          f"{queries['queries_per_second']:.1f}/s, peak RSS {queries['peak_rss_mb']:.0f} MB\n")
+    print(f"{'stage':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage in ("retrieval", "llm", "total"):
+        s = queries["stages"][stage]
+        print(f"{stage:<10} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""ONNX Runtime embeddings against sentence-transformers on PyTorch.
+
+Embeds the same texts with the ``huggingface`` backend (all-MiniLM-L6-v2 on
+PyTorch) and with the ``onnx`` backend for each export given, and reports the
+lowest cosine between matching vectors and the throughput of each.
+
+    pip install -e '.[onnx]' sentence-transformers
+    python benchmarks/onnx_embeddings.py
+    python benchmarks/onnx_embeddings.py --docs-dir ~/docs --threads 4 \\
+        --onnx-file onnx/model.onnx --onnx-file onnx/model_qint8_avx512.onnx
+
+Without sentence-transformers installed only the ONNX throughput is shown.
+The float32 export should agree to a cosine above 0.9999; quantized exports
+typically stay above 0.99.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from innieme.onnx_embeddings import DEFAULT_MODEL, OnnxEmbeddings, resolve_model_dir  # noqa: E402
+
+SAMPLE = [
+    "Restart the ingestion service after changing its configuration.",
+    "Invoices are issued on the first working day of each month.",
+    "The staging cluster is rebuilt from scratch every night.",
+    "Escalate a sev-1 incident to the on-call lead within fifteen minutes.",
+    "Quarterly reports summarise revenue, churn and support volume by region.",
+]
+
+
+def docs_dir_texts(docs_dir: str):
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import ExistingEmbeddingsFactory
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+    processor = DocumentProcessor("benchmark", docs_dir, ExistingEmbeddingsFactory(None),
+                                  FAISSVectorStoreFactory())
+
+    async def chunk_texts():
+        texts = []
+        for path in processor._find_documents().files:
+            texts.extend(c.text for c in (await processor._extract_text(path)) or [])
+        return texts
+
+    return asyncio.run(chunk_texts())
+
+
+def timed(embed, texts):
+    started = time.perf_counter()
+    vectors = np.asarray(embed(texts), dtype=np.float32)
+    return vectors, len(texts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Hub repository or local export directory")
+    parser.add_argument("--onnx-file", action="append", help="export(s) to compare (default onnx/model.onnx)")
+    parser.add_argument("--docs-dir", help="use this directory's chunks as the texts")
+    parser.add_argument("--texts", type=int, default=2000, help="how many texts to embed")
+    parser.add_argument("--threads", type=int, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = docs_dir_texts(args.docs_dir) if args.docs_dir else SAMPLE
+    texts = (texts * (args.texts // len(texts) + 1))[:args.texts]
+    print(f"{len(texts)} texts, model {args.model}\n")
+
+    reference = None
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        torch_model = HuggingFaceEmbeddings(model_name=args.model, encode_kwargs={"normalize_embeddings": True})
+        torch_model.embed_documents(texts[:8])  # warm-up
+        reference, rate = timed(torch_model.embed_documents, texts)
+        print(f"{'pytorch (sentence-transformers)':<40} {rate:>9.0f} texts/s")
+    except ImportError:
+        print("sentence-transformers not installed; skipping the PyTorch reference\n")
+
+    for model_file in args.onnx_file or ["onnx/model.onnx"]:
+        model_dir = resolve_model_dir(args.model, model_file)
+        embeddings = OnnxEmbeddings(model_dir, model_file, threads=args.threads, batch_size=args.batch_size)
+        embeddings.embed_documents(texts[:8])  # warm-up
+        vectors, rate = timed(embeddings.embed_documents, texts)
+        line = f"{'onnx ' + model_file:<40} {rate:>9.0f} texts/s"
+        if reference is not None:
+            line += f"   min cosine {np.min(np.sum(vectors * reference, axis=1)):.5f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
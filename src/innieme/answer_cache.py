@@ -0,0 +1,83 @@
+"""Cached answers to first questions, matched by embedding similarity.
+
+Many mentions are a first question with no thread behind it, asking what
+someone else asked an hour ago in other words. With a topic's
+``answer_cache_threshold`` set, the conversation engine keeps the answers it
+gives to such questions and replies from here when a new question's
+embedding is at least that similar (cosine) to a cached one, skipping the
+retrieval and the LLM call.
+
+An answer only matches while the topic's index generation and role are the
+ones it was made under: a rescan or a reindexed file makes every cached
+answer stale, as does a changed role. Answers also expire after ``ttl``
+seconds, and ``clear()`` drops them all on the outie's say-so.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_TTL = 3600.0
+DEFAULT_MAX_ENTRIES = 256
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray  # unit length
+    answer: str
+    generation: int
+    role: str
+    expires: float
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class AnswerCache:
+    def __init__(self, threshold: float, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Oldest first, for eviction. Keyed by question text, so asking the
+        # same question again refreshes its entry instead of adding another.
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _prune(self, generation: int, role: str):
+        now = time.monotonic()
+        for question in [q for q, e in self._entries.items()
+                         if e.expires <= now or e.generation != generation or e.role != role]:
+            del self._entries[question]
+
+    def get(self, vector: List[float], generation: int, role: str) -> Optional[str]:
+        """The cached answer to the most similar question above the threshold, if any."""
+        self._prune(generation, role)
+        if not self._entries:
+            return None
+        entries = list(self._entries.values())
+        similarities = np.stack([e.vector for e in entries]) @ _unit(vector)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return entries[best].answer
+
+    def put(self, question: str, vector: List[float], answer: str, generation: int, role: str):
+        self._entries.pop(question, None)
+        self._entries[question] = _Entry(_unit(vector), answer, generation, role,
+                                         time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> int:
+        """Drop every cached answer. Returns how many there were."""
+        count = len(self._entries)
+        self._entries.clear()
+        return count
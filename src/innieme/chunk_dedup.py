@@ -0,0 +1,128 @@
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# SimHash fingerprints within this many differing bits count as the same text.
+# Three bits of 64 catches a changed date, a fixed typo or re-flowed whitespace
+# in a ~1000 character chunk, while chunks that merely share a topic sit
+# twenty or more bits apart.
+NEAR_DUPLICATE_MAX_DISTANCE = 3
+
+# Metadata key listing the other files a deduplicated chunk was found in.
+# Vector stores only accept scalar metadata values, so the paths are joined.
+ALSO_IN_KEY = "also_in"
+ALSO_IN_SEPARATOR = "\n"
+
+# Fingerprints are indexed by four 16-bit bands. Two fingerprints at most three
+# bits apart must agree exactly on at least one band (pigeonhole), so only
+# chunks sharing a band are ever compared.
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_WORD_RE = re.compile(r"\w+")
+_SHINGLE_SIZE = 3
+
+
+def _normalise(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _token_hashes(text: str) -> np.ndarray:
+    """64-bit hashes of the text's word shingles, as a uint64 array."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) >= _SHINGLE_SIZE:
+        shingles = [
+            " ".join(words[i:i + _SHINGLE_SIZE])
+            for i in range(len(words) - _SHINGLE_SIZE + 1)
+        ]
+    else:
+        shingles = [" ".join(words)]
+    digests = b"".join(
+        hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles
+    )
+    return np.frombuffer(digests, dtype=np.uint64)
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of a text's word shingles.
+
+    Computed over all shingles at once: the hashes are unpacked into a bit
+    matrix and summed column-wise, rather than walking 64 bits per shingle.
+    """
+    hashes = _token_hashes(text)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(hashes)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "little")
+
+
+def _bands(fingerprint: int) -> List[tuple]:
+    return [
+        (band, (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK)
+        for band in range(_BANDS)
+    ]
+
+
+@dataclass
+class DedupedChunk:
+    text: str
+    source: str
+    # Location within the source (page, heading), from the first copy seen.
+    metadata: Dict = field(default_factory=dict)
+    # Every other file the same (or nearly the same) text was found in.
+    also_in: List[str] = field(default_factory=list)
+
+
+class ChunkDeduplicator:
+    """Collapses exact and near-duplicate chunks into one canonical chunk.
+
+    Exact duplicates are matched on a hash of the whitespace- and
+    case-normalised text; near duplicates on SimHash distance. The first chunk
+    seen is kept, and the sources of the ones dropped are recorded on it, so an
+    answer can still be attributed to every file that says the same thing.
+    """
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.chunks: List[DedupedChunk] = []
+        self.merged = 0
+        self._exact: Dict[str, int] = {}
+        self._fingerprints: List[int] = []
+        self._band_index: Dict[tuple, List[int]] = {}
+
+    def add(self, text: str, source: str, metadata: Optional[Dict] = None) -> bool:
+        """Add a chunk. Returns False when it was merged into an existing one."""
+        digest = hashlib.sha1(_normalise(text).encode("utf-8")).hexdigest()
+        index = self._exact.get(digest)
+        if index is None:
+            fingerprint = simhash(text)
+            index = self._near_match(fingerprint)
+            if index is None:
+                self._keep(text, source, metadata or {}, digest, fingerprint)
+                return True
+            self._exact[digest] = index
+        canonical = self.chunks[index]
+        if source != canonical.source and source not in canonical.also_in:
+            canonical.also_in.append(source)
+        self.merged += 1
+        return False
+
+    def _near_match(self, fingerprint: int) -> Optional[int]:
+        candidates = set()
+        for band in _bands(fingerprint):
+            candidates.update(self._band_index.get(band, ()))
+        for index in sorted(candidates):
+            if bin(self._fingerprints[index] ^ fingerprint).count("1") <= self.max_distance:
+                return index
+        return None
+
+    def _keep(self, text: str, source: str, metadata: Dict, digest: str, fingerprint: int):
+        index = len(self.chunks)
+        self.chunks.append(DedupedChunk(text=text, source=source, metadata=metadata))
+        self._exact[digest] = index
+        self._fingerprints.append(fingerprint)
+        for band in _bands(fingerprint):
+            self._band_index.setdefault(band, []).append(index)
@@ -121,8 +121,24 @@ Examples:
         '-c', '--config',
         help='Path to configuration file'
     )
+
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve Prometheus metrics on this port at /metrics (off by default)'
+    )
+
+    parser.add_argument(
+        '--metrics-host',
+        default='127.0.0.1',
+        help='Address the metrics endpoint listens on (default 127.0.0.1)'
+    )
     
     args = parser.parse_args()
+
+    if args.metrics_port is not None:
+        from innieme import metrics
+        metrics.serve(args.metrics_port, args.metrics_host)
     
     if args.platform == 'discord':
         run_discord_bot(args.config)
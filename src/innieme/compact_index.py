@@ -0,0 +1,204 @@
+"""Compact FAISS indexes: quantized codes, optional truncation and rescoring.
+
+A 1536-dimension float32 embedding is 6 KB. Stored as int8 scalar codes it is
+1.5 KB, and as 96 product-quantization codes 96 bytes, at some cost in recall.
+Rescoring wins most of that recall back: the quantized index is searched for a
+few times more candidates than asked for, and those are re-ranked against a
+more precise copy of the vectors.
+
+Only "flat" code indexes are used (``IndexScalarQuantizer``, ``IndexPQ``), not
+IVF. Removing vectors from a flat index shifts the later ones down, which is
+the numbering langchain's FAISS wrapper assumes when it deletes; IVF keeps
+sparse ids, so incremental updates would corrupt the id mapping. A flat scan
+over compact codes is fast at the size of a documentation corpus.
+
+Quantizers are trained on the vectors they will encode, and a quantizer
+trained on a handful of them encodes everything added later badly. So until
+a store has enough vectors to train on, it keeps them exactly, in a flat
+index, and trains once they reach the minimum sample.
+"""
+
+import logging
+from typing import List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .query_batcher import embed_queries
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ("sq8", "pq")
+RESCORE_PRECISIONS = ("sq8", "fp16", "flat")
+
+# Scalar quantization learns each dimension's range; product quantization
+# learns 256 centroids per sub-vector, which needs a larger sample to be
+# worth anything.
+MIN_SQ8_TRAINING_VECTORS = 256
+MIN_PQ_TRAINING_VECTORS = 1000
+
+
+def _scalar_quantizer(d: int, precision: str):
+    qtype = {
+        "sq8": faiss.ScalarQuantizer.QT_8bit,
+        "fp16": faiss.ScalarQuantizer.QT_fp16,
+    }[precision]
+    return faiss.IndexScalarQuantizer(d, qtype, faiss.METRIC_L2)
+
+
+def _pq_subquantizers(d: int, bytes_per_vector: Optional[int]) -> int:
+    """The largest divisor of ``d`` not above the target code size (default d/16)."""
+    target = bytes_per_vector or max(1, d // 16)
+    for m in range(min(target, d), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+class CompactIndex:
+    """A FAISS-index lookalike over quantized codes, with optional rescoring.
+
+    Implements the part of the ``faiss.Index`` interface langchain's FAISS
+    store and ``retrieval.candidates_with_vectors`` use: ``add``, ``search``,
+    ``remove_ids``, ``reconstruct``, ``ntotal`` and ``d``. Vectors are held
+    in an exact flat index until ``add`` has been given enough to train on;
+    the underlying indexes are then created, trained on all of them, and
+    take them over in the same order.
+    """
+
+    def __init__(self,
+                 quantization: str = "sq8",
+                 rescore: Optional[str] = None,
+                 rescore_factor: int = 4,
+                 pq_bytes: Optional[int] = None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        if rescore is not None and rescore not in RESCORE_PRECISIONS:
+            raise ValueError(f"Unsupported rescore precision: {rescore}")
+        self.quantization = quantization
+        self.rescore = rescore
+        self.rescore_factor = max(1, rescore_factor)
+        self.pq_bytes = pq_bytes
+        self.base = None
+        self.refine = None
+        # The vectors added before there were enough to train on.
+        self.untrained = None
+
+    @property
+    def min_training_vectors(self) -> int:
+        return MIN_PQ_TRAINING_VECTORS if self.quantization == "pq" else MIN_SQ8_TRAINING_VECTORS
+
+    @property
+    def _index(self):
+        return self.base if self.base is not None else self.untrained
+
+    @property
+    def d(self) -> int:
+        return self._index.d if self._index is not None else 0
+
+    @property
+    def ntotal(self) -> int:
+        return self._index.ntotal if self._index is not None else 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.base is not None
+
+    def _build(self, vectors: np.ndarray):
+        d = vectors.shape[1]
+        logger.info(f"Training {self.quantization} quantization on {len(vectors)} vectors")
+        if self.quantization == "pq":
+            self.base = faiss.IndexPQ(d, _pq_subquantizers(d, self.pq_bytes), 8, faiss.METRIC_L2)
+        else:
+            self.base = _scalar_quantizer(d, "sq8")
+        self.base.train(vectors)
+        if self.rescore == "flat":
+            self.refine = faiss.IndexFlatL2(d)
+        elif self.rescore:
+            self.refine = _scalar_quantizer(d, self.rescore)
+            self.refine.train(vectors)
+
+    def add(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.base is None:
+            if self.untrained is None:
+                self.untrained = faiss.IndexFlatL2(vectors.shape[1])
+            self.untrained.add(vectors)
+            if self.untrained.ntotal < self.min_training_vectors:
+                return
+            vectors = self.untrained.reconstruct_n(0, self.untrained.ntotal)
+            self.untrained = None
+            self._build(vectors)
+        self.base.add(vectors)
+        if self.refine is not None:
+            self.refine.add(vectors)
+
+    def search(self, queries, k: int):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.ntotal == 0 or k < 1:
+            return (np.full((len(queries), max(k, 0)), np.inf, dtype=np.float32),
+                    np.full((len(queries), max(k, 0)), -1, dtype=np.int64))
+        if self.refine is None or self.base is None:
+            return self._index.search(queries, k)
+        _, candidates = self.base.search(queries, min(k * self.rescore_factor, self.ntotal))
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(queries, candidates)):
+            ids = ids[ids >= 0]
+            exact = ((self.refine.reconstruct_batch(ids) - query) ** 2).sum(axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            labels[row, :len(order)] = ids[order]
+        return distances, labels
+
+    def remove_ids(self, ids) -> int:
+        if self._index is None:
+            return 0
+        ids = np.asarray(ids, dtype=np.int64)
+        removed = self._index.remove_ids(ids)
+        if self.refine is not None:
+            self.refine.remove_ids(ids)
+        return removed
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        # The rescoring copy is the more precise of the two.
+        return (self.refine or self._index).reconstruct(int(i))
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the stored codes (excluding small fixed overheads)."""
+        total = 0
+        for index in (self.base, self.refine, self.untrained):
+            if index is not None:
+                total += index.sa_code_size() * index.ntotal
+        return total
+
+
+class TruncatedEmbeddings(Embeddings):
+    """Keeps the first ``dimensions`` components of each embedding, renormalised.
+
+    Matryoshka-trained models (OpenAI's text-embedding-3-*) front-load the
+    information, so a prefix of the vector is a usable embedding by itself;
+    OpenAI documents 256 dimensions of text-embedding-3-large outperforming
+    the full ada-002. Other models degrade much faster when truncated.
+    """
+
+    def __init__(self, embeddings: Embeddings, dimensions: int):
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+
+    def _truncate(self, vector: List[float]) -> List[float]:
+        head = np.asarray(vector[:self.dimensions], dtype=np.float32)
+        norm = np.linalg.norm(head)
+        return (head / norm if norm else head).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._truncate(v) for v in self.embeddings.embed_documents(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._truncate(self.embeddings.embed_query(text))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [self._truncate(v) for v in embed_queries(self.embeddings, texts)]
@@ -1,54 +1,132 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
 
 from pydantic_ai import Agent, RunContext
+from pydantic_ai.messages import (
+    CachePoint, ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart,
+)
 
-from .document_processor import DocumentProcessor
-from .knowledge_manager import KnowledgeManager
+from .document_processor import DocumentProcessor, ALSO_IN_KEY, ALSO_IN_SEPARATOR
+from .knowledge_manager import KnowledgeManager, SUMMARY_SOURCE_PREFIX
 from .discord_bot_config import TopicConfig
+from .answer_cache import AnswerCache
+from .llm import build_model
+from .usage import UsageTracker, response_cost
+from . import metrics, tracing
 import logging
 import os
+import time
 
 logger = logging.getLogger(__name__)
 
+ERROR_RESPONSE = "I apologize, but I encountered an error processing your request. Please try again later."
+
 
 def _format_chunk(doc) -> str:
     """Render one retrieved chunk, labelled with the file it came from.
 
     The source filename lets the model attribute a detail to a specific
     document; without it the chunks arrive anonymously and any citation the
-    model offers is a guess.
+    model offers is a guess. The page or heading narrows the citation to where
+    in the file the text is. A chunk found in several files (deduplicated at
+    ingestion) names all of them.
     """
-    source = (doc.metadata or {}).get("source")
+    metadata = doc.metadata or {}
+    source = metadata.get("source")
     if not source:
         return doc.page_content
-    return f"[source: {os.path.basename(source)}]\n{doc.page_content}"
+    # An approved summary (see KnowledgeManager.store_summary) has no file.
+    label = "approved summary" if source.startswith(SUMMARY_SOURCE_PREFIX) else os.path.basename(source)
+    if metadata.get("page"):
+        label += f", page {metadata['page']}"
+    if metadata.get("slide"):
+        label += f", slide {metadata['slide']}"
+    if metadata.get("row"):
+        label += f", from row {metadata['row']}"
+    if metadata.get("heading"):
+        label += f", section: {metadata['heading']}"
+    also_in = metadata.get(ALSO_IN_KEY)
+    if also_in:
+        others = ", ".join(os.path.basename(p) for p in also_in.split(ALSO_IN_SEPARATOR))
+        label += f"; also in: {others}"
+    return f"[source: {label}]\n{doc.page_content}"
 
 
-def _build_model(model_str: str, api_key: str):
-    """Build a PydanticAI model instance from a model string and API key.
+def _cache_settings(model_str: str, cache_key: str) -> dict:
+    """Model settings that mark the static prompt prefix as cacheable.
 
-    If no api_key is provided, returns the model string as-is and lets
-    pydantic-ai read the key from the appropriate environment variable.
+    Anthropic only caches what is explicitly marked, so the instructions get a
+    cache-control breakpoint. OpenAI caches matching prefixes automatically; the
+    cache key routes requests that share a prefix to the same cache. Other
+    providers get nothing, which leaves them as they were.
     """
-    if not api_key or ":" not in model_str:
-        return model_str
-    provider_name, model_name = model_str.split(":", 1)
+    provider_name = model_str.split(":", 1)[0] if ":" in model_str else ""
+    if provider_name == "anthropic":
+        return {"anthropic_cache_instructions": True}
     if provider_name == "openai":
-        from pydantic_ai.models.openai import OpenAIChatModel
-        from pydantic_ai.providers.openai import OpenAIProvider
-        return OpenAIChatModel(model_name, provider=OpenAIProvider(api_key=api_key))
-    elif provider_name == "anthropic":
-        from pydantic_ai.models.anthropic import AnthropicModel
-        from pydantic_ai.providers.anthropic import AnthropicProvider
-        return AnthropicModel(model_name, provider=AnthropicProvider(api_key=api_key))
-    # Unknown provider — fall back to string (env var)
-    return model_str
+        return {"openai_prompt_cache_key": cache_key}
+    return {}
+
+
+# Messages kept per thread. When a thread outgrows the cap it is cut back to
+# half rather than by one turn: every cut changes the prompt prefix and so
+# misses the provider's cache, and cutting in larger steps makes that rare.
+MAX_HISTORY_MESSAGES = 40
+
+
+def to_model_messages(history: List[Dict[str, str]]) -> List[ModelMessage]:
+    """Convert platform ``{"role", "content"}`` dicts into PydanticAI messages.
+
+    Used to seed a thread the engine has not seen before, e.g. a mention
+    inside an existing thread or the first question after a restart.
+    """
+    messages: List[ModelMessage] = []
+    for m in history:
+        if m["role"] == "assistant":
+            messages.append(ModelResponse(parts=[TextPart(content=m["content"])]))
+        else:
+            messages.append(ModelRequest(parts=[UserPromptPart(content=m["content"])]))
+    return messages
+
+
+def _append_turn(history: List[ModelMessage], query: str, response: str):
+    """Record one question and answer, without the documents retrieved for it.
+
+    The documents are per-query context, not conversation: keeping them would
+    resend every earlier turn's chunks on each later turn.
+    """
+    history.append(ModelRequest(parts=[UserPromptPart(content=query)]))
+    history.append(ModelResponse(parts=[TextPart(content=response)]))
+    if len(history) > MAX_HISTORY_MESSAGES:
+        del history[: len(history) - MAX_HISTORY_MESSAGES // 2]
+        # A history has to open with the user's side of a turn.
+        while history and not isinstance(history[0], ModelRequest):
+            del history[0]
+
+
+def _with_cache_point(history: List[ModelMessage]) -> List[ModelMessage]:
+    """A copy of ``history`` with a cache breakpoint after its last user message.
+
+    PydanticAI only accepts a CachePoint after other content in a user message,
+    so it cannot open the current prompt; the last stored question is the
+    nearest place that covers the thread so far.
+    """
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        if not isinstance(message, ModelRequest) or not message.parts:
+            continue
+        part = message.parts[-1]
+        if not isinstance(part, UserPromptPart):
+            continue
+        content = [part.content] if isinstance(part.content, str) else list(part.content)
+        marked = replace(message, parts=[*message.parts[:-1], replace(part, content=[*content, CachePoint()])])
+        return [*history[:index], marked, *history[index + 1:]]
+    return history
 
 
 @dataclass
 class ConversationDependencies:
     document_context: str
-    conversation_history: list
     topic_role: str
 
 
@@ -59,14 +137,18 @@ def _build_system_prompt(ctx: RunContext[ConversationDependencies]) -> str:
             f"Here is some relevant information to help answer the query:"
             f"\n\n{ctx.deps.document_context}"
         )
-    if ctx.deps.conversation_history:
-        history_text = "\n".join(
-            [f"{m['role']}: {m['content']}" for m in ctx.deps.conversation_history]
-        )
-        parts.append(f"Conversation history:\n{history_text}")
     return "\n\n".join(parts)
 
 
+def _build_static_system_prompt(ctx: RunContext[ConversationDependencies]) -> str:
+    """The "cached" layout's system prompt: the topic role and nothing else.
+
+    Identical on every request for a topic, which is what lets a provider serve
+    it from its prompt cache. Documents go into the user message.
+    """
+    return ctx.deps.topic_role
+
+
 class ConversationEngine:
     def __init__(
         self,
@@ -75,8 +157,12 @@ class ConversationEngine:
         knowledge_manager: KnowledgeManager,
         model: str = "openai:gpt-5.6-terra",
         llm_api_key: str = "",
+        usage: Optional[UsageTracker] = None,
+        answer_cache: Optional[AnswerCache] = None,
     ):
         self.topic = topic
+        self.model = model
+        self.usage = usage
         self.outie_id = topic.outie.outie_id
         self.document_processor = document_processor
         self.knowledge_manager = knowledge_manager
@@ -87,19 +173,44 @@ class ConversationEngine:
         self.retrieval_score_threshold = getattr(
             topic.outie.bot, "retrieval_score_threshold", None
         )
+        self.prompt_layout = getattr(topic.outie.bot, "prompt_layout", None) or "inline"
+        # Only Anthropic needs an explicit breakpoint between the stable prefix
+        # (role and thread history) and the per-query documents; other providers
+        # find the prefix themselves.
+        self._use_cache_point = self.prompt_layout == "cached" and model.startswith("anthropic:")
+        # Answers to first questions, reused for similar ones. None answers
+        # every question afresh.
+        self.answer_cache = answer_cache
 
-        self.agent = Agent(
-            model=_build_model(model, llm_api_key),
-            deps_type=ConversationDependencies,
-            instructions=_build_system_prompt,
-        )
+        if self.prompt_layout == "cached":
+            self.agent = Agent(
+                model=build_model(model, llm_api_key),
+                deps_type=ConversationDependencies,
+                instructions=_build_static_system_prompt,
+                model_settings=_cache_settings(model, f"innieme:{topic.name}"),
+            )
+        else:
+            self.agent = Agent(
+                model=build_model(model, llm_api_key),
+                deps_type=ConversationDependencies,
+                instructions=_build_system_prompt,
+            )
 
-    async def process_query(self, query: str, context_messages: list[dict[str, str]]) -> str:
+    async def process_query(
+        self,
+        query: str,
+        context_messages: list[dict[str, str]],
+        message_history: Optional[List[ModelMessage]] = None,
+    ) -> str:
         """Process a user query and generate a response.
 
         Args:
             query: The user's query text
             context_messages: List of previous messages in the conversation
+            message_history: The thread's PydanticAI message history, kept by
+                the caller across turns. The new question and answer are
+                appended to it in place. When omitted, a history is built from
+                ``context_messages`` for this call only.
 
         Raises:
             AssertionError: If context_messages is None
@@ -109,45 +220,116 @@ class ConversationEngine:
         if "outie please" == query.lower():
             return f"<@{self.outie_id}> Your consultation has been requested in this thread."
 
-        relevant_docs = await self.document_processor.search_documents(
-            query,
-            top_k=self.retrieval_top_k,
-            score_threshold=self.retrieval_score_threshold,
-        )
-        return await self._generate_response(query, relevant_docs, context_messages)
+        if message_history is None:
+            # The last context message is the current query, which is sent as
+            # the prompt rather than as history.
+            message_history = to_model_messages(context_messages[:-1])
+
+        # Only a first question can be answered from the cache: later ones
+        # depend on the thread before them.
+        query_vector = None
+        if self.answer_cache is not None and not message_history:
+            query_vector = await self.document_processor.embed_query(query)
+        # Read before retrieval: an answer built on an index that is replaced
+        # meanwhile is cached as of the old one, and so never served.
+        generation = self.document_processor.index_generation
+        if query_vector is not None:
+            cached = self.answer_cache.get(query_vector, generation, self.topic.role)
+            metrics.ANSWER_CACHE.inc(topic=self.topic.name, outcome="miss" if cached is None else "hit")
+            if cached is not None:
+                tracing.count(answer_cache_hits=1)
+                _append_turn(message_history, query, cached)
+                return cached
 
-    async def _generate_response(self, query: str, relevant_docs, history) -> str:
+        with tracing.span("retrieval", top_k=self.retrieval_top_k):
+            relevant_docs = await self.document_processor.search_documents(
+                query,
+                top_k=self.retrieval_top_k,
+                score_threshold=self.retrieval_score_threshold,
+                # Passed only when set: the cache has embedded the query already.
+                **({"query_vector": query_vector} if query_vector is not None else {}),
+            )
+        tracing.count(chunks=len(relevant_docs))
+        metrics.RETRIEVED_CHUNKS.observe(len(relevant_docs), topic=self.topic.name)
+        response = await self._generate_response(query, relevant_docs, message_history)
+        if query_vector is not None and response != ERROR_RESPONSE:
+            self.answer_cache.put(query, query_vector, response, generation, self.topic.role)
+        return response
+
+    async def _generate_response(self, query: str, relevant_docs, history: List[ModelMessage]) -> str:
         """Generate a response using PydanticAI agent.
 
         Args:
             query: The current user query
             relevant_docs: List of relevant document chunks from document processor
-            history: List of previous conversation messages (excluding current query)
+            history: The thread's earlier messages (excluding the current query).
+                The turn is appended to it on success.
         """
         context = "\n\n".join(_format_chunk(doc) for doc in relevant_docs)
 
         logger.debug("--------- Sent to LLM ---------")
         logger.debug(f"System message: {self.topic.role}")
-        logger.debug(f"...(matched {len(relevant_docs)} as context)...")
-
-        # Exclude the last message (current query) from history to avoid duplication
-        prior_history = history[:-1] if history else []
+        logger.debug(f"...(matched {len(relevant_docs)} as context, {len(history)} history messages)...")
 
         deps = ConversationDependencies(
             document_context=context,
-            conversation_history=prior_history,
             topic_role=self.topic.role,
         )
 
         response = ""
+        started = time.perf_counter()
         try:
-            result = await self.agent.run(query, deps=deps)
+            with tracing.span("llm", history_messages=len(history)):
+                result = await self.agent.run(
+                    self._user_prompt(query, deps),
+                    deps=deps,
+                    message_history=_with_cache_point(history) if self._use_cache_point else history,
+                )
+                usage = result.usage()
+                tracing.count(
+                    input_tokens=usage.input_tokens,
+                    output_tokens=usage.output_tokens,
+                    cache_read_tokens=usage.cache_read_tokens or None,
+                )
+            metrics.LLM_REQUESTS.inc(topic=self.topic.name, outcome="ok")
+            metrics.LLM_TOKENS.inc(usage.input_tokens, topic=self.topic.name, kind="input")
+            metrics.LLM_TOKENS.inc(usage.output_tokens, topic=self.topic.name, kind="output")
+            if self.usage is not None:
+                self.usage.record(
+                    "answer", self.topic.name, self.model,
+                    input_tokens=usage.input_tokens, output_tokens=usage.output_tokens,
+                    cache_read_tokens=usage.cache_read_tokens, chunks=len(relevant_docs),
+                    history_messages=len(history), latency=time.perf_counter() - started,
+                    cost=response_cost(result),
+                )
             response = result.output
+            _append_turn(history, query, response)
         except Exception as e:
+            metrics.LLM_REQUESTS.inc(topic=self.topic.name, outcome="error")
+            if self.usage is not None:
+                self.usage.record("answer", self.topic.name, self.model, chunks=len(relevant_docs),
+                                  history_messages=len(history), latency=time.perf_counter() - started,
+                                  error=True)
             logger.error(f"Error calling LLM: {str(e)}")
-            response = "I apologize, but I encountered an error processing your request. Please try again later."
+            response = ERROR_RESPONSE
 
         logger.debug("--------- Response -----------")
         logger.debug(response)
         logger.debug("------------------------------")
         return response
+
+    def _user_prompt(self, query: str, deps: ConversationDependencies):
+        """The user message for one turn, laid out for ``prompt_layout``.
+
+        "inline" sends the bare query; the documents are in the system prompt.
+        "cached" sends the documents and then the query as separate content
+        blocks, after the thread history: the documents change with every query,
+        so they come after everything that can be cached.
+        """
+        if self.prompt_layout != "cached" or not deps.document_context:
+            return query
+        return [
+            f"Here is some relevant information to help answer the query:"
+            f"\n\n{deps.document_context}",
+            query,
+        ]
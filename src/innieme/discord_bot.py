@@ -1,5 +1,7 @@
 from .discord_bot_config import DiscordBotConfig
 from .innie import Innie, Topic
+from .usage import UsageTracker
+from . import llm, scan_progress, tracing
 
 from discord import Message, Intents, ChannelType, NotFound, File, TextChannel, Embed, Color
 from discord.ext import commands
@@ -18,9 +20,13 @@ class DiscordBot:
         # Bot setup with required intents
         self.token = config.discord_token
         self.bot = commands.Bot(command_prefix='!', intents=self._create_intents())
+        # Seconds between edits of a scan's status message; 0 posts none.
+        self.scan_progress_interval = config.scan_progress_interval
 
+        # LLM usage of every topic, for "!stats".
+        self.usage = UsageTracker(config.usage_db)
         # Innies setup        
-        self.innies = [Innie(outie_config) for outie_config in config.outies]
+        self.innies = [Innie(outie_config, self.usage) for outie_config in config.outies]
         # Channel->Topic mapping
         self.channels: defaultdict[int, List[Topic]] = defaultdict(list)
         for innie in self.innies:
@@ -63,8 +69,39 @@ class DiscordBot:
                 await ctx.send(f"This command is only available to the outie ({outie_name}).")
                 return
             await ctx.send("Goodbye! Bot shutting down...")
+            for innie in self.innies:
+                for topic in innie.topics:
+                    await topic.stop_watching()
+            await self.usage.close()
+            await llm.close()
             await self.bot.close()
 
+        @self.bot.command(name='stats')
+        async def stats(ctx):
+            topic = self._identify_topic_by_message(ctx.message)
+            if not topic:
+                await ctx.send("'stats' command ignored as there is no topic in this channel to support.")
+                return
+            topic_outie = topic.outie_config.outie_id
+            if ctx.author.id != topic_outie:
+                outie_name = getattr(ctx.guild.get_member(topic_outie), 'display_name', 'unknown')
+                await ctx.send(f"This command is only available to the outie ({outie_name}).")
+                return
+            await ctx.send(await self.usage.report(topic.config.name, markup="discord"))
+
+        @self.bot.command(name='clearcache')
+        async def clearcache(ctx):
+            topic = self._identify_topic_by_message(ctx.message)
+            if not topic:
+                await ctx.send("'clearcache' command ignored as there is no topic in this channel to support.")
+                return
+            topic_outie = topic.outie_config.outie_id
+            if ctx.author.id != topic_outie:
+                outie_name = getattr(ctx.guild.get_member(topic_outie), 'display_name', 'unknown')
+                await ctx.send(f"This command is only available to the outie ({outie_name}).")
+                return
+            await ctx.send(topic.describe_clear_answer_cache())
+
         @self.bot.command(name='hello')
         async def hello(ctx):
             # Create an embed (this is Discord's rich text format)
@@ -150,23 +187,29 @@ class DiscordBot:
     async def respond(self, message:Message, response:str):
         await message.channel.send(response)
 
-    async def process_and_respond(self, topic, channel, query, thread_id, context_channel):
+    async def process_and_respond(self, topic, channel, query, thread_id, context_channel, user_id=None):
         """Process a query and respond in the channel"""
-        context_messages = await self.get_thread_context(context_channel) if context_channel else [{
-            "role": "user",
-            "content": query,
-        }]
+        with tracing.request("discord", topic=topic.config.name, channel=channel.id, user=user_id):
+            await self._process_and_respond(topic, channel, query, thread_id, context_channel)
+
+    async def _process_and_respond(self, topic, channel, query, thread_id, context_channel):
+        if context_channel:
+            with tracing.span("fetch_context"):
+                context_messages = await self.get_thread_context(context_channel)
+        else:
+            context_messages = [{"role": "user", "content": query}]
         # Add typing indicator while processing
         async with channel.typing():
             try:
                 response = await topic.process_query(thread_id, query, context_messages=context_messages)
-                if len(response) > 2000:
-                    # Create a file object with the response
-                    file = File(io.BytesIO(response.encode()), filename="response.txt")
-                    await channel.send("Response is too long, sending as a file:", file=file)
-                else:
-                    # Send as normal message if under limit
-                    await channel.send(response)                
+                with tracing.span("post"):
+                    if len(response) > 2000:
+                        # Create a file object with the response
+                        file = File(io.BytesIO(response.encode()), filename="response.txt")
+                        await channel.send("Response is too long, sending as a file:", file=file)
+                    else:
+                        # Send as normal message if under limit
+                        await channel.send(response)
             except Exception as e:
                 error_message = f"Sorry, I encountered an error while processing your request: {str(e)}"
                 await channel.send(error_message)
@@ -189,6 +232,8 @@ class DiscordBot:
     async def connect_and_prepare(self, topic: Topic):
         outie_id = topic.outie_config.outie_id
         channels = []
+        # The "preparing documents" message in each channel, edited with progress.
+        status_messages = []
         for channel in topic.config.channels:
             guild_id = channel.guild_id
             channel_id = channel.channel_id
@@ -212,8 +257,17 @@ class DiscordBot:
                     logger.error(f"Could not find channel with ID: {channel_id} in server {guild.name} or outie user {outie_id}.")
             else:
                 channels.append((channel, outie_member))
-                await channel.send(f"Bot {self.bot.user} is connected, preparing documents for {topic.config.name}...")
-        scanning_result = await topic.scan_and_vectorize()
+                status_messages.append(await channel.send(
+                    f"Bot {self.bot.user} is connected, preparing documents for {topic.config.name}..."))
+
+        async def publish(text: str):
+            for message in status_messages:
+                await message.edit(content=f"Bot {self.bot.user} is connected. {text}")
+
+        progress = scan_progress.ScanProgress(topic.config.name)
+        async with scan_progress.reporting(progress, self.scan_progress_interval, publish):
+            scanning_result = await topic.scan_and_vectorize(progress)
+        topic.start_watching()
         for channel, outie_member in channels:
             mention = f"(fyi <@{outie_id}>)" if outie_member else f"(no outie user {outie_id})"
             await channel.send(f"{scanning_result} {mention}")
@@ -248,7 +302,8 @@ class DiscordBot:
                     message.channel,
                     message.content,
                     message.channel.id,
-                    message.channel
+                    message.channel,
+                    user_id=message.author.id,
                 )
                 return
             else:
@@ -264,7 +319,8 @@ class DiscordBot:
                 thread,
                 message.content.replace(f'<@{self.bot.user.id}>', '').strip(),
                 thread.id,
-                None
+                None,
+                user_id=message.author.id,
             )
             return
         
@@ -289,8 +345,11 @@ class DiscordBot:
             return
         outie_id = topic.outie_config.outie_id
         if ctx.author.id == outie_id and ctx.channel.type == ChannelType.public_thread:
-            await topic.store_summary(ctx.channel.id)
-            await ctx.send("Summary approved and added to knowledge base.")
+            if await topic.store_summary(ctx.channel.id):
+                await ctx.send("Summary approved and added to knowledge base.")
+            else:
+                await ctx.send("There is no summary to approve in this thread; it may have expired. "
+                               "Ask for a new one with `summary and file`.")
     
     def run(self):
         """Run the bot"""
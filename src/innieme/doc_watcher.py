@@ -0,0 +1,204 @@
+"""Watches a topic's documents directory and reindexes what changes.
+
+Uses ``watchfiles`` (inotify on Linux, FSEvents on macOS) when it is installed,
+so an idle watcher costs nothing. Without it, or on filesystems that deliver no
+change events (NFS, SMB), the directory is polled by comparing modification
+times between walks. A walk of a large tree on such a filesystem can take a
+while, so polls are minutes apart by default, and never closer together than
+the last walk took; directories the topic excludes are not walked at all.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Quiet period after a change before the batch is handed on. Saving a document
+# is often several events (write, rename, metadata), and a copy of a whole
+# folder many more; waiting for them to settle turns that into one update.
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+
+# A steady stream of changes is still flushed this often, so the index cannot
+# fall behind indefinitely.
+MAX_BATCH_DELAY_SECONDS = 30.0
+
+DEFAULT_POLL_INTERVAL_SECONDS = 300.0
+
+OnChange = Callable[[Set[str]], Awaitable[object]]
+# Whether to ignore a path, given the path and whether it is a directory. An
+# ignored directory is not descended into.
+Exclude = Callable[[str, bool], bool]
+
+
+def _is_hidden(path: str, root: str) -> bool:
+    relative = os.path.relpath(path, root)
+    return any(part.startswith(".") for part in relative.split(os.sep))
+
+
+def snapshot(root: str, exclude: Optional[Exclude] = None) -> Dict[str, Tuple[int, int]]:
+    """``(mtime_ns, size)`` of every non-hidden, non-excluded file under ``root``."""
+    files: Dict[str, Tuple[int, int]] = {}
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if exclude is None or not exclude(entry.path, True):
+                        pending.append(entry.path)
+                elif entry.is_file() and (exclude is None or not exclude(entry.path, False)):
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                continue
+    return files
+
+
+def diff_snapshots(before: Dict[str, Tuple[int, int]], after: Dict[str, Tuple[int, int]]) -> Set[str]:
+    """Paths created, deleted or modified between two snapshots."""
+    return {
+        path for path in before.keys() | after.keys()
+        if before.get(path) != after.get(path)
+    }
+
+
+class DocumentWatcher:
+    """Calls ``on_change`` with batches of changed paths under ``docs_dir``.
+
+    Changes are debounced: a batch is delivered once no new change has arrived
+    for ``debounce`` seconds, or ``MAX_BATCH_DELAY_SECONDS`` after its first
+    change. Changes that arrive while ``on_change`` runs form the next batch.
+    """
+
+    def __init__(self,
+                 docs_dir: str,
+                 on_change: OnChange,
+                 debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+                 force_polling: bool = False,
+                 exclude: Optional[Exclude] = None):
+        self.docs_dir = docs_dir
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+        self.exclude = exclude
+        self._changes: Set[str] = set()
+        self._changed = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        """Start watching in a background task on the running loop."""
+        if self._task is None or self._task.done():
+            self._stop.clear()
+            self._task = asyncio.create_task(self.run(), name=f"watch:{self.docs_dir}")
+        return self._task
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        source = asyncio.create_task(self._collect())
+        try:
+            await self._deliver()
+        finally:
+            source.cancel()
+            await asyncio.gather(source, return_exceptions=True)
+
+    def _add(self, paths: Iterable[str]):
+        paths = {p for p in paths if not _is_hidden(p, self.docs_dir)
+                 and (self.exclude is None or not self.exclude(p, False))}
+        if paths:
+            self._changes.update(paths)
+            self._changed.set()
+
+    async def _collect(self):
+        if not self.force_polling:
+            try:
+                import watchfiles
+            except ImportError:
+                logger.info("watchfiles is not installed; polling for document changes")
+            else:
+                try:
+                    await self._collect_events(watchfiles)
+                    return
+                except Exception as e:
+                    # Typically the inotify watch limit on a large tree.
+                    logger.warning(f"Cannot watch {self.docs_dir} for events ({e}); polling instead")
+        await self._collect_polling()
+
+    async def _collect_events(self, watchfiles):
+        logger.info(f"Watching {self.docs_dir} for changes")
+        # watchfiles' own debounce only groups events that arrive together; the
+        # quiet-period logic lives in _deliver so both sources share it.
+        async for changes in watchfiles.awatch(
+            self.docs_dir, stop_event=self._stop, debounce=200, recursive=True
+        ):
+            self._add(path for _, path in changes)
+
+    async def _collect_polling(self):
+        logger.info(f"Polling {self.docs_dir} for changes every {self.poll_interval}s")
+        started = time.monotonic()
+        previous = await asyncio.to_thread(snapshot, self.docs_dir, self.exclude)
+        walk_time = time.monotonic() - started
+        while not self._stop.is_set():
+            try:
+                # Never walking more than half the time, however slow the
+                # filesystem is.
+                await asyncio.wait_for(self._stop.wait(), timeout=max(self.poll_interval, walk_time))
+                return
+            except asyncio.TimeoutError:
+                pass
+            started = time.monotonic()
+            current = await asyncio.to_thread(snapshot, self.docs_dir, self.exclude)
+            walk_time = time.monotonic() - started
+            if walk_time > self.poll_interval:
+                logger.warning(f"Listing {self.docs_dir} took {walk_time:.0f}s, "
+                               f"longer than watch_poll_interval ({self.poll_interval}s)")
+            self._add(diff_snapshots(previous, current))
+            previous = current
+
+    async def _deliver(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.ensure_future(self._stop.wait())
+        try:
+            while not self._stop.is_set():
+                changed = asyncio.ensure_future(self._changed.wait())
+                await asyncio.wait({changed, stop}, return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+                if self._stop.is_set():
+                    return
+                deadline = loop.time() + MAX_BATCH_DELAY_SECONDS
+                # Wait for a quiet period, bounded by the deadline.
+                while True:
+                    self._changed.clear()
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), min(self.debounce, remaining))
+                    except asyncio.TimeoutError:
+                        break
+                batch, self._changes = self._changes, set()
+                if not batch:
+                    continue
+                try:
+                    await self.on_change(batch)
+                except Exception:
+                    logger.exception(f"Updating the index for {len(batch)} changed path(s) failed")
+        finally:
+            stop.cancel()
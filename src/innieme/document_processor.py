@@ -1,20 +1,31 @@
 from .embeddings_factory import EmbeddingsFactory
 from .vector_store_factory import VectorStoreFactory
+from .chunk_dedup import ALSO_IN_KEY, ALSO_IN_SEPARATOR, ChunkDeduplicator
+from .retrieval import (
+    candidates_with_vectors, cosine_relevance, is_faiss, mmr_select, replace_in_store,
+    supports_batched_search,
+)
+from .query_batcher import DEFAULT_BATCH_WINDOW, QueryBatcher
+from .shared_index import SharedIndex
+from .extractors import TextSegment, extractor_for
+from . import metrics, tracing
+from .scan_progress import ProgressEmbeddings, ScanProgress
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-import pypdf
-import docx
 import fnmatch
-import glob
+import functools
 from pydantic import SecretStr
 
-from typing import List, Dict, Optional, Union
-from langchain.embeddings.base import Embeddings
+from dataclasses import dataclass, field
+from typing import Iterable, List, Dict, Optional, Pattern, Set, Tuple
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 
+import asyncio
 import logging
 import os
+import re
 import time
+import hashlib
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +35,47 @@ logger = logging.getLogger(__name__)
 # answering the question.
 DEFAULT_DOCS_EXCLUDE = ["CLAUDE.md"]
 
+# Exclusion patterns ending in one of these name a directory; the scan does not
+# descend into a directory they match.
+_DIRECTORY_PATTERN_SUFFIXES = ("/**", "/*", "/")
+
+
+def _compile_patterns(patterns: List[str]) -> Optional[Pattern]:
+    """One regex matching any of the fnmatch ``patterns``, or None for none."""
+    if not patterns:
+        return None
+    return re.compile("|".join(
+        f"(?:{fnmatch.translate(os.path.normcase(pattern))})" for pattern in patterns
+    ))
+
+
+def _directory_patterns(patterns: List[str]) -> List[str]:
+    """The directory each directory-style pattern names, e.g. "archive" for "archive/*"."""
+    directories = []
+    for pattern in patterns:
+        for suffix in _DIRECTORY_PATTERN_SUFFIXES:
+            if pattern.endswith(suffix) and len(pattern) > len(suffix):
+                directories.append(pattern[:-len(suffix)])
+                break
+    return directories
+
+
+def _file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+@dataclass
+class DocumentListing:
+    """What a walk of ``docs_dir`` found."""
+    files: List[str] = field(default_factory=list)
+    # Readable files that matched ``docs_exclude``.
+    excluded: List[str] = field(default_factory=list)
+    # Directories matched by a directory pattern and never listed.
+    pruned: List[str] = field(default_factory=list)
+
 
 class DocumentProcessor:
     def __init__(self,
@@ -31,7 +83,12 @@ class DocumentProcessor:
                  docs_dir: str,
                  embeddings_factory: EmbeddingsFactory,
                  vector_store_factory: VectorStoreFactory,
-                 docs_exclude: Optional[List[str]] = None):
+                 docs_exclude: Optional[List[str]] = None,
+                 dedup_chunks: bool = False,
+                 mmr_lambda: Optional[float] = None,
+                 mmr_fetch_k: int = 20,
+                 shared_index: Optional[SharedIndex] = None,
+                 query_batch_window: Optional[float] = DEFAULT_BATCH_WINDOW):
         self.docs_dir = docs_dir
         self.topic = topic
         self.embeddings_factory = embeddings_factory
@@ -40,30 +97,84 @@ class DocumentProcessor:
         self.docs_exclude = (
             list(DEFAULT_DOCS_EXCLUDE) if docs_exclude is None else list(docs_exclude)
         )
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        # Compiled once: a scan tests every file, and on large trees a list of
+        # fnmatch calls per file adds up.
+        self._exclude_re = _compile_patterns(self.docs_exclude)
+        self._exclude_dir_re = _compile_patterns(_directory_patterns(self.docs_exclude))
+        # Collapse exact and near-duplicate chunks (a PDF and its exported
+        # Markdown, two versions of a manual) so copies neither cost embeddings
+        # nor crowd distinct content out of the top-k.
+        self.dedup_chunks = dedup_chunks
+        # Maximal-marginal-relevance retrieval, off unless a lambda is set.
+        # Overlapping chunks of one file otherwise tend to fill the whole top-k.
+        self.mmr_lambda = mmr_lambda
+        self.mmr_fetch_k = mmr_fetch_k
+        self.vectorstore: Optional[VectorStore] = None
+        # Bumped whenever the index changes, so anything derived from search
+        # results (cached answers) can tell it is stale.
+        self.index_generation = 0
+        # Chunk ids per source file, so one file's chunks can be replaced
+        # without rebuilding the index (see update_files).
+        self._source_ids: Dict[str, List[str]] = {}
+        # Source -> the other files whose duplicate chunks were merged into its
+        # chunks. Those files lose content if this one changes, so they are
+        # reindexed along with it.
+        self._merged_into: Dict[str, Set[str]] = {}
+        # Sources that are not files (approved summaries; see index_texts).
+        self._text_sources: Set[str] = set()
+        # Serialises full scans and incremental updates of the one store.
+        self._index_lock = asyncio.Lock()
+        # When set, this topic's chunks live in an index shared with other
+        # topics over the same documents, tagged so searches stay in-topic.
+        self.shared_index = shared_index
+        self._shared_tag = shared_index.join(topic) if shared_index is not None else None
+        # Queries arriving within this many seconds of each other are embedded
+        # in one call and searched together. None or 0 searches each alone.
+        self.query_batcher = QueryBatcher(query_batch_window) if query_batch_window else None
+
+    @functools.cached_property
+    def text_splitter(self):
+        # Imported on first use: langchain's splitters load langsmith, most
+        # of a second that a bot should not spend before it has connected.
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        return RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
         )
 
-    def _is_excluded(self, file_path: str) -> bool:
+    def _relative_path(self, path: str) -> str:
+        try:
+            return os.path.relpath(path, self.docs_dir)
+        except ValueError:  # different drive on Windows
+            return os.path.basename(path)
+
+    def _is_excluded(self, file_path: str, relative: Optional[str] = None) -> bool:
         """Whether a scanned file matches an exclusion pattern.
 
         Each pattern is matched against both the file's basename and its path
         relative to ``docs_dir``, so ``CLAUDE.md`` excludes that file at any
         depth while ``archive/*`` excludes a subdirectory.
         """
-        if not self.docs_exclude:
+        if self._exclude_re is None:
             return False
-        basename = os.path.basename(file_path)
-        try:
-            relative = os.path.relpath(file_path, self.docs_dir)
-        except ValueError:  # different drive on Windows
-            relative = basename
-        return any(
-            fnmatch.fnmatch(basename, pattern) or fnmatch.fnmatch(relative, pattern)
-            for pattern in self.docs_exclude
+        if relative is None:
+            relative = self._relative_path(file_path)
+        return bool(
+            self._exclude_re.match(os.path.normcase(os.path.basename(file_path)))
+            or self._exclude_re.match(os.path.normcase(relative))
         )
 
+    def _is_excluded_dir(self, relative: str) -> bool:
+        """Whether everything under a directory is excluded.
+
+        Only directory-style patterns (``archive/*``, ``archive/``) prune, and
+        only on the path relative to ``docs_dir``: any file below a directory
+        matching ``archive`` matches ``archive/*``, so pruning never skips a
+        file the per-file check would have kept.
+        """
+        return bool(self._exclude_dir_re and self._exclude_dir_re.match(os.path.normcase(relative)))
+
     def _create_empty_store(self):
         """Handle the case where no texts are found to vectorize"""
         collection_name = self._get_collection_name()
@@ -79,43 +190,69 @@ class DocumentProcessor:
         timestamp = int(time.time() * 1000)  # Milliseconds since epoch
         return f"{safe_topic}_{timestamp}"
 
-    async def scan_and_vectorize(self) -> str:
-        """Scan all documents in the specified directory and create vector embeddings"""
+    async def scan_and_vectorize(self, progress: Optional[ScanProgress] = None) -> str:
+        """Scan all documents in the specified directory and create vector embeddings.
+
+        ``progress``, when given, is kept up to date as the scan goes, for a
+        caller to report from (see scan_progress.report_every).
+        """
+        async with self._index_lock:
+            started = time.perf_counter()
+            try:
+                response = await self._scan_and_vectorize(progress or ScanProgress(self.topic))
+            except Exception:
+                metrics.SCANS.inc(topic=self.topic, outcome="error")
+                raise
+            metrics.SCANS.inc(topic=self.topic, outcome="ok")
+            metrics.SCAN_SECONDS.observe(time.perf_counter() - started, topic=self.topic)
+            self._report_index_size()
+            return response
+
+    def _report_index_size(self):
+        metrics.INDEXED_FILES.set(len(self._source_ids.keys() - self._text_sources), topic=self.topic)
+        metrics.INDEXED_CHUNKS.set(sum(len(ids) for ids in self._source_ids.values()), topic=self.topic)
+
+    async def _scan_and_vectorize(self, progress: ScanProgress) -> str:
         document_texts = []
         
-        # Get all files with common document extensions
-        found = []
-        for ext in ['*.pdf', '*.docx', '*.txt', '*.md']:
-            found.extend(glob.glob(os.path.join(self.docs_dir, '**', ext), recursive=True))
-
-        files = [f for f in found if not self._is_excluded(f)]
-        excluded = [f for f in found if self._is_excluded(f)]
+        listing = self._find_documents()
+        files = listing.files
+        excluded = listing.excluded
+        sizes = {file_path: _file_size(file_path) for file_path in files}
+        progress.files_total, progress.bytes_total = len(files), sum(sizes.values())
+        progress.begin("extracting")
 
         logger.info(
-            f"For {self.topic}: Found {len(found)}, excluded {len(excluded)}, "
+            f"For {self.topic}: Found {len(files) + len(excluded)}, excluded {len(excluded)}, "
             f"processing {len(files)} under {self.docs_dir}..."
         )
         # Log exclusions explicitly: a file silently missing from the knowledge
         # base is much harder to diagnose than one reported as skipped.
         for file_path in excluded:
             logger.info(f"  - skipped (excluded): {os.path.basename(file_path)}")
+        for directory in listing.pruned:
+            logger.info(f"  - skipped directory (excluded): {self._relative_path(directory)}")
         # Process each file based on its type
         count = 0
         failures = 0
         for file_path in files:
             logger.info(f"  - {file_path}")
-            text = await self._extract_text(file_path)
-            if text is None:
+            chunks = await self._extract_text(file_path)
+            progress.bytes_processed += sizes[file_path]
+            if chunks is None:
                 # _extract_text logs the cause and returns None.
                 logger.error(f"    Text extraction failed for {file_path}")
                 failures += 1
-            elif not text.strip():
+                progress.files_failed += 1
+            elif not chunks:
                 # Readable but empty, which is not a failure: an empty file has
                 # nothing to contribute and should not hold up the rest.
                 logger.warning(f"    No text in {file_path}")
+                progress.files_extracted += 1
             else:
-                document_texts.append({"text": text, "source": file_path})
+                document_texts.append({"chunks": chunks, "source": file_path})
                 count += 1
+                progress.files_extracted += 1
         logger.info(f"Done. Extracted text from {count} documents")
 
         if failures and not count:
@@ -131,11 +268,7 @@ class DocumentProcessor:
                 f"but could not extract text from any of them"
             )
 
-        # Split texts into chunks
-        all_chunks = []
-        for doc in document_texts:
-            chunks = self.text_splitter.split_text(doc["text"])
-            all_chunks.extend([{"text": chunk, "source": doc["source"]} for chunk in chunks])
+        all_chunks, merged = self._build_chunks(document_texts)
         
         # Create vector store
         texts = [chunk["text"] for chunk in all_chunks]
@@ -143,72 +276,348 @@ class DocumentProcessor:
         collection_name = self._get_collection_name()
         
         response = ""
-        if not texts:
+        progress.chunks_total = len(all_chunks)
+        progress.begin("embedding")
+        previous = self.vectorstore
+        if self.shared_index is not None:
+            self.vectorstore = await self.shared_index.replace(self._shared_tag, all_chunks, progress)
+        elif not texts:
             self.vectorstore = self._create_empty_store()
-            response = f"On topic '{self.topic}': no documents found to process"
         else:
-            metadatas = [{"source": chunk["source"]} for chunk in all_chunks]
-            self.vectorstore = self.vector_store_factory.create_from_texts(
+            metadatas = [chunk["metadata"] for chunk in all_chunks]
+            ids = [chunk["id"] for chunk in all_chunks]
+            # Built in a worker thread: the new store is not shared with
+            # anything yet, and the loop stays free to answer from the old one
+            # and to report progress.
+            self.vectorstore = await asyncio.to_thread(
+                self.vector_store_factory.create_from_texts,
                 texts,
-                self.embeddings_factory.create_embeddings(),
+                ProgressEmbeddings(self.embeddings_factory.create_embeddings(), progress),
                 collection_name=collection_name,
-                metadatas=metadatas
+                metadatas=metadatas,
+                ids=ids,
             )
+        if previous is not self.vectorstore and hasattr(previous, "close_mapping"):
+            # A mapped build's files are held open until its store is dropped.
+            previous.close_mapping()
+        self.index_generation += 1
+        progress.finish()
+        logger.info(progress.throughput())
+        self._source_ids, self._merged_into, self._text_sources = {}, {}, set()
+        self._track(all_chunks)
+        if not texts:
+            response = f"On topic '{self.topic}': no documents found to process"
+        else:
             response = f"On topic '{self.topic}': {len(all_chunks)} chunks created from {count} out of {len(files)} references"
-        if excluded:
+            if merged:
+                response += f" ({merged} duplicate chunks merged)"
+        if excluded or listing.pruned:
             # Count only, never names: the channel-facing message is visible to
             # everyone, and a file is often excluded precisely because those
             # readers should not know about it. The names are in the logs, which
             # is where whoever configured the bot will look.
-            plural = "s" if len(excluded) != 1 else ""
-            response += f" ({len(excluded)} file{plural} excluded; see logs)"
+            counts = []
+            if excluded:
+                counts.append(f"{len(excluded)} file{'s' if len(excluded) != 1 else ''}")
+            if listing.pruned:
+                counts.append(f"{len(listing.pruned)} director{'ies' if len(listing.pruned) != 1 else 'y'}")
+            response += f" ({' and '.join(counts)} excluded; see logs)"
         return response
     
-    async def _extract_text(self, file_path):
-        """Extract text from a document file based on its extension"""
-        _, ext = os.path.splitext(file_path)
-        
-        try:
-            if ext.lower() == '.pdf':
-                return await self._extract_from_pdf(file_path)
-            elif ext.lower() == '.docx':
-                return await self._extract_from_docx(file_path)
-            elif ext.lower() == '.txt' or ext.lower() == '.md':
-                return await self._extract_from_txt(file_path)
+    def _build_chunks(self, document_texts: List[Dict]) -> Tuple[List[Dict], int]:
+        """Chunks to store for the extracted documents, each with an id.
+
+        Ids are derived from the source, position and text, so the same
+        documents always produce the same ids; a process loading an index
+        another process built (see FAISSVectorStoreFactory) can then track its
+        chunks as if it had built it.
+
+        Returns the chunks and how many duplicates were merged away.
+        """
+        all_chunks = []
+        merged = 0
+        if self.dedup_chunks:
+            deduplicator = ChunkDeduplicator()
+            for doc in document_texts:
+                for chunk in doc["chunks"]:
+                    deduplicator.add(chunk.text, doc["source"], chunk.metadata)
+            merged = deduplicator.merged
+            for chunk in deduplicator.chunks:
+                metadata = {"source": chunk.source, **chunk.metadata}
+                if chunk.also_in:
+                    metadata[ALSO_IN_KEY] = ALSO_IN_SEPARATOR.join(chunk.also_in)
+                all_chunks.append({"text": chunk.text, "metadata": metadata})
+            if merged:
+                logger.info(f"Merged {merged} duplicate chunks into {len(all_chunks)}")
+        else:
+            for doc in document_texts:
+                all_chunks.extend(
+                    {"text": chunk.text, "metadata": {"source": doc["source"], **chunk.metadata}}
+                    for chunk in doc["chunks"]
+                )
+        positions: Dict[str, int] = {}
+        for chunk in all_chunks:
+            source = chunk["metadata"]["source"]
+            position = positions[source] = positions.get(source, -1) + 1
+            chunk["id"] = hashlib.sha1(
+                f"{source}\0{position}\0{chunk['text']}".encode("utf-8")
+            ).hexdigest()
+        return all_chunks, merged
+
+    def _track(self, chunks: List[Dict]):
+        """Record which source owns each stored chunk."""
+        for chunk in chunks:
+            source = chunk["metadata"]["source"]
+            self._source_ids.setdefault(source, []).append(chunk["id"])
+            also_in = chunk["metadata"].get(ALSO_IN_KEY)
+            if also_in:
+                self._merged_into.setdefault(source, set()).update(also_in.split(ALSO_IN_SEPARATOR))
+
+    def _as_source(self, path: str) -> Optional[str]:
+        """A changed path in the form the scan records sources, or None if outside ``docs_dir``."""
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.docs_dir))
+        if relative == os.curdir or relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+            return None
+        return os.path.join(self.docs_dir, relative)
+
+    def _is_scanned_location(self, source: str) -> bool:
+        """Whether a full scan would look at this path: not hidden, not under a pruned directory."""
+        parts = self._relative_path(source).split(os.sep)
+        if any(part.startswith(".") for part in parts):
+            return False
+        return not any(
+            self._is_excluded_dir(os.path.join(*parts[:depth])) for depth in range(1, len(parts))
+        )
+
+    def _tracked_under(self, source: str) -> List[str]:
+        prefix = source.rstrip(os.sep) + os.sep
+        return [s for s in self._source_ids if s == source or s.startswith(prefix)]
+
+    async def update_files(self, paths: Iterable[str]) -> str:
+        """Bring the index up to date for a set of changed paths.
+
+        Each path may be a created, modified or deleted file or directory.
+        Only the affected files are re-extracted and re-embedded; their old
+        chunks are deleted by id. A file that fails to extract keeps its old
+        chunks, since a file caught mid-write usually reads fine a moment later.
+
+        Duplicates are merged within the update but not against untouched
+        files, so a copy of an existing document is stored twice until the next
+        full scan.
+        """
+        async with self._index_lock:
+            try:
+                response = await self._update_files(paths)
+            except Exception:
+                metrics.INDEX_UPDATES.inc(topic=self.topic, outcome="error")
+                raise
+            metrics.INDEX_UPDATES.inc(topic=self.topic, outcome="ok")
+            self._report_index_size()
+            return response
+
+    async def _update_files(self, paths: Iterable[str]) -> str:
+        if self.vectorstore is None:
+            return f"On topic '{self.topic}': not scanned yet, update ignored"
+        to_index: Set[str] = set()
+        to_remove: Set[str] = set()
+        for path in paths:
+            source = self._as_source(path)
+            if source is None:
+                continue
+            if not self._is_scanned_location(source):
+                to_remove.update(self._tracked_under(source))
+            elif os.path.isdir(source):
+                found = self._find_documents(source).files
+                to_index.update(found)
+                to_remove.update(set(self._tracked_under(source)) - set(found))
+            elif (os.path.isfile(source) and extractor_for(source) is not None
+                    and not self._is_excluded(source)):
+                to_index.add(source)
             else:
-                logger.warning(f"Unsupported file format: {file_path}")
-                return None
+                to_remove.update(self._tracked_under(source))
+        # Files whose duplicates were merged into a changed file's chunks.
+        for source in to_index | to_remove:
+            for other in self._merged_into.get(source, ()):
+                if other not in to_remove and os.path.isfile(other):
+                    to_index.add(other)
+        if not to_index and not to_remove:
+            return f"On topic '{self.topic}': no indexed files changed"
+
+        document_texts = []
+        for file_path in sorted(to_index):
+            chunks = await self._extract_text(file_path)
+            if chunks is None:
+                logger.error(f"    Text extraction failed for {file_path}; keeping its old chunks")
+                continue
+            to_remove.add(file_path)
+            if chunks:
+                document_texts.append({"chunks": chunks, "source": file_path})
+
+        stale_ids = []
+        for source in to_remove:
+            stale_ids.extend(self._source_ids.pop(source, ()))
+            self._merged_into.pop(source, None)
+        all_chunks, _ = self._build_chunks(document_texts)
+        await self._replace_chunks(stale_ids, all_chunks)
+        removed = len(to_remove - {doc["source"] for doc in document_texts})
+        response = (
+            f"On topic '{self.topic}': reindexed {len(document_texts)} file(s) "
+            f"({len(all_chunks)} chunks), removed {removed}"
+        )
+        logger.info(response)
+        return response
+
+    async def _replace_chunks(self, stale_ids: List[str], all_chunks: List[Dict]):
+        """Delete chunks by id and add new ones, in place in the live store."""
+        if self.shared_index is not None:
+            await self.shared_index.update(self._shared_tag, stale_ids, all_chunks)
+            self._track(all_chunks)
+        else:
+            await replace_in_store(
+                self.vectorstore,
+                stale_ids,
+                [chunk["text"] for chunk in all_chunks],
+                [chunk["metadata"] for chunk in all_chunks],
+                [chunk["id"] for chunk in all_chunks],
+            )
+            self._track(all_chunks)
+        self.index_generation += 1
+
+    async def index_texts(self, texts: Dict[str, List[TextSegment]]) -> int:
+        """Add text that is not from a file, such as approved summaries, to the live index.
+
+        ``texts`` maps a source name, which must not be a path under
+        ``docs_dir``, to its segments. Whatever was indexed under a source
+        before is replaced. Only these chunks are embedded; nothing is
+        rebuilt. A full scan forgets them, so callers add them again after
+        one. Returns how many chunks were stored, 0 before the first scan.
+        """
+        async with self._index_lock:
+            if self.vectorstore is None or not texts:
+                return 0
+            document_texts = [
+                {"chunks": [TextSegment(chunk, segment.metadata)
+                            for segment in segments if segment.text.strip()
+                            for chunk in self.text_splitter.split_text(segment.text)],
+                 "source": source}
+                for source, segments in texts.items()
+            ]
+            stale_ids = []
+            for source in texts:
+                stale_ids.extend(self._source_ids.pop(source, ()))
+                self._merged_into.pop(source, None)
+            all_chunks, _ = self._build_chunks(document_texts)
+            await self._replace_chunks(stale_ids, all_chunks)
+            self._text_sources.update(texts)
+            self._report_index_size()
+            return len(all_chunks)
+
+    def is_excluded_path(self, path: str, is_dir: bool) -> bool:
+        """Whether ``docs_exclude`` keeps a path under ``docs_dir`` out of the
+        index; for a directory, whether everything under it is excluded."""
+        relative = self._relative_path(path)
+        if is_dir:
+            return self._is_excluded_dir(relative)
+        return self._is_excluded(path, relative)
+
+    def _find_documents(self, root: Optional[str] = None) -> DocumentListing:
+        """Walk ``docs_dir`` (or a directory under it) once, collecting every
+        file an extractor can read.
+
+        A single ``os.scandir`` walk: each directory is listed once, and the
+        type information comes from the listing itself, so on network
+        filesystems the cost is one round trip per directory rather than a
+        stat per file. Hidden entries (``.git``, ``.cache``) are skipped and
+        excluded directories are pruned before they are listed.
+        """
+        listing = DocumentListing()
+        root = root or self.docs_dir
+        try:
+            root_stat = os.stat(root)
+            visited = {(root_stat.st_dev, root_stat.st_ino)}
+        except OSError:
+            visited = set()
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.warning(f"Cannot list {directory}: {e}")
+                continue
+            subdirectories = []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                relative = self._relative_path(entry.path)
+                if is_dir:
+                    if self._is_excluded_dir(relative):
+                        listing.pruned.append(entry.path)
+                        continue
+                    if entry.is_symlink():
+                        # Only symlinks can form a cycle, so only they pay
+                        # for the stat.
+                        stat = entry.stat()
+                        if (stat.st_dev, stat.st_ino) in visited:
+                            continue
+                        visited.add((stat.st_dev, stat.st_ino))
+                    subdirectories.append(entry.path)
+                elif extractor_for(entry.path) is not None:
+                    if self._is_excluded(entry.path, relative):
+                        listing.excluded.append(entry.path)
+                    else:
+                        listing.files.append(entry.path)
+            # Reversed onto the stack so directories are visited in name order.
+            pending.extend(reversed(subdirectories))
+        return listing
+
+    async def _extract_text(self, file_path) -> Optional[List[TextSegment]]:
+        """Extract a document's text, already split into chunks.
+
+        The extractor yields the document a page or section at a time and each
+        piece is split as it arrives, so the full text of a large file is
+        never held as one string. Each chunk keeps its segment's metadata (page,
+        heading). Returns an empty list for a readable file with no text, and
+        None when the file could not be read.
+        """
+        extractor = extractor_for(file_path)
+        if extractor is None:
+            logger.warning(f"Unsupported file format: {file_path}")
+            return None
+        try:
+            # In a worker thread, so a long scan leaves the loop free.
+            return await asyncio.to_thread(self._split, extractor, file_path)
         except Exception as e:
             logger.error(f"Error extracting text from {file_path}: {str(e)}")
             return None
-    
-    async def _extract_from_pdf(self, file_path):
-        """Extract text from a PDF file"""
-        text = ""
-        with open(file_path, 'rb') as file:
-            reader = pypdf.PdfReader(file)
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                # "or \"\"" because a page with no extractable text is normal (an
-                # image-only scan). pypdf types this as str, but concatenating a
-                # None here would raise, and a raise now counts as an extraction
-                # failure rather than an empty file.
-                text += (page.extract_text() or "") + "\n"
-        return text
-    
-    async def _extract_from_docx(self, file_path):
-        """Extract text from a DOCX file"""
-        doc = docx.Document(file_path)
-        text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        return text
-    
-    async def _extract_from_txt(self, file_path):
-        """Extract text from a TXT file"""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-            text = file.read()
-        return text
-    
-    async def search_documents(self, query, top_k=5, score_threshold=None) -> List:
+
+    def _split(self, extractor, file_path) -> List[TextSegment]:
+        return [
+            TextSegment(chunk, segment.metadata)
+            for segment in extractor(file_path)
+            if segment.text.strip()
+            for chunk in self.text_splitter.split_text(segment.text)
+        ]
+
+    async def embed_query(self, query: str) -> Optional[List[float]]:
+        """The query's embedding, batched with concurrent queries when batching
+        is on, and computed in a worker thread either way. None before the
+        first scan.
+        """
+        if not self.vectorstore:
+            return None
+        if self.query_batcher is not None:
+            return await self.query_batcher.embed(self.vectorstore.embeddings, query)
+        with tracing.span("embed_query"):
+            return await asyncio.to_thread(self.vectorstore.embeddings.embed_query, query)
+
+    async def search_documents(self, query, top_k=5, score_threshold=None, filter=None,
+                               query_vector=None) -> List:
         """Search the vectorstore for relevant document chunks.
 
         Args:
@@ -218,26 +627,116 @@ class DocumentProcessor:
                 chunks scoring below it are dropped, so a query with only a
                 couple of genuinely relevant chunks returns only those instead
                 of padding the context out to ``top_k``.
+            filter: Optional metadata filter applied in the store before
+                ranking, e.g. ``{"section": "Runbook"}`` or ``{"page": 3}``.
+                Only exact matches on one field are portable across stores.
+            query_vector: The query's embedding from ``embed_query``, when the
+                caller already has it, to save embedding the query again.
         """
+        docs = await self._search(query, top_k, score_threshold, filter, query_vector)
+        if self.shared_index is not None:
+            docs = self.shared_index.topic_view(self._shared_tag, docs)
+        return docs
+
+    async def _search(self, query, top_k, score_threshold, filter, query_vector) -> List:
         if not self.vectorstore:
             return []
 
+        if self.mmr_lambda is not None:
+            return await self._search_mmr(query, top_k, score_threshold, filter, query_vector)
+
+        if self.shared_index is not None:
+            filter_kwargs = self.shared_index.search_kwargs(self._shared_tag, top_k, filter)
+        else:
+            # Passed only when set, so stores without filter support are unaffected.
+            filter_kwargs = {"filter": filter} if filter else {}
+
+        if self.query_batcher is not None and supports_batched_search(self.vectorstore):
+            try:
+                scored = await self.query_batcher.search(
+                    self.vectorstore, query, top_k, vector=query_vector, **filter_kwargs
+                )
+            except Exception as e:
+                logger.warning(f"Batched search failed, searching on its own: {e}")
+            else:
+                if score_threshold is None:
+                    return [doc for doc, _ in scored]
+                return self._above_threshold(scored, score_threshold)
+
+        if not is_faiss(self.vectorstore):
+            return await asyncio.to_thread(
+                self._search_alone, query, top_k, score_threshold, filter_kwargs, query_vector
+            )
+        # FAISS is not safe to search while it is being changed, so, like
+        # every change to it, the search stays on the loop; only the query's
+        # embedding is computed off it.
+        if query_vector is None:
+            query_vector = await self.embed_query(query)
+        return self._search_alone(query, top_k, score_threshold, filter_kwargs, query_vector)
+
+    def _search_alone(self, query, top_k, score_threshold, filter_kwargs, query_vector) -> List:
+        """One search with the store's own methods, by ``query_vector`` when
+        there is one."""
+        store = self.vectorstore
         if score_threshold is None:
-            return self.vectorstore.similarity_search(query, k=top_k)
+            if query_vector is not None:
+                return store.similarity_search_by_vector(query_vector, k=top_k, **filter_kwargs)
+            return store.similarity_search(query, k=top_k, **filter_kwargs)
 
         try:
-            scored = self.vectorstore.similarity_search_with_relevance_scores(
-                query, k=top_k
-            )
+            if query_vector is not None and is_faiss(store):
+                relevance = store._select_relevance_score_fn()
+                scored = [
+                    (doc, relevance(distance))
+                    for doc, distance in store.similarity_search_with_score_by_vector(
+                        query_vector, k=top_k, **filter_kwargs
+                    )
+                ]
+            else:
+                scored = store.similarity_search_with_relevance_scores(query, k=top_k, **filter_kwargs)
         except Exception as e:
             # Relevance scoring depends on the store's distance metric; fall
             # back to an unfiltered search rather than answering nothing.
             logger.warning(f"Relevance scoring unavailable, ignoring threshold: {e}")
-            return self.vectorstore.similarity_search(query, k=top_k)
+            return self._search_alone(query, top_k, None, filter_kwargs, query_vector)
+        return self._above_threshold(scored, score_threshold)
 
+    @staticmethod
+    def _above_threshold(scored: List[Tuple], score_threshold: float) -> List:
         kept = [doc for doc, score in scored if score >= score_threshold]
         logger.debug(
             f"Retrieved {len(scored)} chunks, kept {len(kept)} "
             f"at threshold {score_threshold}"
         )
-        return kept
\ No newline at end of file
+        return kept
+
+    async def _search_mmr(self, query, top_k, score_threshold=None, filter=None, query_vector=None) -> List:
+        """Fetch ``mmr_fetch_k`` candidates and pick ``top_k`` diverse ones.
+
+        The threshold applies to each candidate's cosine relevance before
+        selection, so MMR never promotes a chunk that would have been dropped.
+        """
+        if query_vector is None:
+            query_vector = await self.embed_query(query)
+        overfetch = {}
+        if self.shared_index is not None:
+            filter = self.shared_index.search_filter(self._shared_tag, filter)
+            overfetch["overfetch"] = self.shared_index.overfetch(self._shared_tag)
+        search = functools.partial(
+            candidates_with_vectors,
+            self.vectorstore, query_vector, max(self.mmr_fetch_k, top_k), filter, **overfetch
+        )
+        with tracing.span("vector_search", fetch_k=max(self.mmr_fetch_k, top_k)):
+            # As in ``_search``: FAISS on the loop, any other store in a thread.
+            docs, vectors = search() if is_faiss(self.vectorstore) else await asyncio.to_thread(search)
+        if not docs:
+            return []
+        if score_threshold is not None:
+            keep = cosine_relevance(query_vector, vectors) >= score_threshold
+            docs = [doc for doc, kept in zip(docs, keep) if kept]
+            vectors = vectors[keep]
+        picked = mmr_select(query_vector, vectors, top_k, self.mmr_lambda)
+        logger.debug(
+            f"MMR picked {len(picked)} of {len(docs)} candidates at lambda {self.mmr_lambda}"
+        )
+        return [docs[i] for i in picked]
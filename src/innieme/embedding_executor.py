@@ -0,0 +1,333 @@
+"""Concurrent, rate-limit-aware embedding of large batches of chunks.
+
+``BatchedEmbeddings`` wraps another ``Embeddings`` and takes over batching:
+chunks are packed into requests by token count, several requests run at once
+under an adaptive concurrency limit, and rate-limited or transient failures are
+retried with jittered backoff. Vectors are kept as each batch finishes, so when
+a scan does fail, the next attempt only embeds what is still missing.
+"""
+
+import hashlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# OpenAI's embeddings endpoint takes at most 2,048 inputs and 300,000 tokens per
+# request. Batches stay well under the token cap so a single request neither
+# dominates a tokens-per-minute budget nor costs much to retry.
+DEFAULT_MAX_BATCH_TOKENS = 50_000
+DEFAULT_MAX_BATCH_SIZE = 2048
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_RETRY_BASE_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+# A batch slower than this counts as a sign of overload, like a 429.
+DEFAULT_LATENCY_TARGET = 30.0
+
+# Someone is waiting on a query's embedding, so it is retried once, briefly,
+# and then the question fails rather than stalling behind a scan's backoff.
+QUERY_MAX_RETRIES = 1
+QUERY_MAX_RETRY_DELAY = 1.0
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return _status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status == 408 or status >= 500
+    return is_rate_limited(error) or isinstance(error, (ConnectionError, TimeoutError)) or type(
+        error
+    ).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """The server's Retry-After, in seconds, when it sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted by additive increase, multiplicative decrease.
+
+    Every successful batch grows the limit by ``1 / limit`` (about one per
+    round of batches); a rate limit or an over-target latency halves it. A
+    burst of concurrent 429s counts as one signal, not one halving each.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1,
+                 latency_target: Optional[float] = DEFAULT_LATENCY_TARGET,
+                 decrease_cooldown: float = 1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease_cooldown = decrease_cooldown
+        self._limit = float(max(minimum, min(initial, maximum)))
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if self.latency_target is not None and latency > self.latency_target:
+            self.on_overload()
+            return
+        with self._condition:
+            self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def on_overload(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self._limit = max(self.minimum, self._limit / 2)
+            logger.info(f"Embedding concurrency reduced to {int(self._limit)}")
+
+
+class TokenRateLimiter:
+    """Token bucket holding to a tokens-per-minute budget across threads."""
+
+    def __init__(self, tokens_per_minute: int, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        # A request larger than the whole budget waits for a full bucket
+        # rather than forever.
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def _approximate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def token_counter(model_name: str) -> Callable[[str], int]:
+    """Exact counts with tiktoken when it knows the model, else about 4 characters a token."""
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model_name)
+    except Exception:
+        return _approximate_tokens
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeds documents in token-packed batches, concurrently, with retries.
+
+    ``resume_cache`` holds vectors embedded by a call that then failed; pass the
+    same dict to the next instance (the factory does) and the retry skips
+    them. It is emptied whenever a call completes, so it only ever holds the
+    remains of a failed run.
+    """
+
+    def __init__(self,
+                 embeddings: Embeddings,
+                 count_tokens: Callable[[str], int] = _approximate_tokens,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 tokens_per_minute: Optional[int] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 retry_base_delay: float = DEFAULT_RETRY_BASE_DELAY,
+                 latency_target: Optional[float] = DEFAULT_LATENCY_TARGET,
+                 resume_cache: Optional[Dict[str, List[float]]] = None,
+                 cache_namespace: str = "",
+                 sleep: Callable[[float], None] = time.sleep):
+        self.embeddings = embeddings
+        self.count_tokens = count_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        # Start below the ceiling and let successes earn the rest.
+        self.limiter = AdaptiveLimiter(
+            initial=max(1, self.max_concurrency // 2),
+            maximum=self.max_concurrency,
+            latency_target=latency_target,
+        )
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute, sleep=sleep) if tokens_per_minute else None
+        self.resume_cache = resume_cache if resume_cache is not None else {}
+        # Told how many texts each finished batch embedded (see ProgressEmbeddings).
+        self.on_embedded: Optional[Callable[[int], None]] = None
+        self.cache_namespace = cache_namespace
+        self._sleep = sleep
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.cache_namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        # Each distinct text not already embedded, once.
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self.resume_cache and key not in missing:
+                missing[key] = text
+        if self.resume_cache:
+            metrics.EMBEDDING_RESUMED.inc(len(set(keys) & self.resume_cache.keys()))
+        if len(missing) < len(texts):
+            logger.info(f"Embedding {len(missing)} of {len(texts)} chunks "
+                        f"({len(texts) - len(missing)} already embedded)")
+            if self.on_embedded is not None:
+                self.on_embedded(len(texts) - len(missing))
+
+        batches = self._pack(list(missing.items()))
+        if batches:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                    thread_name_prefix="embed") as pool:
+                futures = [pool.submit(self._run_batch, batch) for batch in batches]
+                errors = [f.exception() for f in futures if f.exception() is not None]
+            if errors:
+                logger.error(f"{len(errors)} of {len(batches)} embedding batches failed; "
+                             f"{len(self.resume_cache)} chunks kept for the next attempt")
+                raise errors[0]
+
+        vectors = [self.resume_cache[key] for key in keys]
+        self.resume_cache.clear()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._query(lambda: self.embeddings.embed_query(text))
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Several queries in one request, retried like ``embed_query``.
+
+        Not ``embed_documents``: that path packs, parallelises and keeps
+        ``resume_cache``, which belongs to the scan that may be running.
+        """
+        return self._query(lambda: self.embeddings.embed_documents(texts))
+
+    def _pack(self, items: List[tuple]) -> List[List[tuple]]:
+        """Group (key, text) items into batches under the token and size caps."""
+        batches: List[List[tuple]] = []
+        batch: List[tuple] = []
+        batch_tokens = 0
+        for key, text in items:
+            tokens = self.count_tokens(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens
+                          or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append((key, text, tokens))
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _run_batch(self, batch: List[tuple]):
+        texts = [text for _, text, _ in batch]
+        tokens = sum(t for _, _, t in batch)
+        vectors = self._with_retries(lambda: self.embeddings.embed_documents(texts), tokens)
+        for (key, _, _), vector in zip(batch, vectors):
+            self.resume_cache[key] = vector
+        if self.on_embedded is not None:
+            self.on_embedded(len(batch))
+
+    def _with_retries(self, call: Callable, tokens: int = 0):
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None and tokens:
+                self.rate_limiter.acquire(tokens)
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                if is_rate_limited(e):
+                    self.limiter.on_overload()
+                if attempt == self.max_retries or not is_retryable(e):
+                    metrics.EMBEDDING_REQUESTS.inc(outcome="failed")
+                    raise
+                metrics.EMBEDDING_REQUESTS.inc(outcome="retried")
+                delay = _retry_after(e) or random.uniform(
+                    0, min(MAX_RETRY_DELAY, self.retry_base_delay * 2 ** attempt)
+                )
+                logger.warning(f"Embedding request failed ({type(e).__name__}); "
+                               f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            else:
+                self.limiter.on_success(time.monotonic() - started)
+                metrics.EMBEDDING_REQUESTS.inc(outcome="ok")
+                return result
+            finally:
+                self.limiter.release()
+            # Outside the limiter, so a backing-off request does not hold a slot.
+            self._sleep(delay)
+
+    def _query(self, call: Callable):
+        """A query request: not queued behind a scan's batches for a slot of
+        the limiter, and retried at most ``QUERY_MAX_RETRIES`` times, after
+        no more than ``QUERY_MAX_RETRY_DELAY`` seconds. A rate limit still
+        slows the scan down.
+        """
+        for attempt in range(QUERY_MAX_RETRIES + 1):
+            try:
+                result = call()
+            except Exception as e:
+                if is_rate_limited(e):
+                    self.limiter.on_overload()
+                if attempt == QUERY_MAX_RETRIES or not is_retryable(e):
+                    metrics.EMBEDDING_REQUESTS.inc(outcome="failed")
+                    raise
+                metrics.EMBEDDING_REQUESTS.inc(outcome="retried")
+                delay = min(QUERY_MAX_RETRY_DELAY,
+                            _retry_after(e) or random.uniform(0, self.retry_base_delay))
+                logger.warning(f"Query embedding failed ({type(e).__name__}); retrying in {delay:.1f}s")
+            else:
+                metrics.EMBEDDING_REQUESTS.inc(outcome="ok")
+                return result
+            self._sleep(delay)
@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
 from pydantic import SecretStr
-from langchain.embeddings.base import Embeddings
-from langchain_openai import OpenAIEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+
+from .embedding_executor import (
+    BatchedEmbeddings,
+    DEFAULT_MAX_BATCH_SIZE,
+    DEFAULT_MAX_CONCURRENCY,
+    token_counter,
+)
+from . import onnx_embeddings
+
+from typing import Dict, List, Optional
 
 class EmbeddingsFactory(ABC):
     """Abstract factory interface for creating embeddings"""
@@ -16,14 +24,35 @@ class OpenAIEmbeddingsFactory(EmbeddingsFactory):
     # both weaker on retrieval and five times the price.
     DEFAULT_MODEL = "text-embedding-3-small"
 
-    def __init__(self, api_key: str, model_name: str = DEFAULT_MODEL):
+    def __init__(self, api_key: str, model_name: str = DEFAULT_MODEL,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 tokens_per_minute: Optional[int] = None):
         self.api_key = api_key
         self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        # Vectors from a scan that failed part way, reused by the next one.
+        self._resume_cache: Dict[str, List[float]] = {}
 
     def create_embeddings(self) -> Embeddings:
-        return OpenAIEmbeddings(
+        from langchain_openai import OpenAIEmbeddings
+
+        # Retries and batching are BatchedEmbeddings' job: the client's own
+        # retries would hide the 429s the concurrency limit adapts to, and one
+        # batch should be one request.
+        client = OpenAIEmbeddings(
             api_key=SecretStr(self.api_key),
             model=self.model_name,
+            max_retries=0,
+            chunk_size=DEFAULT_MAX_BATCH_SIZE,
+        )
+        return BatchedEmbeddings(
+            client,
+            count_tokens=token_counter(self.model_name),
+            max_concurrency=self.max_concurrency,
+            tokens_per_minute=self.tokens_per_minute,
+            resume_cache=self._resume_cache,
+            cache_namespace=self.model_name,
         )
 
 class HuggingFaceEmbeddingsFactory(EmbeddingsFactory):
@@ -34,11 +63,52 @@ class HuggingFaceEmbeddingsFactory(EmbeddingsFactory):
         self.cache_dir = cache_dir
 
     def create_embeddings(self) -> Embeddings:
+        # Loads torch and sentence-transformers, seconds of startup that the
+        # other backends should not pay.
+        from langchain_huggingface import HuggingFaceEmbeddings
+
         return HuggingFaceEmbeddings(
             model_name=self.model_name,
             cache_folder=self.cache_dir
         )
 
+
+class OnnxEmbeddingsFactory(EmbeddingsFactory):
+    """Sentence-transformers models exported to ONNX, run with onnxruntime.
+
+    ``model_name`` is a local directory or a Hugging Face Hub repository, and
+    ``model_file`` the export within it; point it at a quantized export for
+    int8 inference. Each model is loaded once per process and shared by
+    every topic and scan that uses it.
+    """
+    DEFAULT_MODEL = onnx_embeddings.DEFAULT_MODEL
+    DEFAULT_MODEL_FILE = onnx_embeddings.DEFAULT_MODEL_FILE
+    _loaded: Dict[tuple, Embeddings] = {}
+
+    def __init__(self, cache_dir: str, model_name: str = DEFAULT_MODEL,
+                 model_file: str = DEFAULT_MODEL_FILE,
+                 threads: Optional[int] = None,
+                 batch_size: int = onnx_embeddings.DEFAULT_BATCH_SIZE):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.model_file = model_file
+        self.threads = threads
+        self.batch_size = batch_size
+
+    def create_embeddings(self) -> Embeddings:
+        key = (self.model_name, self.model_file, self.threads, self.batch_size)
+        if key not in self._loaded:
+            model_dir = onnx_embeddings.resolve_model_dir(
+                self.model_name, self.model_file, self.cache_dir
+            )
+            self._loaded[key] = onnx_embeddings.OnnxEmbeddings(
+                model_dir,
+                model_file=self.model_file,
+                threads=self.threads,
+                batch_size=self.batch_size,
+            )
+        return self._loaded[key]
+
 class ExistingEmbeddingsFactory(EmbeddingsFactory):
     def __init__(self, embeddings: Embeddings):
         self.embeddings = embeddings
@@ -0,0 +1,375 @@
+"""Text extractors, keyed by file extension, or sniffed MIME type for files
+without one.
+
+Each extractor is a generator of ``TextSegment``s -- a page, a section, a block
+of rows -- so a large document is handed to the splitter piece by piece and
+never has to exist as one string. Register a new format with
+``register_extractor``; ``DocumentProcessor`` picks up every registered
+extension without further changes.
+"""
+
+import csv
+import importlib.util
+import os
+import re
+import zipfile
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import docx
+import pypdf
+
+# Text formats with no natural break of their own (plain text, one long
+# Markdown section) are cut into segments of about this size, at a line break,
+# so no single string grows with the file.
+MAX_SEGMENT_CHARS = 64 * 1024
+
+# Rows of a CSV rendered into one segment.
+CSV_ROWS_PER_SEGMENT = 50
+
+# Joins a heading path, e.g. "Operations > Runbook > Restart".
+HEADING_SEPARATOR = " > "
+
+# Markdown ATX headings: "# Title" through "###### Title".
+_MARKDOWN_HEADING_RE = re.compile(r"^[ \t]{0,3}(#{1,6})[ \t]+(.*?)[ \t]*#*[ \t]*$")
+
+# How many leading bytes are read to sniff a file's type.
+_SNIFF_BYTES = 512
+
+
+@dataclass
+class TextSegment:
+    """A piece of a document with its location in it.
+
+    ``metadata`` is carried onto every chunk cut from the segment: ``page`` for
+    PDFs (1-based), ``slide`` for PPTX, ``row`` (first row) for CSV, and
+    ``heading`` (the full heading path) and ``section`` (the top-level heading)
+    for DOCX, Markdown and HTML. Chunks never span segments, so a chunk's page
+    or section is exact.
+    """
+    text: str
+    metadata: Dict[str, Union[str, int]] = field(default_factory=dict)
+
+
+Extractor = Callable[[str], Iterator[TextSegment]]
+
+_EXTRACTORS_BY_EXTENSION: Dict[str, Extractor] = {}
+_EXTRACTORS_BY_MIME_TYPE: Dict[str, Extractor] = {}
+
+
+def register_extractor(extensions: Sequence[str], mime_types: Sequence[str] = ()):
+    """Register a generator function as the extractor for some file types.
+
+    Extensions include the dot and are matched case-insensitively. A later
+    registration for the same extension replaces the earlier one.
+    """
+    def decorator(func: Extractor) -> Extractor:
+        for ext in extensions:
+            _EXTRACTORS_BY_EXTENSION[ext.lower()] = func
+        for mime_type in mime_types:
+            _EXTRACTORS_BY_MIME_TYPE[mime_type] = func
+        return func
+    return decorator
+
+
+def supported_extensions() -> List[str]:
+    return sorted(_EXTRACTORS_BY_EXTENSION)
+
+
+def extractor_for(file_path: str) -> Optional[Extractor]:
+    """The extractor for a file: by its extension, or by sniffing its content
+    if it has none.
+
+    A file with an extension nobody registered is skipped without being
+    opened: the scan calls this for every file it lists, and on a network
+    filesystem a read per file would cost far more than the listing.
+    """
+    _, ext = os.path.splitext(file_path)
+    if ext:
+        return _EXTRACTORS_BY_EXTENSION.get(ext.lower())
+    mime_type = sniff_mime_type(file_path)
+    return _EXTRACTORS_BY_MIME_TYPE.get(mime_type) if mime_type else None
+
+
+def sniff_mime_type(file_path: str) -> Optional[str]:
+    """Best guess at a file's MIME type from its leading bytes.
+
+    Recognises PDF, the Office Open XML containers and HTML by content.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            head = file.read(_SNIFF_BYTES)
+    except OSError:
+        return None
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        return _office_mime_type(file_path)
+    lowered = head.lstrip().lower()
+    if lowered.startswith((b"<!doctype html", b"<html")):
+        return "text/html"
+    return None
+
+
+def _office_mime_type(file_path: str) -> Optional[str]:
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            names = archive.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return None
+    if any(name.startswith("word/") for name in names):
+        return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    if any(name.startswith("ppt/") for name in names):
+        return "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+    return "application/zip"
+
+
+def _heading_metadata(path: List[str]) -> Dict[str, str]:
+    if not path:
+        return {}
+    return {"heading": HEADING_SEPARATOR.join(path), "section": path[0]}
+
+
+class _HeadingPath:
+    """The path of headings enclosing the current position in a document."""
+
+    def __init__(self):
+        self.path: List[str] = []
+        self._levels: List[int] = []
+
+    def enter(self, level: int, title: str):
+        while self._levels and self._levels[-1] >= level:
+            self._levels.pop()
+            self.path.pop()
+        self._levels.append(level)
+        self.path.append(title)
+
+    def metadata(self) -> Dict[str, str]:
+        return _heading_metadata(self.path)
+
+
+class _SegmentBuffer:
+    """Accumulates text and yields it as segments of bounded size."""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._size = 0
+
+    def add(self, text: str, metadata: Dict) -> Iterator[TextSegment]:
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= MAX_SEGMENT_CHARS:
+            yield from self.flush(metadata)
+
+    def flush(self, metadata: Dict) -> Iterator[TextSegment]:
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        if text.strip():
+            yield TextSegment(text, dict(metadata))
+
+
+def split_markdown(lines: Iterable[str]) -> Iterator[TextSegment]:
+    """Split Markdown into one segment per heading, tagged with its heading path."""
+    headings = _HeadingPath()
+    buffer = _SegmentBuffer()
+    in_fence = False
+    for line in lines:
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else _MARKDOWN_HEADING_RE.match(line.rstrip("\r\n"))
+        if match:
+            yield from buffer.flush(headings.metadata())
+            headings.enter(len(match.group(1)), match.group(2))
+        yield from buffer.add(line, headings.metadata())
+    yield from buffer.flush(headings.metadata())
+
+
+def _open_text(file_path: str):
+    return open(file_path, "r", encoding="utf-8", errors="ignore")
+
+
+@register_extractor([".pdf"], ["application/pdf"])
+def extract_pdf(file_path: str) -> Iterator[TextSegment]:
+    """One segment per page"""
+    with open(file_path, "rb") as file:
+        reader = pypdf.PdfReader(file)
+        for page_num, page in enumerate(reader.pages, start=1):
+            # "or \"\"" because a page with no extractable text is normal (an
+            # image-only scan). pypdf types this as str, but a None here would
+            # raise, and a raise counts as an extraction failure rather than an
+            # empty file.
+            yield TextSegment(page.extract_text() or "", {"page": page_num})
+
+
+def _docx_heading_level(paragraph) -> Optional[int]:
+    """The heading level of a DOCX paragraph from its style, or None.
+
+    "Title" counts as level 0 so that it heads everything below it.
+    """
+    style = getattr(paragraph.style, "name", "") or ""
+    if style == "Title":
+        return 0
+    if style.startswith("Heading"):
+        level = style[len("Heading"):].strip()
+        return int(level) if level.isdigit() else 1
+    return None
+
+
+@register_extractor(
+    [".docx"], ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
+)
+def extract_docx(file_path: str) -> Iterator[TextSegment]:
+    """One segment per heading, by paragraph style"""
+    document = docx.Document(file_path)
+    headings = _HeadingPath()
+    buffer = _SegmentBuffer()
+    for paragraph in document.paragraphs:
+        level = _docx_heading_level(paragraph)
+        if level is not None and paragraph.text.strip():
+            yield from buffer.flush(headings.metadata())
+            headings.enter(level, paragraph.text.strip())
+        yield from buffer.add(paragraph.text + "\n", headings.metadata())
+    yield from buffer.flush(headings.metadata())
+
+
+@register_extractor([".md", ".markdown"])
+def extract_markdown(file_path: str) -> Iterator[TextSegment]:
+    """One segment per heading"""
+    with _open_text(file_path) as file:
+        yield from split_markdown(file)
+
+
+@register_extractor([".txt"])
+def extract_txt(file_path: str) -> Iterator[TextSegment]:
+    """Read line by line, in bounded segments"""
+    buffer = _SegmentBuffer()
+    with _open_text(file_path) as file:
+        for line in file:
+            yield from buffer.add(line, {})
+    yield from buffer.flush({})
+
+
+class _HTMLTextParser(HTMLParser):
+    """Collects visible text, cutting a segment at each h1-h6."""
+
+    _SKIPPED = {"script", "style", "noscript", "template", "head"}
+    _BLOCKS = {"p", "div", "br", "li", "tr", "section", "article", "pre", "blockquote", "table"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.segments: List[TextSegment] = []
+        self._headings = _HeadingPath()
+        self._buffer = _SegmentBuffer()
+        self._skip_depth = 0
+        self._heading_level: Optional[int] = None
+        self._heading_text: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIPPED:
+            self._skip_depth += 1
+        elif re.fullmatch(r"h[1-6]", tag):
+            self.segments.extend(self._buffer.flush(self._headings.metadata()))
+            self._heading_level = int(tag[1])
+            self._heading_text = []
+        elif tag in self._BLOCKS:
+            self._add("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIPPED:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif self._heading_level is not None and tag == f"h{self._heading_level}":
+            title = " ".join("".join(self._heading_text).split())
+            if title:
+                self._headings.enter(self._heading_level, title)
+            self._heading_level = None
+            self._add(f"{title}\n")
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._heading_level is not None:
+            self._heading_text.append(data)
+        else:
+            self._add(data)
+
+    def _add(self, text: str):
+        self.segments.extend(self._buffer.add(text, self._headings.metadata()))
+
+    def close(self):
+        super().close()
+        self.segments.extend(self._buffer.flush(self._headings.metadata()))
+
+
+@register_extractor([".html", ".htm"], ["text/html"])
+def extract_html(file_path: str) -> Iterator[TextSegment]:
+    """Visible text, one segment per heading"""
+    parser = _HTMLTextParser()
+    with _open_text(file_path) as file:
+        # Fed in blocks; finished segments are handed on as they complete.
+        for block in iter(lambda: file.read(MAX_SEGMENT_CHARS), ""):
+            parser.feed(block)
+            yield from parser.segments
+            parser.segments.clear()
+    parser.close()
+    yield from parser.segments
+
+
+@register_extractor([".csv"])
+def extract_csv(file_path: str) -> Iterator[TextSegment]:
+    """Rows rendered as "column: value" lines, in blocks of rows.
+
+    Each row carries its column names, so a chunk cut from the middle of the
+    file still says what its values mean.
+    """
+    with open(file_path, "r", encoding="utf-8", errors="ignore", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if not header:
+            return
+        rows: List[str] = []
+        first_row = 2  # 1-based, counting the header as row 1
+        for row_num, row in enumerate(reader, start=2):
+            rows.append("; ".join(
+                f"{name}: {value}" for name, value in zip(header, row) if value.strip()
+            ))
+            if len(rows) == CSV_ROWS_PER_SEGMENT:
+                yield TextSegment("\n".join(rows), {"row": first_row})
+                rows, first_row = [], row_num + 1
+        if rows:
+            yield TextSegment("\n".join(rows), {"row": first_row})
+
+
+def extract_pptx(file_path: str) -> Iterator[TextSegment]:
+    """One segment per slide, speaker notes included"""
+    try:
+        import pptx
+    except ImportError:
+        raise ImportError(
+            "python-pptx is required to read .pptx files; install innieme[pptx]"
+        ) from None
+    presentation = pptx.Presentation(file_path)
+    for slide_num, slide in enumerate(presentation.slides, start=1):
+        texts = [
+            shape.text_frame.text
+            for shape in slide.shapes
+            if shape.has_text_frame and shape.text_frame.text.strip()
+        ]
+        if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+            notes = slide.notes_slide.notes_text_frame.text
+            if notes.strip():
+                texts.append(notes)
+        yield TextSegment("\n".join(texts), {"slide": slide_num})
+
+
+def _register_pptx():
+    # python-pptx is an optional extra. Without it, .pptx files are not picked
+    # up at all, rather than each failing its extraction on every scan.
+    if importlib.util.find_spec("pptx") is not None:
+        register_extractor(
+            [".pptx"], ["application/vnd.openxmlformats-officedocument.presentationml.presentation"]
+        )(extract_pptx)
+
+
+_register_pptx()
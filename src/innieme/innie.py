@@ -1,52 +1,105 @@
-from .embeddings_factory import EmbeddingsFactory, OpenAIEmbeddingsFactory, HuggingFaceEmbeddingsFactory, ExistingEmbeddingsFactory
-from .vector_store_factory import ChromaVectorStoreFactory, FAISSVectorStoreFactory
+from .embeddings_factory import (
+    EmbeddingsFactory,
+    ExistingEmbeddingsFactory,
+    HuggingFaceEmbeddingsFactory,
+    OnnxEmbeddingsFactory,
+    OpenAIEmbeddingsFactory,
+)
+from .vector_store_factory import (
+    ChromaVectorStoreFactory,
+    CompactFAISSVectorStoreFactory,
+    FAISSVectorStoreFactory,
+    VectorStoreFactory,
+)
 from .document_processor import DocumentProcessor
 from .knowledge_manager import KnowledgeManager
 from .conversation_engine import ConversationEngine
+from .thread_histories import ThreadHistories
+from .doc_watcher import DocumentWatcher
+from .shared_index import SharedIndex, shared_index_for
+from .scan_progress import ScanProgress
+from .usage import UsageTracker
+from .answer_cache import AnswerCache, DEFAULT_TTL
 from .discord_bot_config import OutieConfig, TopicConfig
+from . import metrics, tracing
 
-from langchain_community.embeddings import FakeEmbeddings
-
+import logging
 import os
 
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Optional
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
+
 class Topic:
-    def __init__(self, outie_config:OutieConfig, config: TopicConfig):
+    def __init__(self, outie_config:OutieConfig, config: TopicConfig, usage: Optional[UsageTracker] = None):
         self.config = config
         self.outie_config = outie_config
         # Initialize components
+        embeddings_factory = self._create_embeddings_from_config(
+            {
+                "type":outie_config.bot.embedding_model,
+                "api_key": outie_config.bot.embeddings_api_key,
+                "model_name": getattr(outie_config.bot, "embeddings_model_name", None),
+                "cache_dir": self._resolve_cache_dir(outie_config, config),
+                "max_concurrency": getattr(outie_config.bot, "embeddings_max_concurrency", None),
+                "tokens_per_minute": getattr(outie_config.bot, "embeddings_tokens_per_minute", None),
+                "onnx_file": getattr(outie_config.bot, "embeddings_onnx_file", None),
+                "threads": getattr(outie_config.bot, "embeddings_threads", None),
+                "batch_size": getattr(outie_config.bot, "embeddings_batch_size", None),
+            }
+        )
+        vector_store_factory = self._create_vector_store_factory(outie_config.bot)
+        shared_index = None
+        if getattr(outie_config.bot, "shared_index", False):
+            shared_index = self._shared_index(outie_config, config, embeddings_factory, vector_store_factory)
         self.document_processor = DocumentProcessor(
             self.config.name,
             config.docs_dir,
-            self._create_embeddings_from_config(
-                {
-                    "type":outie_config.bot.embedding_model,
-                    "api_key": outie_config.bot.embeddings_api_key,
-                    "model_name": getattr(outie_config.bot, "embeddings_model_name", None),
-                    "cache_dir": self._resolve_cache_dir(outie_config, config)
-                }
-            ),
-            ChromaVectorStoreFactory(),
-#            FAISSVectorStoreFactory()
+            embeddings_factory,
+            vector_store_factory,
             # Per-topic: each docs_dir has its own non-content files to skip.
             docs_exclude=getattr(config, "docs_exclude", None),
+            dedup_chunks=getattr(outie_config.bot, "dedup_chunks", False),
+            mmr_lambda=getattr(config, "mmr_lambda", None),
+            mmr_fetch_k=getattr(config, "mmr_fetch_k", None) or 20,
+            shared_index=shared_index,
+            query_batch_window=getattr(outie_config.bot, "retrieval_batch_window_ms", 5.0) / 1000,
         )
         self.knowledge_manager = KnowledgeManager(
             model=outie_config.bot.llm_model,
             llm_api_key=outie_config.bot.llm_api_key,
+            usage=usage,
+            topic_name=self.config.name,
+            document_processor=self.document_processor,
+            pending_ttl=getattr(outie_config.bot, "pending_summary_ttl_hours", 168.0) * 3600,
+            max_pending=getattr(outie_config.bot, "max_pending_summaries", 500),
         )
         self.active_threads = set()
         self.thread_history: Dict[int, list] = {}
+        # Per-thread PydanticAI message history, only ever appended to, so
+        # each turn resends an unchanged prefix the provider can cache.
+        self.message_history = ThreadHistories()
         self.conversation_engine = ConversationEngine(
             config,
             self.document_processor,
             self.knowledge_manager,
             model=outie_config.bot.llm_model,
             llm_api_key=outie_config.bot.llm_api_key,
+            usage=usage,
+            answer_cache=self._create_answer_cache(config),
         )
+        self.watcher: Optional[DocumentWatcher] = None
+
+    @staticmethod
+    def _create_answer_cache(config: TopicConfig) -> Optional[AnswerCache]:
+        """The topic's answer cache, if it has opted in with a threshold."""
+        threshold = getattr(config, "answer_cache_threshold", None)
+        if threshold is None:
+            return None
+        return AnswerCache(threshold, getattr(config, "answer_cache_ttl", None) or DEFAULT_TTL)
 
     @staticmethod
     def _resolve_cache_dir(outie_config: OutieConfig, config: TopicConfig) -> str:
@@ -61,7 +114,58 @@ class Topic:
             return os.path.expanduser(cache_dir)
         return os.path.join(config.docs_dir, ".cache", "langchain")
 
-    def _create_embeddings_from_config(self, config: Dict[str, str]) -> EmbeddingsFactory:
+    @staticmethod
+    def _docs_root(outie_config: OutieConfig, config: TopicConfig) -> str:
+        """The outermost of the bot's topic ``docs_dir``s that contains this one."""
+        docs_dir = os.path.abspath(config.docs_dir)
+        root = docs_dir
+        for outie in getattr(outie_config.bot, "outies", None) or [outie_config]:
+            for topic in outie.topics:
+                other = os.path.abspath(topic.docs_dir)
+                if len(other) < len(root) and os.path.commonpath([other, docs_dir]) == other:
+                    root = other
+        return root
+
+    @classmethod
+    def _shared_index(cls, outie_config: OutieConfig, config: TopicConfig,
+                      embeddings_factory: EmbeddingsFactory,
+                      vector_store_factory: VectorStoreFactory) -> SharedIndex:
+        """The index this topic shares with the others over the same documents.
+
+        One per embedding model and documents tree: vectors from different
+        models cannot share an index, and unrelated trees have nothing to share.
+        """
+        bot = outie_config.bot
+        root = cls._docs_root(outie_config, config)
+        key = (
+            bot.embedding_model,
+            getattr(bot, "embeddings_model_name", None),
+            getattr(bot, "vector_store", None) or "chroma",
+            root,
+        )
+        name = "shared_" + "".join(c if c.isalnum() else "_" for c in os.path.basename(root))
+        return shared_index_for(
+            key, lambda: SharedIndex(name, embeddings_factory, vector_store_factory)
+        )
+
+    @staticmethod
+    def _create_vector_store_factory(bot_config) -> VectorStoreFactory:
+        store_type = getattr(bot_config, "vector_store", None) or "chroma"
+        if store_type == "chroma":
+            return ChromaVectorStoreFactory()
+        elif store_type == "faiss":
+            index_dir = getattr(bot_config, "vector_index_dir", None)
+            return FAISSVectorStoreFactory(index_dir=os.path.expanduser(index_dir) if index_dir else None)
+        elif store_type == "compact":
+            return CompactFAISSVectorStoreFactory(
+                quantization=getattr(bot_config, "vector_quantization", None) or "sq8",
+                dimensions=getattr(bot_config, "vector_dimensions", None),
+                rescore=getattr(bot_config, "vector_rescore", None),
+            )
+        else:
+            raise ValueError(f"Unsupported vector store: {store_type}")
+
+    def _create_embeddings_from_config(self, config: Dict) -> EmbeddingsFactory:
         embedding_type = config.get("type", "<empty>")
         # An unset model_name means "whatever this backend's default is" — the
         # two backends have different sensible defaults.
@@ -71,13 +175,25 @@ class Topic:
             return OpenAIEmbeddingsFactory(
                 api_key,
                 model_name=model_name or OpenAIEmbeddingsFactory.DEFAULT_MODEL,
+                max_concurrency=config.get("max_concurrency") or 4,
+                tokens_per_minute=config.get("tokens_per_minute"),
             )
         elif embedding_type == "huggingface":
             return HuggingFaceEmbeddingsFactory(
                 cache_dir=config['cache_dir'],
                 model_name=model_name or HuggingFaceEmbeddingsFactory.DEFAULT_MODEL,
             )
+        elif embedding_type == "onnx":
+            return OnnxEmbeddingsFactory(
+                cache_dir=config['cache_dir'],
+                model_name=model_name or OnnxEmbeddingsFactory.DEFAULT_MODEL,
+                model_file=config.get("onnx_file") or OnnxEmbeddingsFactory.DEFAULT_MODEL_FILE,
+                threads=config.get("threads"),
+                batch_size=config.get("batch_size") or 32,
+            )
         elif embedding_type == "fake":
+            from langchain_core.embeddings import FakeEmbeddings
+
             return ExistingEmbeddingsFactory(FakeEmbeddings(size=1536))
         else:
             raise ValueError(f"Unsupported embedding type: {embedding_type}")
@@ -87,11 +203,55 @@ class Topic:
 
     async def process_query(self, thread_id: int, query: str, context_messages: list[dict[str, str]]) -> str:
         self.active_threads.add(thread_id)
+        metrics.ACTIVE_THREADS.set(len(self.active_threads), topic=self.config.name)
         self.thread_history[thread_id] = context_messages
-        return await self.conversation_engine.process_query(query, context_messages)
+        history = self.message_history.get(thread_id)
+        async with history.lock:
+            history.reconcile(context_messages)
+            with tracing.span("process_query", topic=self.config.name):
+                return await self.conversation_engine.process_query(
+                    query, context_messages, message_history=history.messages
+                )
+
+    def describe_clear_answer_cache(self) -> str:
+        """Drop the topic's cached answers, and say what was done, for the outie."""
+        cache = self.conversation_engine.answer_cache
+        if cache is None:
+            return (f"Topic {self.config.name} has no answer cache. "
+                    "Set `answer_cache_threshold` on the topic to turn it on.")
+        return f"Cleared {cache.clear()} cached answer(s) for {self.config.name}."
+
+    async def scan_and_vectorize(self, progress: Optional[ScanProgress] = None) -> str:
+        result = await self.document_processor.scan_and_vectorize(progress)
+        # The scan rebuilt the index from the documents alone.
+        try:
+            await self.knowledge_manager.index_stored_summaries()
+        except Exception as e:
+            # The new index is live already, and the summaries stay stored;
+            # the next scan indexes them.
+            logger.error(f"Could not index stored summaries for topic {self.config.name}: {e}")
+        return result
+
+    def start_watching(self) -> bool:
+        """Start reindexing changed documents in the background, if this topic
+        has ``watch`` on. Call after the first scan. Returns whether it started.
+        """
+        if not getattr(self.config, "watch", False):
+            return False
+        if self.watcher is None:
+            self.watcher = DocumentWatcher(
+                self.config.docs_dir,
+                self.document_processor.update_files,
+                debounce=getattr(self.config, "watch_debounce", None) or 2.0,
+                poll_interval=getattr(self.config, "watch_poll_interval", None) or 300.0,
+                exclude=self.document_processor.is_excluded_path,
+            )
+        self.watcher.start()
+        return True
 
-    async def scan_and_vectorize(self) -> str:
-        return await self.document_processor.scan_and_vectorize()
+    async def stop_watching(self):
+        if self.watcher is not None:
+            await self.watcher.stop()
 
     async def generate_summary(self, thread_id) -> str:
         history = self.thread_history.get(thread_id, [])
@@ -115,7 +275,7 @@ class Topic:
         return await self.knowledge_manager.store_summary(thread_id)
 
 class Innie:
-    def __init__(self, outie_config: OutieConfig):
+    def __init__(self, outie_config: OutieConfig, usage: Optional[UsageTracker] = None):
         """Initialize an Innie instance with configuration"""
         self.outie_config = outie_config
-        self.topics = [Topic(outie_config, topic_config) for topic_config in outie_config.topics]
+        self.topics = [Topic(outie_config, topic_config, usage) for topic_config in outie_config.topics]
@@ -1,35 +1,37 @@
-import json
 import logging
+import time
 
 from datetime import datetime
-from typing import List
-import os
+from typing import AsyncIterator, Dict, List, Optional
 
 from pydantic import BaseModel
 from pydantic_ai import Agent
 
+from .extractors import TextSegment
+from .llm import build_model
+from .summary_store import MAX_PENDING, PAGE_SIZE, PENDING_TTL, PendingSummaries, SummaryStore
+from .usage import UsageTracker, response_cost
+
 logger = logging.getLogger(__name__)
 
 
-def _build_model(model_str: str, api_key: str):
-    """Build a PydanticAI model instance from a model string and API key.
+# Source of an approved summary's chunks in the topic's index, in place of a
+# file path: "summary:<thread id>".
+SUMMARY_SOURCE_PREFIX = "summary:"
+
+
+def summary_source(thread_id) -> str:
+    return f"{SUMMARY_SOURCE_PREFIX}{thread_id}"
 
-    If no api_key is provided, returns the model string as-is and lets
-    pydantic-ai read the key from the appropriate environment variable.
-    """
-    if not api_key or ":" not in model_str:
-        return model_str
-    provider_name, model_name = model_str.split(":", 1)
-    if provider_name == "openai":
-        from pydantic_ai.models.openai import OpenAIChatModel
-        from pydantic_ai.providers.openai import OpenAIProvider
-        return OpenAIChatModel(model_name, provider=OpenAIProvider(api_key=api_key))
-    elif provider_name == "anthropic":
-        from pydantic_ai.models.anthropic import AnthropicModel
-        from pydantic_ai.providers.anthropic import AnthropicProvider
-        return AnthropicModel(model_name, provider=AnthropicProvider(api_key=api_key))
-    # Unknown provider — fall back to string (env var)
-    return model_str
+
+def summary_segments(summary_data: Dict) -> List[TextSegment]:
+    """What of a summary is indexed: the summary and its key points, under its title."""
+    text = summary_data.get("summary", "")
+    key_points = summary_data.get("key_points") or []
+    if key_points:
+        text += "\n\nKey points:\n" + "\n".join(f"- {point}" for point in key_points)
+    title = summary_data.get("suggested_title") or "Approved summary"
+    return [TextSegment(text, {"heading": title})]
 
 
 class SummaryOutput(BaseModel):
@@ -39,14 +41,25 @@ class SummaryOutput(BaseModel):
 
 
 class KnowledgeManager:
-    def __init__(self, model: str = "openai:gpt-5.6-terra", llm_api_key: str = "", summaries_path: str = "./data/summaries"):
+    def __init__(self, model: str = "openai:gpt-5.6-terra", llm_api_key: str = "", summaries_path: str = "./data/summaries",
+                 usage: Optional[UsageTracker] = None, topic_name: str = "",
+                 document_processor=None, pending_ttl: float = PENDING_TTL,
+                 max_pending: int = MAX_PENDING):
         self.summaries_path = summaries_path
-        self.pending_summaries = {}  # Maps thread_id to generated summary data
-
-        os.makedirs(self.summaries_path, exist_ok=True)
+        self.summary_store = SummaryStore(summaries_path)
+        self.model = model
+        # Summaries are counted in the usage of the topic they were made for.
+        self.usage = usage
+        self.topic_name = topic_name
+        # The topic's DocumentProcessor. Approved summaries are added to its
+        # live index, so they inform answers straight away.
+        self.document_processor = document_processor
+        # Generated summaries awaiting /approve, by thread. Persisted, so they
+        # outlive a restart, and dropped after pending_ttl seconds.
+        self.pending_summaries = PendingSummaries(self.summary_store, topic_name, pending_ttl, max_pending)
 
         self.summary_agent = Agent(
-            model=_build_model(model, llm_api_key),
+            model=build_model(model, llm_api_key),
             output_type=SummaryOutput,
             instructions=(
                 "You are a knowledge base curator. Produce concise, accurate "
@@ -56,47 +69,84 @@ class KnowledgeManager:
 
     async def generate_summary(self, thread_id, conversation_text: str) -> SummaryOutput:
         """Generate a structured summary for a conversation thread."""
+        started = time.perf_counter()
         result = await self.summary_agent.run(conversation_text)
+        if self.usage is not None:
+            usage = result.usage()
+            self.usage.record(
+                "summary", self.topic_name, self.model,
+                input_tokens=usage.input_tokens, output_tokens=usage.output_tokens,
+                cache_read_tokens=usage.cache_read_tokens, latency=time.perf_counter() - started,
+                cost=response_cost(result),
+            )
         summary_output: SummaryOutput = result.output
 
-        self.pending_summaries[thread_id] = {
+        await self.pending_summaries.put(thread_id, {
             "summary": summary_output.summary,
             "key_points": summary_output.key_points,
             "suggested_title": summary_output.suggested_title,
+            "topic": self.topic_name,
             "timestamp": datetime.now().isoformat(),
-        }
+        })
 
         return summary_output
 
     async def store_summary(self, thread_id):
-        """Store an approved summary in the knowledge base."""
-        if thread_id not in self.pending_summaries:
-            return False
+        """Store an approved summary in the knowledge base.
 
-        summary_data = self.pending_summaries[thread_id]
-
-        filename = f"summary_{thread_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        file_path = os.path.join(self.summaries_path, filename)
-
-        with open(file_path, "w") as f:
-            json.dump(summary_data, f)
+        False when the thread has no pending summary, or it has expired.
+        """
+        summary_data = await self.pending_summaries.get(thread_id)
+        if summary_data is None:
+            return False
 
-        del self.pending_summaries[thread_id]
+        await self.summary_store.append(thread_id, summary_data)
+        await self.pending_summaries.pop(thread_id)
+        if self.document_processor is not None:
+            try:
+                await self.document_processor.index_texts({summary_source(thread_id): summary_segments(summary_data)})
+            except Exception as e:
+                # Stored all the same; the next scan indexes it.
+                logger.error(f"Could not index summary for thread {thread_id}: {e}")
 
         return True
 
-    async def load_summaries(self):
-        """Load all stored summaries."""
-        summaries = []
-
-        for filename in os.listdir(self.summaries_path):
-            if filename.endswith(".json"):
-                file_path = os.path.join(self.summaries_path, filename)
-                try:
-                    with open(file_path, "r") as f:
-                        summary_data = json.load(f)
-                        summaries.append(summary_data)
-                except Exception as e:
-                    logger.error(f"Error loading summary {filename}: {str(e)}")
-
+    async def index_stored_summaries(self) -> int:
+        """Add this topic's stored summaries to its index, a page at a time.
+
+        For after a full scan, which rebuilds the index from files alone.
+        Returns how many summaries were indexed.
+        """
+        if self.document_processor is None:
+            return 0
+        indexed = 0
+        async for page in self.iter_summaries(topic=self.topic_name):
+            # Oldest first, so a thread's latest summary is the one kept.
+            await self.document_processor.index_texts(
+                {summary_source(s["thread_id"]): summary_segments(s) for s in page}
+            )
+            indexed += len(page)
+        if indexed:
+            logger.info(f"Indexed {indexed} approved summaries for topic {self.topic_name}")
+        return indexed
+
+    def iter_summaries(self, page_size: int = PAGE_SIZE, thread_id=None,
+                       since: Optional[str] = None, topic: Optional[str] = None) -> AsyncIterator[List[Dict]]:
+        """Stored summaries, oldest first, a page at a time (see SummaryStore.pages)."""
+        return self.summary_store.pages(page_size, thread_id=thread_id, since=since, topic=topic)
+
+    async def load_summaries(self, thread_id=None, since: Optional[str] = None,
+                             limit: Optional[int] = None) -> List[Dict]:
+        """Stored summaries, oldest first: all of them, or one thread's, or
+        those since an ISO timestamp, up to ``limit``.
+
+        Reads only the matching rows. For the whole store, prefer
+        ``iter_summaries``, which does not hold it all in memory at once.
+        """
+        summaries: List[Dict] = []
+        page_size = min(limit, PAGE_SIZE) if limit else PAGE_SIZE
+        async for page in self.iter_summaries(page_size, thread_id=thread_id, since=since):
+            summaries.extend(page)
+            if limit and len(summaries) >= limit:
+                return summaries[:limit]
         return summaries
@@ -0,0 +1,119 @@
+"""PydanticAI models, shared across topics.
+
+Every topic has a summary agent and an answering agent. Built separately,
+each would get its own provider and SDK client, so a bot with many topics
+would hold many connection pools and pay a TLS handshake whenever a pool
+had no warm connection to the provider. ``build_model`` instead returns one
+model per (provider, model, API key), and every provider it makes sends its
+requests through one ``httpx.AsyncClient`` whose pool keeps connections
+alive between questions. The client speaks HTTP/2 when the optional ``h2``
+package is installed (``pip install -e '.[http2]'``), so concurrent
+requests to a provider share a single connection.
+
+Providers hold a stand-in for the pool rather than the pool itself, and each
+request is sent through whichever pool is current. So ``close()`` on a bot's
+shutdown does not break the models its agents keep: a restarted bot, even
+one running in a new event loop, gets a fresh pool on its first request.
+"""
+
+import asyncio
+import importlib.util
+import logging
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Matches the OpenAI SDK's own request timeout; answers can take a while.
+TIMEOUT = httpx.Timeout(600, connect=5)
+# Idle connections are kept for a minute, so a steady trickle of questions
+# does not reconnect, and several answers can be generated at once.
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+_models: Dict[Tuple[str, str, str], object] = {}
+# The current pool, and the event loop its connections belong to.
+_pool: Optional[httpx.AsyncClient] = None
+_pool_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _new_pool() -> httpx.AsyncClient:
+    http2 = importlib.util.find_spec("h2") is not None
+    logger.debug(f"LLM connection pool created (HTTP/2 {'on' if http2 else 'off'})")
+    return httpx.AsyncClient(timeout=TIMEOUT, limits=LIMITS, http2=http2)
+
+
+def connection_pool() -> httpx.AsyncClient:
+    """The pool requests are sent through now, opened on first use and
+    again after ``close()`` or in a new event loop."""
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool.is_closed or _pool_loop is not loop:
+        # A pool left by an earlier loop cannot be closed from this one;
+        # its connections went with that loop.
+        _pool, _pool_loop = _new_pool(), loop
+    return _pool
+
+
+class _PooledClient(httpx.AsyncClient):
+    """What providers are given in place of the pool: sends every request
+    through ``connection_pool()``, and is never closed itself."""
+
+    def __init__(self):
+        super().__init__(timeout=TIMEOUT)
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        return await connection_pool().send(request, **kwargs)
+
+    async def aclose(self):
+        pass
+
+
+_client: Optional[_PooledClient] = None
+
+
+def http_client() -> httpx.AsyncClient:
+    """The client every provider ``build_model`` makes is given."""
+    global _client
+    if _client is None:
+        _client = _PooledClient()
+    return _client
+
+
+def build_model(model_str: str, api_key: str):
+    """Build a PydanticAI model instance from a model string and API key.
+
+    If no api_key is provided, returns the model string as-is and lets
+    pydantic-ai read the key from the appropriate environment variable.
+    Calls with the same model string and key share one model instance.
+    """
+    if not api_key or ":" not in model_str:
+        return model_str
+    provider_name, model_name = model_str.split(":", 1)
+    key = (provider_name, model_name, api_key)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    if provider_name == "openai":
+        from pydantic_ai.models.openai import OpenAIChatModel
+        from pydantic_ai.providers.openai import OpenAIProvider
+        model = OpenAIChatModel(model_name, provider=OpenAIProvider(api_key=api_key, http_client=http_client()))
+    elif provider_name == "anthropic":
+        from pydantic_ai.models.anthropic import AnthropicModel
+        from pydantic_ai.providers.anthropic import AnthropicProvider
+        model = AnthropicModel(model_name, provider=AnthropicProvider(api_key=api_key, http_client=http_client()))
+    else:
+        # Unknown provider — fall back to string (env var)
+        return model_str
+    _models[key] = model
+    return model
+
+
+async def close():
+    """Close the connection pool. Models already built keep working; their
+    next request opens a new one."""
+    global _pool, _pool_loop
+    pool, loop = _pool, _pool_loop
+    _pool = _pool_loop = None
+    if pool is not None and loop is asyncio.get_running_loop():
+        await pool.aclose()
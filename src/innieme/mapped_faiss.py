@@ -0,0 +1,333 @@
+"""FAISS indexes built to disk once and memory-mapped by every process.
+
+A built index is a directory holding ``index.faiss`` and ``docstore.sqlite``.
+Loading maps the index file read-only (``IO_FLAG_MMAP_IFC``) and reads
+documents from SQLite on demand, so several bot processes serving the same
+topic share one copy of the vectors in the page cache instead of each holding
+its own in RAM.
+
+Builds are kept per topic, in directories named by a fingerprint of their
+contents, so a process that scans the same documents with the same embeddings
+finds the index another process already built and loads it without embedding
+anything. Each build or load marks its directory as recently used, and all
+but the ``KEEP_BUILDS`` most recently used builds of the topic are deleted.
+
+A build is written to ``<fingerprint>.building-<host>-<pid>`` and renamed into
+place when complete. Pruning never touches such a directory while its
+process is alive, and deletes it once that process has gone or, for a build
+on another host, once it is ``STALE_BUILD_SECONDS`` old.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Union
+
+import faiss
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+# Written last: a directory without it is a build that did not finish.
+READY_FILE = "READY"
+# Builds kept per topic: the current one, and the one before it, which another
+# process may still be serving until its own rescan.
+KEEP_BUILDS = 2
+# Marks a build still being written, followed by "<host>-<pid>".
+BUILDING_MARKER = ".building-"
+# Writing a build takes seconds to minutes (it is embedded before the
+# directory exists), so one untouched for this long was abandoned.
+STALE_BUILD_SECONDS = 3600.0
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Documents in a SQLite table, with their position in the FAISS index.
+
+    Only the documents a search returns are read, so the store costs no
+    memory beyond SQLite's page cache, which is shared like the index.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        uri = f"file:{path}?mode=ro" if read_only else f"file:{path}"
+        # Searches can come from the event loop and from worker threads.
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        if not read_only:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " id TEXT PRIMARY KEY, position INTEGER UNIQUE, text TEXT, metadata TEXT)"
+            )
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, metadata FROM documents WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        self.add_positioned({id_: (None, doc) for id_, doc in texts.items()})
+
+    def add_positioned(self, documents: Dict[str, tuple]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO documents (id, position, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (id_, position, doc.page_content, json.dumps(doc.metadata))
+                    for id_, (position, doc) in documents.items()
+                ],
+            )
+
+    def delete(self, ids: List) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM documents WHERE id = ?", [(i,) for i in ids])
+
+    def all_documents(self) -> Dict[str, Document]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, text, metadata FROM documents").fetchall()
+        return {
+            id_: Document(id=id_, page_content=text, metadata=json.loads(metadata))
+            for id_, text, metadata in rows
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLitePositionMap(Mapping):
+    """``index_to_docstore_id`` read from the docstore table instead of held in a dict."""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self._docstore = docstore
+
+    def _query(self, sql: str, args=()):
+        with self._docstore._lock:
+            return self._docstore._conn.execute(sql, args).fetchall()
+
+    def __getitem__(self, position: int) -> str:
+        rows = self._query("SELECT id FROM documents WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM documents")[0][0]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([row[0] for row in self._query("SELECT position FROM documents ORDER BY position")])
+
+
+class MappedFAISS(FAISS):
+    """A FAISS store whose index is memory-mapped read-only.
+
+    A mapped index cannot change in place (faiss aborts the process if it is
+    asked to), so the first add or delete copies the index and documents into
+    this process's memory and carries on there. Other processes keep sharing
+    the built copy; this one stops saving memory, which is the price of
+    incremental updates (``watch``) on a shared index.
+    """
+
+    def __init__(self, *args, directory: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.directory = directory
+        self.is_mapped = True
+
+    def _make_private(self):
+        if not self.is_mapped:
+            return
+        logger.warning(f"Copying mapped index {self.directory} into memory to modify it")
+        mapped_docstore = self.docstore
+        self.index = faiss.read_index(os.path.join(self.directory, INDEX_FILE))
+        self.index_to_docstore_id = dict(self.index_to_docstore_id.items())
+        self.docstore = InMemoryDocstore(mapped_docstore.all_documents())
+        mapped_docstore.close()
+        self.is_mapped = False
+
+    def close_mapping(self):
+        """Release the build's files, once this store has been replaced."""
+        if self.is_mapped:
+            self.docstore.close()
+
+    def add_texts(self, *args, **kwargs):
+        self._make_private()
+        return super().add_texts(*args, **kwargs)
+
+    async def aadd_texts(self, *args, **kwargs):
+        self._make_private()
+        return await super().aadd_texts(*args, **kwargs)
+
+    def add_embeddings(self, *args, **kwargs):
+        self._make_private()
+        return super().add_embeddings(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._make_private()
+        return super().delete(*args, **kwargs)
+
+    def merge_from(self, *args, **kwargs):
+        self._make_private()
+        return super().merge_from(*args, **kwargs)
+
+
+def _embeddings_identity(embeddings: Embeddings) -> str:
+    """Class and model of an embeddings object, through any wrappers.
+
+    ``ProgressEmbeddings`` is skipped: it counts vectors without changing them.
+    """
+    from .scan_progress import ProgressEmbeddings
+
+    parts = []
+    current = embeddings
+    while current is not None and len(parts) < 5:
+        if isinstance(current, ProgressEmbeddings):
+            current = current.embeddings
+            continue
+        attrs = [
+            f"{name}={getattr(current, name)}"
+            for name in ("model", "model_name", "dimensions", "size")
+            if isinstance(getattr(current, name, None), (str, int))
+        ]
+        parts.append(f"{type(current).__name__}({','.join(attrs)})")
+        current = getattr(current, "embeddings", None)
+    return "/".join(parts)
+
+
+def fingerprint(texts: List[str], metadatas: Optional[List[Dict]], ids: Optional[List[str]],
+                embeddings: Embeddings) -> str:
+    digest = hashlib.sha256(_embeddings_identity(embeddings).encode("utf-8"))
+    for i, text in enumerate(texts):
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        digest.update(json.dumps(metadatas[i] if metadatas else None, sort_keys=True).encode("utf-8"))
+        digest.update((ids[i] if ids else "").encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def write_store(store: FAISS, directory: str):
+    """Write an in-memory FAISS store as a mappable directory."""
+    os.makedirs(directory, exist_ok=True)
+    faiss.write_index(store.index, os.path.join(directory, INDEX_FILE))
+    docstore = SQLiteDocstore(os.path.join(directory, DOCSTORE_FILE))
+    docstore.add_positioned({
+        id_: (position, store.docstore.search(id_))
+        for position, id_ in store.index_to_docstore_id.items()
+    })
+    docstore.close()
+    with open(os.path.join(directory, READY_FILE), "w") as marker:
+        marker.write(str(store.index.ntotal))
+
+
+def load_mapped_store(directory: str, embeddings: Embeddings, **kwargs) -> MappedFAISS:
+    index = faiss.read_index(
+        os.path.join(directory, INDEX_FILE), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    )
+    docstore = SQLiteDocstore(os.path.join(directory, DOCSTORE_FILE), read_only=True)
+    return MappedFAISS(
+        embeddings, index, docstore, SQLitePositionMap(docstore), directory=directory, **kwargs
+    )
+
+
+def _building_name() -> str:
+    return f"{BUILDING_MARKER}{socket.gethostname()}-{os.getpid()}"
+
+
+def _is_abandoned(path: str) -> bool:
+    """Whether the process writing the build at ``path`` is gone."""
+    try:
+        if time.time() - os.path.getmtime(path) > STALE_BUILD_SECONDS:
+            return True
+    except OSError:  # renamed into place or deleted meanwhile
+        return False
+    host, _, pid = path.rpartition(BUILDING_MARKER)[2].rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:  # alive, under another user
+        return False
+    return False
+
+
+def prune_builds(topic_dir: str, current: str, keep: int = KEEP_BUILDS):
+    """Delete all but the ``keep`` most recently used finished builds in
+    ``topic_dir``, always keeping ``current``, and builds whose process
+    died before finishing them."""
+    builds = []
+    for name in os.listdir(topic_dir):
+        path = os.path.join(topic_dir, name)
+        if BUILDING_MARKER in name:
+            if _is_abandoned(path):
+                logger.info(f"Deleting abandoned index build {path}")
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        ready = os.path.join(path, READY_FILE)
+        if path == current or not os.path.exists(ready):
+            continue
+        try:
+            builds.append((os.path.getmtime(ready), path))
+        except OSError:  # deleted by another process meanwhile
+            continue
+    builds.sort(reverse=True)
+    for _, path in builds[max(0, keep - 1):]:
+        logger.info(f"Deleting old index build {path}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _mark_used(directory: str):
+    try:
+        os.utime(os.path.join(directory, READY_FILE))
+    except OSError:
+        pass
+
+
+def build_or_load(index_dir: str, texts: List[str], embeddings: Embeddings,
+                  metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None, name: str = "") -> MappedFAISS:
+    """Load the built index for these chunks, building it first if no process has.
+
+    ``name`` (the topic) groups builds into a subdirectory, so pruning one
+    topic's old builds never touches another's.
+    """
+    topic_dir = os.path.join(index_dir, name) if name else index_dir
+    directory = os.path.join(topic_dir, fingerprint(texts, metadatas, ids, embeddings))
+    if os.path.exists(os.path.join(directory, READY_FILE)):
+        logger.info(f"Loading built index {directory}")
+        store = load_mapped_store(directory, embeddings)
+        _mark_used(directory)
+        prune_builds(topic_dir, directory)
+        return store
+
+    store = FAISS.from_texts(texts, embeddings, metadatas=metadatas, ids=ids)
+    building = directory + _building_name()
+    shutil.rmtree(building, ignore_errors=True)
+    write_store(store, building)
+    try:
+        os.rename(building, directory)
+        logger.info(f"Built index {directory}")
+    except OSError:
+        shutil.rmtree(building, ignore_errors=True)
+        if not os.path.exists(os.path.join(directory, READY_FILE)):
+            raise
+        # Another process finished the same build first; use theirs.
+    store = load_mapped_store(directory, embeddings)
+    _mark_used(directory)
+    prune_builds(topic_dir, directory)
+    return store
@@ -0,0 +1,247 @@
+"""Process metrics in the Prometheus text format.
+
+A small, dependency-free registry of counters, gauges and histograms, and an
+HTTP endpoint that serves them for Prometheus (or anything that reads its
+text format) to scrape:
+
+    innieme slack --metrics-port 9464
+    curl localhost:9464/metrics
+
+Metrics are off until ``serve()`` (or ``enable()``) is called. Until then
+every ``inc``, ``set`` and ``observe`` returns after one flag check, so the
+instrumented code costs next to nothing in a process nobody scrapes.
+
+All the metrics are declared here, so this module is also their catalogue.
+"""
+
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Prometheus client defaults, plus a few longer ones for LLM calls and scans.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        super().__init__(name, documentation, labels, registry)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["Registry"] = None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: a count per bucket (not cumulative), the sum and the count.
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], [0.0]))
+        return sum(counts)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Requests, from the platform bots (see tracing.request).
+REQUESTS = Counter("innieme_requests_total", "Questions handled, by platform, topic and outcome",
+                   ["platform", "topic", "outcome"])
+REQUEST_SECONDS = Histogram("innieme_request_seconds", "Time to answer a question, end to end",
+                            ["platform"])
+STAGE_SECONDS = Histogram("innieme_stage_seconds",
+                          "Time in each stage of answering (see tracing.span)", ["stage"])
+# Topics.
+ACTIVE_THREADS = Gauge("innieme_active_threads", "Threads each topic is following", ["topic"])
+# The conversation engine.
+LLM_REQUESTS = Counter("innieme_llm_requests_total", "LLM calls, by topic and outcome",
+                       ["topic", "outcome"])
+LLM_TOKENS = Counter("innieme_llm_tokens_total", "LLM tokens used, by topic and kind",
+                     ["topic", "kind"])
+ANSWER_CACHE = Counter("innieme_answer_cache_total",
+                       "First questions looked up in the answer cache, by topic and outcome (hit, miss)",
+                       ["topic", "outcome"])
+RETRIEVED_CHUNKS = Histogram("innieme_retrieved_chunks", "Document chunks sent with each question",
+                             ["topic"], buckets=(0, 1, 2, 3, 5, 8, 13, 20))
+# The document processor.
+SCANS = Counter("innieme_scans_total", "Full scans of a topic's documents, by outcome",
+                ["topic", "outcome"])
+SCAN_SECONDS = Histogram("innieme_scan_seconds", "Time to scan and index a topic's documents",
+                         ["topic"], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+INDEX_UPDATES = Counter("innieme_index_updates_total",
+                        "Incremental reindexes of changed files, by outcome", ["topic", "outcome"])
+INDEXED_FILES = Gauge("innieme_indexed_files", "Files in each topic's index", ["topic"])
+INDEXED_CHUNKS = Gauge("innieme_indexed_chunks", "Chunks in each topic's index", ["topic"])
+# Query batching.
+PENDING_QUERIES = Gauge("innieme_pending_queries", "Queries waiting for their batch to run")
+QUERY_BATCH_SIZE = Histogram("innieme_query_batch_size", "Queries run together in one batch",
+                             buckets=(1, 2, 4, 8, 16, 32, 64))
+# Embeddings.
+EMBEDDING_REQUESTS = Counter("innieme_embedding_requests_total",
+                             "Embedding provider calls, by outcome (ok, retried, failed)",
+                             ["outcome"])
+EMBEDDING_RESUMED = Counter("innieme_embedding_resumed_total",
+                            "Chunks a scan reused from an earlier, failed attempt instead of embedding")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"metrics: {format % args}")
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Enable metrics and serve them on ``host:port`` from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    enable()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,193 @@
+"""Micro-batching of concurrent retrieval queries.
+
+When several questions arrive together, each one would otherwise embed its
+query with its own provider call (or model forward pass) and search the index
+on its own. ``QueryBatcher`` holds each query for a few milliseconds, then
+embeds everything that arrived in one call and searches each store once with
+a matrix of query vectors, and hands every caller its own results.
+
+Embedding runs in a worker thread, so the event loop keeps serving (and
+collecting the next batch) while the provider answers. FAISS searches stay on
+the event loop, like every change to a FAISS store, so they never overlap an
+update; Chroma takes concurrent access, so its searches run in a worker
+thread too.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.documents import Document
+
+from . import metrics, tracing
+from .retrieval import is_faiss, search_by_vectors
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WINDOW = 0.005
+DEFAULT_MAX_BATCH_SIZE = 32
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Embed several queries in one call.
+
+    Uses the embeddings' own ``embed_queries`` when it has one (wrappers that
+    treat queries differently from documents do), and ``embed_documents``
+    otherwise, which for the supported backends is the same model call that
+    ``embed_query`` makes for one text.
+    """
+    batch_embed = getattr(embeddings, "embed_queries", None)
+    if batch_embed is not None:
+        return batch_embed(texts)
+    if len(texts) == 1:
+        return [embeddings.embed_query(texts[0])]
+    return embeddings.embed_documents(texts)
+
+
+def _resolve(future: asyncio.Future, result=None, error: Optional[BaseException] = None):
+    # A caller that gave up (a cancelled handler) has already resolved it.
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+@dataclass
+class _Request:
+    embeddings: Embeddings
+    text: str
+    future: asyncio.Future
+    # Only set for searches; a bare embedding request stops at the vector.
+    store: Optional[VectorStore] = None
+    k: int = 0
+    filter: Optional[Dict] = None
+    fetch_k: Optional[int] = None
+    vector: Optional[List[float]] = field(default=None, repr=False)
+    # (start, end) in time.time_ns(), reported to the caller's trace.
+    embedded: Optional[Tuple[int, int]] = None
+    searched: Optional[Tuple[int, int]] = None
+    batch_size: int = 1
+
+
+class QueryBatcher:
+    def __init__(self,
+                 window: float = DEFAULT_BATCH_WINDOW,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        self.window = window
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: List[_Request] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks.
+        self._running: Set[asyncio.Task] = set()
+
+    async def embed(self, embeddings: Embeddings, text: str) -> List[float]:
+        """A query's embedding, computed together with any others arriving now."""
+        return await self._submit(_Request(embeddings, text, self._future()))
+
+    async def search(self, store: VectorStore, query: str, k: int,
+                     filter: Optional[Dict] = None,
+                     fetch_k: Optional[int] = None,
+                     vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """The ``k`` nearest chunks to ``query`` with relevance scores, like
+        ``similarity_search_with_relevance_scores``, batched with concurrent searches.
+        ``vector`` is the query's embedding, when the caller already has it.
+        """
+        return await self._submit(
+            _Request(store.embeddings, query, self._future(), store, k, filter, fetch_k, vector)
+        )
+
+    @staticmethod
+    def _future() -> asyncio.Future:
+        return asyncio.get_running_loop().create_future()
+
+    async def _submit(self, request: _Request):
+        self._pending.append(request)
+        metrics.PENDING_QUERIES.inc()
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_now()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+        try:
+            return await request.future
+        finally:
+            # The batch ran in its own task; its timings belong to this caller.
+            if request.embedded:
+                tracing.record("embed_query", *request.embedded, batch_size=request.batch_size)
+            if request.searched:
+                tracing.record("vector_search", *request.searched)
+
+    def _flush_now(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            metrics.PENDING_QUERIES.dec(len(batch))
+            metrics.QUERY_BATCH_SIZE.observe(len(batch))
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[_Request]):
+        try:
+            await self._embed(batch)
+            await self._search([r for r in batch if r.store is not None and r.vector is not None])
+        except Exception as e:
+            for request in batch:
+                _resolve(request.future, error=e)
+        for request in batch:
+            if request.store is None:
+                _resolve(request.future, request.vector)
+
+    async def _embed(self, batch: List[_Request]):
+        by_embeddings: Dict[int, List[_Request]] = {}
+        for request in batch:
+            if request.vector is not None:
+                continue
+            by_embeddings.setdefault(id(request.embeddings), []).append(request)
+        for requests in by_embeddings.values():
+            texts = list(dict.fromkeys(r.text for r in requests))
+            started = time.time_ns()
+            try:
+                vectors = await asyncio.to_thread(embed_queries, requests[0].embeddings, texts)
+            except Exception as e:
+                for request in requests:
+                    _resolve(request.future, error=e)
+                continue
+            embedded = (started, time.time_ns())
+            by_text = dict(zip(texts, vectors))
+            for request in requests:
+                request.vector = by_text[request.text]
+                request.embedded, request.batch_size = embedded, len(texts)
+        if len(batch) > 1:
+            logger.debug(f"Embedded {len(batch)} queries in {len(by_embeddings)} call(s)")
+
+    async def _search(self, requests: List[_Request]):
+        groups: Dict[tuple, List[_Request]] = {}
+        for request in requests:
+            key = (id(request.store), json.dumps(request.filter, sort_keys=True), request.fetch_k)
+            groups.setdefault(key, []).append(request)
+        for group in groups.values():
+            k = max(r.k for r in group)
+            started = time.time_ns()
+            args = (group[0].store, [r.vector for r in group], k, group[0].filter, group[0].fetch_k)
+            try:
+                if is_faiss(group[0].store):
+                    results = search_by_vectors(*args)
+                else:
+                    results = await asyncio.to_thread(search_by_vectors, *args)
+            except Exception as e:
+                for request in group:
+                    _resolve(request.future, error=e)
+                continue
+            searched = (started, time.time_ns())
+            for request, result in zip(group, results):
+                request.searched = searched
+                _resolve(request.future, result[:request.k])
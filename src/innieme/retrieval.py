@@ -0,0 +1,236 @@
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.documents import Document
+
+import numpy as np
+
+from typing import Dict, List, Optional, Tuple
+
+import asyncio
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def _is_instance(store: VectorStore, module: str, name: str) -> bool:
+    # A store of a backend's class can only exist once its module is loaded,
+    # so checking needs no import, and never pulls in a backend the bot
+    # does not use.
+    cls = getattr(sys.modules.get(module), name, None)
+    return cls is not None and isinstance(store, cls)
+
+
+def is_chroma(store: VectorStore) -> bool:
+    return _is_instance(store, "langchain_chroma.vectorstores", "Chroma")
+
+
+def is_faiss(store: VectorStore) -> bool:
+    return _is_instance(store, "langchain_community.vectorstores.faiss", "FAISS")
+
+
+async def replace_in_store(
+    store: VectorStore, stale_ids: List[str], texts: List[str], metadatas: List[Dict], ids: List[str],
+    embeddings: Optional[Embeddings] = None,
+):
+    """Delete ``stale_ids`` from a live store and add ``texts``, without
+    embedding them on the event loop.
+
+    The texts are embedded in a worker thread, with ``embeddings`` (default
+    the store's), before anything is deleted, so the old chunks answer until
+    the new ones are in. FAISS is not safe to change while a search runs, so
+    its index is then changed on the loop, where it is searched. Chroma takes
+    concurrent writes, so its update runs in the worker thread too, as does
+    the whole of an update to any other store, with the store's own embeddings.
+    """
+    embeddings = embeddings or store.embeddings
+    if is_faiss(store):
+        vectors = await asyncio.to_thread(embeddings.embed_documents, texts) if texts else []
+        if stale_ids:
+            store.delete(ids=stale_ids)
+        if texts:
+            store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        return
+
+    def update():
+        if not is_chroma(store):
+            if stale_ids:
+                store.delete(ids=stale_ids)
+            if texts:
+                store.add_texts(texts, metadatas=metadatas, ids=ids)
+            return
+        vectors = embeddings.embed_documents(texts) if texts else []
+        if stale_ids:
+            store.delete(ids=stale_ids)
+        if texts:
+            store._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+    await asyncio.to_thread(update)
+
+
+def mmr_select(query_vector, candidate_vectors, k: int, lambda_mult: float) -> List[int]:
+    """Pick ``k`` candidates by maximal marginal relevance.
+
+    Each step takes the candidate with the best trade-off between similarity
+    to the query and dissimilarity to what has already been picked:
+    ``lambda_mult * relevance - (1 - lambda_mult) * redundancy``. 1.0 is plain
+    relevance ranking, 0.0 is maximum diversity.
+
+    The pairwise similarities are one matrix product up front, and each step
+    updates every candidate's redundancy with one vectorised ``maximum``, so a
+    selection costs O(k * n) array work rather than a Python loop over pairs.
+
+    Returns indices into ``candidate_vectors``, in selection order.
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if candidates.ndim != 2 or not len(candidates) or k < 1:
+        return []
+    query = np.asarray(query_vector, dtype=np.float32)
+    candidates = _normalise_rows(candidates)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected: List[int] = []
+    for _ in range(min(k, len(candidates))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return selected
+
+
+def cosine_relevance(query_vector, candidate_vectors) -> np.ndarray:
+    """Cosine similarity of each candidate to the query."""
+    candidates = _normalise_rows(np.asarray(candidate_vectors, dtype=np.float32))
+    query = np.asarray(query_vector, dtype=np.float32)
+    return candidates @ (query / (np.linalg.norm(query) or 1.0))
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def candidates_with_vectors(
+    store: VectorStore, query_vector: List[float], fetch_k: int, filter: Optional[Dict] = None,
+    overfetch: int = 4,
+) -> Tuple[List[Document], np.ndarray]:
+    """The ``fetch_k`` nearest chunks and their stored embedding vectors.
+
+    MMR needs the candidates' vectors, which the generic VectorStore interface
+    does not return. Chroma and FAISS both keep them, so they are read back
+    from the store; re-embedding the candidates instead would cost an
+    embedding call per query. Any other store falls back to doing exactly
+    that. ``filter`` is a metadata filter in the store's own syntax; exact
+    matches and ``$and`` work in both. ``overfetch`` is how many times
+    ``fetch_k`` FAISS searches before filtering.
+    """
+    if is_chroma(store):
+        result = store._collection.query(
+            query_embeddings=[query_vector],
+            n_results=fetch_k,
+            where=filter or None,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        docs = [
+            Document(page_content=text or "", metadata=metadata or {})
+            for text, metadata in zip(result["documents"][0], result["metadatas"][0])
+        ]
+        return docs, np.asarray(result["embeddings"][0], dtype=np.float32).reshape(len(docs), -1)
+
+    if is_faiss(store):
+        query = np.asarray([query_vector], dtype=np.float32)
+        if store._normalize_L2:
+            query = _normalise_rows(query)
+        # FAISS cannot filter inside the index, so over-fetch and filter after,
+        # as langchain's own FAISS wrapper does.
+        _, ids = store.index.search(
+            query, min(fetch_k * (overfetch if filter else 1), store.index.ntotal)
+        )
+        positions = [int(i) for i in ids[0] if i != -1]
+        docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in positions]
+        if filter:
+            matches = store._create_filter_func(filter)
+            matching = [
+                (i, doc) for i, doc in zip(positions, docs) if matches(doc.metadata)
+            ][:fetch_k]
+            positions = [i for i, _ in matching]
+            docs = [doc for _, doc in matching]
+        if not positions:
+            return [], np.empty((0, len(query_vector)), dtype=np.float32)
+        vectors = np.vstack([store.index.reconstruct(i) for i in positions])
+        return docs, vectors.astype(np.float32)
+
+    logger.debug(f"{type(store).__name__} does not expose vectors; re-embedding MMR candidates")
+    filter_kwargs = {"filter": filter} if filter else {}
+    docs = store.similarity_search_by_vector(query_vector, k=fetch_k, **filter_kwargs)
+    vectors = store.embeddings.embed_documents([d.page_content for d in docs]) if docs else []
+    return docs, np.asarray(vectors, dtype=np.float32).reshape(len(docs), -1)
+
+
+def supports_batched_search(store: VectorStore) -> bool:
+    """Whether ``search_by_vectors`` can search this store in one call."""
+    return is_chroma(store) or is_faiss(store)
+
+
+def search_by_vectors(
+    store: VectorStore, query_vectors: List[List[float]], k: int, filter: Optional[Dict] = None,
+    fetch_k: Optional[int] = None,
+) -> List[List[Tuple[Document, float]]]:
+    """The ``k`` nearest chunks to each query vector, with relevance scores.
+
+    One index search for all the queries: a single Chroma ``query`` with
+    several embeddings, or a single FAISS ``search`` over a query matrix, in
+    place of one call per query. Scores are the store's own relevance scores,
+    the same numbers ``similarity_search_with_relevance_scores`` returns.
+    ``fetch_k`` is how many FAISS searches before filtering (default 20), as
+    in langchain's FAISS wrapper.
+    """
+    relevance = store._select_relevance_score_fn()
+    if is_chroma(store):
+        result = store._collection.query(
+            query_embeddings=query_vectors,
+            n_results=k,
+            where=filter or None,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            [
+                (Document(page_content=text or "", metadata=metadata or {}), relevance(distance))
+                for text, metadata, distance in zip(texts, metadatas, distances)
+            ]
+            for texts, metadatas, distances in zip(
+                result["documents"], result["metadatas"], result["distances"]
+            )
+        ]
+
+    if not is_faiss(store):
+        raise TypeError(f"{type(store).__name__} has no batched search")
+    if store.index.ntotal == 0:
+        return [[] for _ in query_vectors]
+    queries = np.asarray(query_vectors, dtype=np.float32)
+    if store._normalize_L2:
+        queries = _normalise_rows(queries)
+    n = k if not filter else max(fetch_k or 20, k)
+    distances, ids = store.index.search(queries, min(n, store.index.ntotal))
+    matches = store._create_filter_func(filter) if filter else None
+    results = []
+    for row_distances, row_ids in zip(distances, ids):
+        row = []
+        for distance, i in zip(row_distances, row_ids):
+            if i == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[int(i)])
+            if isinstance(doc, str):  # the docstore's "not found" message
+                continue
+            if matches is None or matches(doc.metadata):
+                row.append((doc, relevance(float(distance))))
+                if len(row) == k:
+                    break
+        results.append(row)
+    return results
@@ -0,0 +1,214 @@
+"""Progress of a document scan, for status messages and throughput logs.
+
+``DocumentProcessor.scan_and_vectorize`` fills in a ``ScanProgress`` as it
+goes: files and bytes as they are extracted, chunks as they are embedded.
+Extraction and the index build run in worker threads, so the event loop
+stays free for a bot to read the progress on a timer (``report_every``) and
+edit one status message, rather than posting once per file.
+"""
+
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Texts per embed_documents call when embedding with progress, for backends
+# that do not report their own batches. Large enough that the extra calls
+# cost nothing next to the model.
+PROGRESS_SLICE = 256
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 90:
+        return f"{max(1, round(seconds))}s"
+    if seconds < 90 * 60:
+        return f"{round(seconds / 60)} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+@dataclass
+class ScanProgress:
+    topic: str
+    # "discovering", "extracting", "embedding", "indexing", then "done".
+    stage: str = "discovering"
+    files_total: int = 0
+    files_extracted: int = 0
+    files_failed: int = 0
+    bytes_total: int = 0
+    bytes_processed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    started: float = field(default_factory=time.monotonic)
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    _stage_started: float = field(default_factory=time.monotonic, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def begin(self, stage: str):
+        now = time.monotonic()
+        self.stage_seconds[self.stage] = self.stage_seconds.get(self.stage, 0.0) + now - self._stage_started
+        self.stage, self._stage_started = stage, now
+
+    def finish(self):
+        self.begin("done")
+
+    def add_embedded(self, count: int):
+        # Called from embedding worker threads. What follows the last vector
+        # is the store writing its index.
+        with self._lock:
+            self.chunks_embedded += count
+            if self.stage == "embedding" and self.chunks_embedded >= self.chunks_total:
+                self.begin("indexing")
+
+    @property
+    def files_done(self) -> int:
+        return self.files_extracted + self.files_failed
+
+    def _stage_elapsed(self) -> float:
+        return time.monotonic() - self._stage_started
+
+    def eta_seconds(self) -> Optional[float]:
+        """Time left in the current stage, from its rate so far."""
+        elapsed = self._stage_elapsed()
+        if self.stage == "extracting" and self.bytes_processed and self.bytes_total:
+            done, total = self.bytes_processed, self.bytes_total
+        elif self.stage == "embedding" and self.chunks_embedded and self.chunks_total:
+            done, total = self.chunks_embedded, self.chunks_total
+        else:
+            return None
+        return max(0.0, elapsed * (total - done) / done)
+
+    def describe(self) -> str:
+        """One line for a status message."""
+        if self.stage == "extracting":
+            text = (f"reading {self.files_done:,}/{self.files_total:,} files "
+                    f"({self.bytes_processed / 1e6:,.1f} of {self.bytes_total / 1e6:,.1f} MB)")
+        elif self.stage == "embedding":
+            text = f"embedding {self.chunks_embedded:,}/{self.chunks_total:,} chunks"
+        elif self.stage == "indexing":
+            text = f"indexing {self.chunks_total:,} chunks"
+        elif self.stage == "done":
+            text = (f"done in {_format_duration(time.monotonic() - self.started)}: "
+                    f"{self.files_extracted:,} files, {self.chunks_total:,} chunks")
+        else:
+            text = "looking for documents"
+        if self.files_failed:
+            text += f", {self.files_failed:,} unreadable"
+        eta = self.eta_seconds()
+        if eta is not None:
+            text += f", about {_format_duration(eta)} left"
+        return f"Preparing documents for {self.topic}: {text}"
+
+    def throughput(self) -> str:
+        """Per-stage rates, to show whether extraction or embedding is the bottleneck."""
+        parts: List[str] = []
+        extracting = self.stage_seconds.get("extracting")
+        if extracting:
+            parts.append(
+                f"extraction {self.files_done} files, {self.bytes_processed / 1e6:.1f} MB in {extracting:.1f}s "
+                f"({self.files_done / extracting:.1f} files/s, {self.bytes_processed / 1e6 / extracting:.2f} MB/s)"
+            )
+        embedding = self.stage_seconds.get("embedding")
+        if embedding:
+            parts.append(f"embedding {self.chunks_embedded} chunks in {embedding:.1f}s "
+                         f"({self.chunks_embedded / embedding:.1f} chunks/s)")
+        indexing = self.stage_seconds.get("indexing")
+        if indexing:
+            parts.append(f"indexing {indexing:.1f}s")
+        return f"Scan of {self.topic}: " + ("; ".join(parts) or "nothing to do")
+
+
+class ProgressEmbeddings(Embeddings):
+    """Embeddings that count the documents they embed into a ``ScanProgress``.
+
+    Embeddings that report their own batches (``BatchedEmbeddings``, through
+    ``on_embedded``) are called once, keeping their batching and resume
+    cache; others are called ``PROGRESS_SLICE`` texts at a time. Everything
+    else is passed through, so the store can keep this as its embeddings.
+    """
+
+    def __init__(self, embeddings: Embeddings, progress: ScanProgress):
+        self.embeddings = embeddings
+        self.progress = progress
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if hasattr(self.embeddings, "on_embedded"):
+            self.embeddings.on_embedded = self.progress.add_embedded
+            try:
+                return self.embeddings.embed_documents(texts)
+            finally:
+                self.embeddings.on_embedded = None
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), PROGRESS_SLICE):
+            batch = self.embeddings.embed_documents(texts[start:start + PROGRESS_SLICE])
+            vectors.extend(batch)
+            self.progress.add_embedded(len(batch))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def __getattr__(self, name):
+        # embed_queries, and anything else callers look for on the real one.
+        if name in ("embeddings", "progress"):
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
+async def report_every(progress: ScanProgress, interval: float,
+                       publish: Callable[[str], Awaitable[None]]):
+    """Publish ``progress.describe()`` every ``interval`` seconds while it changes.
+
+    Runs until cancelled. The first report comes after one interval, so a
+    quick scan publishes nothing. A failed publish is logged and skipped: a
+    status message must never break the scan it describes.
+    """
+    last = None
+    while True:
+        await asyncio.sleep(interval)
+        text = progress.describe()
+        if text == last:
+            continue
+        try:
+            await publish(text)
+            last = text
+        except Exception as e:
+            logger.warning(f"Could not publish scan progress: {e}")
+
+
+@contextlib.asynccontextmanager
+async def reporting(progress: ScanProgress, interval: float,
+                    publish: Callable[[str], Awaitable[None]]) -> AsyncIterator[None]:
+    """Run ``report_every`` for the duration of a scan. ``interval`` 0 reports nothing.
+
+    If anything was published and the scan finished, the status is brought
+    up to date once more, so it does not stay at "embedding 90%".
+    """
+    if not interval:
+        yield
+        return
+    published = False
+
+    async def publish_and_note(text: str):
+        nonlocal published
+        await publish(text)
+        published = True
+
+    task = asyncio.create_task(report_every(progress, interval, publish_and_note))
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        if published and progress.stage == "done":
+            try:
+                await publish(progress.describe())
+            except Exception as e:
+                logger.warning(f"Could not publish scan progress: {e}")
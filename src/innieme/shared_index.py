@@ -0,0 +1,235 @@
+"""One vector index shared by the topics over one documentation tree.
+
+Topics whose documents overlap (several topics over one tree, or over
+subdirectories of it) would each embed and store the same chunks. A
+``SharedIndex`` holds each distinct chunk once, tagged in its metadata with
+every topic that contains it, and each topic searches it through a filter on
+its own tag. Embedding work and memory then grow with the unique content, not
+with the number of topics.
+
+Chunk ids come from the source, position and text (see
+``DocumentProcessor._build_chunks``), so two topics that scan the same file
+produce the same ids and the second finds the chunks already stored.
+
+Only metadata that is the same for every topic is stored. Which other files
+a deduplicated chunk was also found in depends on what each topic scans and
+excludes, so it is kept per topic here, for the chunks that have any, and
+added back to that topic's search results (``topic_view``); a topic never
+sees the names of files it excludes. Beyond that, only chunk ids and tags
+are held in memory: the text and metadata live in the store alone.
+"""
+
+import hashlib
+
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from .chunk_dedup import ALSO_IN_KEY
+from .embeddings_factory import EmbeddingsFactory
+from .retrieval import is_faiss, replace_in_store
+from .scan_progress import ProgressEmbeddings, ScanProgress
+from .vector_store_factory import VectorStoreFactory
+
+logger = logging.getLogger(__name__)
+
+TAG_PREFIX = "topic:"
+
+# Stores that filter after the nearest-neighbour search (FAISS) are asked for
+# this many times the share of the index a topic does not hold, so a small
+# topic in a large index still gets k matches.
+OVERFETCH_MARGIN = 2
+
+
+def _content_key(source: Optional[str], text: str) -> str:
+    """Identifies a chunk's content in a search result, which need not carry its id."""
+    return hashlib.sha1(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+class SharedIndex:
+    def __init__(self,
+                 name: str,
+                 embeddings_factory: EmbeddingsFactory,
+                 vector_store_factory: VectorStoreFactory):
+        self.name = name
+        self.embeddings_factory = embeddings_factory
+        self.vector_store_factory = vector_store_factory
+        self.vectorstore: Optional[VectorStore] = None
+        # Chunk id -> tags of the topics that contain it.
+        self._members: Dict[str, Set[str]] = {}
+        # Tag -> ids of the chunks that topic contains.
+        self._ids_by_tag: Dict[str, Set[str]] = {}
+        # Tag -> content key of a chunk -> the other files that topic found
+        # it in, for the chunks it found in more than one.
+        self._also_in: Dict[str, Dict[str, str]] = {}
+        # Tag -> chunk id -> content key, for the same chunks.
+        self._also_in_keys: Dict[str, Dict[str, str]] = {}
+        self._lock = asyncio.Lock()
+
+    def join(self, topic: str) -> str:
+        """Register a topic and return the metadata tag its chunks carry."""
+        safe_topic = "".join(c if c.isalnum() else "_" for c in topic)
+        tag = f"{TAG_PREFIX}{safe_topic}"
+        suffix = 1
+        # Two outies can each have a topic of the same name; their chunks
+        # must not show up in each other's answers.
+        while tag in self._ids_by_tag:
+            suffix += 1
+            tag = f"{TAG_PREFIX}{safe_topic}_{suffix}"
+        self._ids_by_tag[tag] = set()
+        return tag
+
+    def _collection_name(self) -> str:
+        return f"{self.name}_{int(time.time() * 1000)}"
+
+    def store(self) -> VectorStore:
+        if self.vectorstore is None:
+            self.vectorstore = self.vector_store_factory.create_empty_store(
+                collection_name=self._collection_name(),
+                embeddings=self.embeddings_factory.create_embeddings(),
+            )
+        return self.vectorstore
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def _tags(self, chunk_id: str) -> Dict[str, bool]:
+        # Every known tag is written, False where the topic does not hold the
+        # chunk: metadata updates merge, so a tag that is merely left out
+        # would keep its old value.
+        members = self._members.get(chunk_id, ())
+        return {tag: tag in members for tag in self._ids_by_tag}
+
+    async def replace(self, tag: str, chunks: List[Dict], progress: Optional[ScanProgress] = None) -> VectorStore:
+        """Make ``chunks`` the whole of a topic's content (a full scan)."""
+        return await self.update(tag, self._ids_by_tag.get(tag, ()), chunks, progress)
+
+    async def update(self, tag: str, removed_ids: Iterable[str], chunks: List[Dict],
+                     progress: Optional[ScanProgress] = None) -> VectorStore:
+        """Drop a topic's hold on ``removed_ids`` and give it ``chunks``.
+
+        Only chunks no topic held before are embedded, in a worker thread,
+        counted into ``progress`` when given. Chunks no topic holds any
+        longer are deleted; the rest are retagged.
+        """
+        async with self._lock:
+            owned = self._ids_by_tag.setdefault(tag, set())
+            also_in = self._also_in.setdefault(tag, {})
+            also_in_keys = self._also_in_keys.setdefault(tag, {})
+            new_ids = {chunk["id"] for chunk in chunks}
+            retag: Set[str] = set()
+            deleted: List[str] = []
+            for chunk_id in set(removed_ids) - new_ids:
+                members = self._members.get(chunk_id)
+                owned.discard(chunk_id)
+                if members is None:
+                    continue
+                members.discard(tag)
+                also_in.pop(also_in_keys.pop(chunk_id, None), None)
+                if members:
+                    retag.add(chunk_id)
+                else:
+                    deleted.append(chunk_id)
+                    del self._members[chunk_id]
+
+            added = []
+            added_ids: Set[str] = set()
+            for chunk in chunks:
+                chunk_id = chunk["id"]
+                owned.add(chunk_id)
+                if chunk["metadata"].get(ALSO_IN_KEY):
+                    key = _content_key(chunk["metadata"]["source"], chunk["text"])
+                    also_in[key] = chunk["metadata"][ALSO_IN_KEY]
+                    also_in_keys[chunk_id] = key
+                else:
+                    also_in.pop(also_in_keys.pop(chunk_id, None), None)
+                if chunk_id in self._members:
+                    if tag not in self._members[chunk_id]:
+                        self._members[chunk_id].add(tag)
+                        retag.add(chunk_id)
+                elif chunk_id not in added_ids:
+                    self._members[chunk_id] = {tag}
+                    added_ids.add(chunk_id)
+                    added.append(chunk)
+
+            texts = [chunk["text"] for chunk in added]
+            metadatas = [
+                {**{key: value for key, value in chunk["metadata"].items() if key != ALSO_IN_KEY},
+                 **self._tags(chunk["id"])}
+                for chunk in added
+            ]
+            ids = [chunk["id"] for chunk in added]
+            embeddings = self.embeddings_factory.create_embeddings()
+            if progress is not None:
+                # Only what is new to the index gets embedded.
+                progress.chunks_total = len(added)
+                embeddings = ProgressEmbeddings(embeddings, progress)
+            if self.vectorstore is None and added:
+                self.vectorstore = await asyncio.to_thread(
+                    self.vector_store_factory.create_from_texts,
+                    texts, embeddings,
+                    collection_name=self._collection_name(), metadatas=metadatas, ids=ids,
+                )
+            elif deleted or added:
+                await replace_in_store(self.store(), deleted, texts, metadatas, ids, embeddings)
+            store = self.store()
+            if retag:
+                retag_ids = sorted(retag)
+                retag_args = (store, retag_ids, [self._tags(i) for i in retag_ids])
+                if is_faiss(store):
+                    # On the loop, like every change to a FAISS store.
+                    self.vector_store_factory.update_metadata(*retag_args)
+                else:
+                    await asyncio.to_thread(self.vector_store_factory.update_metadata, *retag_args)
+            logger.info(
+                f"Shared index {self.name}: {len(ids)} chunks embedded, {len(retag)} shared, "
+                f"{len(deleted)} removed; {len(self._members)} chunks in total"
+            )
+            return store
+
+    def topic_view(self, tag: str, docs: List[Document]) -> List[Document]:
+        """Search results as one topic sees them: with the files that topic
+        found each chunk in as well, and without the other topics' tags."""
+        also_in = self._also_in.get(tag, {})
+        viewed = []
+        for doc in docs:
+            metadata = {key: value for key, value in doc.metadata.items()
+                        if not key.startswith(TAG_PREFIX) and key != ALSO_IN_KEY}
+            others = also_in.get(_content_key(metadata.get("source"), doc.page_content)) if also_in else None
+            if others:
+                metadata[ALSO_IN_KEY] = others
+            viewed.append(Document(page_content=doc.page_content, metadata=metadata, id=doc.id))
+        return viewed
+
+    def search_filter(self, tag: str, filter: Optional[Dict] = None) -> Dict:
+        """The metadata filter restricting a search to one topic."""
+        own = {tag: True}
+        return {"$and": [filter, own]} if filter else own
+
+    def overfetch(self, tag: str) -> int:
+        """How many times k to fetch before filtering, for one topic."""
+        share = len(self._ids_by_tag.get(tag, ())) / max(1, len(self._members))
+        return OVERFETCH_MARGIN * math.ceil(1 / share) if share else 1
+
+    def search_kwargs(self, tag: str, k: int, filter: Optional[Dict] = None) -> Dict:
+        """Keyword arguments for a ``similarity_search*`` call within one topic."""
+        kwargs = {"filter": self.search_filter(tag, filter)}
+        if is_faiss(self.vectorstore):
+            # langchain's FAISS filters after searching fetch_k (default 20).
+            kwargs["fetch_k"] = max(20, k * self.overfetch(tag))
+        return kwargs
+
+
+_shared_indexes: Dict[Hashable, SharedIndex] = {}
+
+
+def shared_index_for(key: Hashable, create: Callable[[], SharedIndex]) -> SharedIndex:
+    """The process's shared index for ``key``, created on first use."""
+    if key not in _shared_indexes:
+        _shared_indexes[key] = create()
+    return _shared_indexes[key]
@@ -1,5 +1,7 @@
 from .slack_bot_config import SlackBotConfig
 from .innie import Innie, Topic
+from .usage import UsageTracker
+from . import llm, scan_progress, tracing
 
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
@@ -45,10 +47,10 @@ WORKING_REACTION = "thinking_face"
 # rather than slash commands because a slash command has to be declared in the
 # Slack app config as well as here, so it cannot ship in code alone.
 #
-# "quit" and "rescan" act on the channel's topic and are outie-only. "hello" is
-# an information card: no topic required and open to everyone, matching the
-# /hello slash command it replaces.
-BOT_COMMANDS = frozenset({"quit", "rescan", "hello"})
+# "quit", "rescan", "stats" and "clear cache" act on the channel's topic and
+# are outie-only. "hello" is an information card: no topic required and open
+# to everyone, matching the /hello slash command it replaces.
+BOT_COMMANDS = frozenset({"quit", "rescan", "stats", "clear cache", "hello"})
 
 # Both mention forms Slack markup allows: the bare "<@U123>" and the labelled
 # "<@U123|name>". The ID is captured so the same pattern answers "was the bot
@@ -341,9 +343,13 @@ class SlackBot:
         # Set by stop() to release start(). Created in start() for the same
         # reason as the handler: an asyncio.Event binds to the running loop.
         self._shutdown: Optional[asyncio.Event] = None
+        # Seconds between edits of a scan's status message; 0 posts none.
+        self.scan_progress_interval = config.scan_progress_interval
 
+        # LLM usage of every topic, for "@bot stats".
+        self.usage = UsageTracker(config.usage_db)
         # Innies setup        
-        self.innies = [Innie(outie_config) for outie_config in config.outies]
+        self.innies = [Innie(outie_config, self.usage) for outie_config in config.outies]
         # Channel->Topic mapping
         self.channels: defaultdict[str, List[Topic]] = defaultdict(list)
         for innie in self.innies:
@@ -471,11 +477,17 @@ class SlackBot:
                 thread_ts=thread_ts
             )
 
-    async def process_and_respond(self, topic: Topic, channel_id: str, query: str, thread_id: str, thread_ts: str = None):
+    async def process_and_respond(self, topic: Topic, channel_id: str, query: str, thread_id: str, thread_ts: str = None,
+                                  user_id: Optional[str] = None):
         """Process a query and respond in the channel"""
+        with tracing.request("slack", topic=topic.config.name, channel=channel_id, user=user_id):
+            await self._process_and_respond(topic, channel_id, query, thread_id, thread_ts)
+
+    async def _process_and_respond(self, topic: Topic, channel_id: str, query: str, thread_id: str, thread_ts: str = None):
         context_messages = []
         if thread_ts:
-            context_messages = await self.get_thread_context(channel_id, thread_ts)
+            with tracing.span("fetch_context"):
+                context_messages = await self.get_thread_context(channel_id, thread_ts)
         else:
             context_messages = [{"role": "user", "content": query}]
 
@@ -484,7 +496,8 @@ class SlackBot:
 
             response = await topic.process_query(thread_id, query, context_messages=context_messages)
 
-            await self._post_response(channel_id, response, thread_ts)
+            with tracing.span("post"):
+                await self._post_response(channel_id, response, thread_ts)
 
         except Exception as e:
             error_message = f"Sorry, I encountered an error while processing your request: {str(e)}"
@@ -541,7 +554,8 @@ class SlackBot:
             channel_id,
             clean_text,
             ts,  # Use timestamp as thread_id
-            ts   # Use timestamp as thread_ts for threading
+            ts,  # Use timestamp as thread_ts for threading
+            user_id=event.get("user"),
         )
 
     async def handle_message(self, event: Dict[str, Any], say, client: AsyncWebClient):
@@ -604,11 +618,12 @@ class SlackBot:
                 channel_id,
                 text,
                 thread_ts,
-                thread_ts
+                thread_ts,
+                user_id=user_id,
             )
 
     async def run_bot_command(self, command: str, topic: Topic, event: Dict[str, Any], client: AsyncWebClient):
-        """Run a mention command ("quit", "rescan") on behalf of the outie."""
+        """Run a mention command ("quit", "rescan", "stats", "clear cache") on behalf of the outie."""
         channel_id = event["channel"]
         # Reply in the mention's own thread. Falling back to the message ts
         # mirrors handle_mention, which threads a top-level mention under itself.
@@ -625,6 +640,18 @@ class SlackBot:
 
         if command == "rescan":
             await self.rescan(topic, channel_id, event["ts"], thread_ts)
+        elif command == "stats":
+            await client.chat_postMessage(
+                channel=channel_id,
+                thread_ts=thread_ts,
+                text=await self.usage.report(topic.config.name)
+            )
+        elif command == "clear cache":
+            await client.chat_postMessage(
+                channel=channel_id,
+                thread_ts=thread_ts,
+                text=topic.describe_clear_answer_cache()
+            )
         elif command == "quit":
             await client.chat_postMessage(
                 channel=channel_id,
@@ -659,20 +686,35 @@ class SlackBot:
             await self.client.chat_postMessage(
                 channel=channel_id,
                 thread_ts=thread_ts,
-                text=await self._rescan_and_describe(topic)
+                text=await self._rescan_and_describe(topic, channel_id, thread_ts)
             )
         finally:
             await self._set_working(channel_id, message_ts, False)
 
-    async def _rescan_and_describe(self, topic: Topic) -> str:
+    async def _rescan_and_describe(self, topic: Topic, channel_id: str, thread_ts: str) -> str:
         """Rescan the topic and return what to tell the channel about it.
 
         Only the scan is guarded. A failure to post the *result* must not be
         reported as a failed rescan — that would tell the channel the old index is
         still serving when the new one actually loaded.
         """
+        progress = scan_progress.ScanProgress(topic.config.name)
+        status_ts: Optional[str] = None
+
+        async def publish(text: str):
+            # One status message in the thread, posted once the scan has run
+            # for an interval and edited from then on.
+            nonlocal status_ts
+            if status_ts is None:
+                response = await self.client.chat_postMessage(channel=channel_id, thread_ts=thread_ts, text=text)
+                status_ts = response["ts"]
+            else:
+                await self.client.chat_update(channel=channel_id, ts=status_ts, text=text)
+
         try:
-            return f"Rescan complete. {await topic.scan_and_vectorize()}"
+            async with scan_progress.reporting(progress, self.scan_progress_interval, publish):
+                result = await topic.scan_and_vectorize(progress)
+            return f"Rescan complete. {result}"
         except Exception:
             logger.exception(f"Rescan failed for topic {topic.config.name}")
             # The exception text stays out of the channel: it routinely carries
@@ -690,6 +732,8 @@ class SlackBot:
         """Connect to channels and prepare documents"""
         outie_id = topic.outie_config.outie_id
         channels = []
+        # The "preparing documents" message in each channel, edited with progress.
+        status_messages = []
         
         for channel_config in topic.config.channels:
             channel_id = channel_config.channel_id
@@ -697,10 +741,11 @@ class SlackBot:
                 # Test if we can access the channel
                 await self.client.conversations_info(channel=channel_id)
                 channels.append(channel_id)
-                await self.client.chat_postMessage(
+                response = await self.client.chat_postMessage(
                     channel=channel_id,
                     text=f"Bot is connected, preparing documents for {topic.config.name}..."
                 )
+                status_messages.append((channel_id, response["ts"]))
             except Exception as e:
                 logger.error(f"Could not connect to channel {channel_id}: {e}")
                 # Try to notify the outie via DM
@@ -712,8 +757,15 @@ class SlackBot:
                 except Exception as dm_e:
                     logger.error(f"Could not send DM to outie {outie_id}: {dm_e}")
         
+        async def publish(text: str):
+            for channel_id, ts in status_messages:
+                await self.client.chat_update(channel=channel_id, ts=ts, text=f"Bot is connected. {text}")
+
         # Scan and vectorize documents
-        scanning_result = await topic.scan_and_vectorize()
+        progress = scan_progress.ScanProgress(topic.config.name)
+        async with scan_progress.reporting(progress, self.scan_progress_interval, publish):
+            scanning_result = await topic.scan_and_vectorize(progress)
+        topic.start_watching()
         
         # Notify channels of completion
         for channel_id in channels:
@@ -773,6 +825,11 @@ class SlackBot:
             # that fails to prepare would otherwise leave that session open and
             # log "Unclosed client session".
             await self.handler.close_async()
+            for innie in self.innies:
+                for topic in innie.topics:
+                    await topic.stop_watching()
+            await self.usage.close()
+            await llm.close()
             # Back to the pre-start state. The handler is dropped, not just
             # closed: its aiohttp session is gone, so a second start() reusing it
             # would reconnect a dead client instead of building a fresh one.
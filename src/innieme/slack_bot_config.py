@@ -16,6 +16,26 @@ class TopicConfig(BaseModel):
     # against both the filename and the docs_dir-relative path. Unset uses the
     # defaults (see DEFAULT_DOCS_EXCLUDE); an explicit [] scans everything.
     docs_exclude: Optional[List[str]] = None
+    # Maximal-marginal-relevance retrieval for this topic. When set, retrieval
+    # fetches mmr_fetch_k candidates and picks retrieval_top_k of them, trading
+    # relevance against overlap with chunks already picked: 1.0 is plain
+    # relevance ranking, lower values favour diversity. Unset disables MMR.
+    mmr_lambda: Optional[float] = None
+    mmr_fetch_k: int = 20
+    # Reindex changed files automatically while the bot runs, instead of
+    # waiting for a rescan. watch_debounce is the quiet period, in seconds,
+    # that a burst of changes must settle for before it is indexed.
+    # watch_poll_interval is how often, in seconds, docs_dir is walked for
+    # changes where change events are unavailable (NFS, or no watchfiles).
+    watch: bool = False
+    watch_debounce: float = 2.0
+    watch_poll_interval: float = 300.0
+    # Answer a first question (one with no thread before it) from the answer
+    # to an earlier one at least this similar (cosine, 0..1), for up to
+    # answer_cache_ttl seconds. Rescans and reindexed files invalidate cached
+    # answers. Unset disables the cache.
+    answer_cache_threshold: Optional[float] = None
+    answer_cache_ttl: float = 3600.0
     channels: List[ChannelConfig]
     outie: 'OutieConfig' = None  # type: ignore
 
@@ -26,6 +46,46 @@ class TopicConfig(BaseModel):
             raise ValueError(f'Document directory does not exist: {v}')
         return v
     
+    @field_validator('mmr_lambda')
+    def mmr_lambda_must_be_a_fraction(cls, v):
+        if v is None:
+            return v
+        if math.isnan(v) or not 0 <= v <= 1:
+            raise ValueError(f'mmr_lambda must be between 0 and 1, got {v}')
+        return v
+
+    @field_validator('mmr_fetch_k')
+    def fetch_k_must_be_positive(cls, v):
+        if v < 1:
+            raise ValueError(f'mmr_fetch_k must be at least 1, got {v}')
+        return v
+
+    @field_validator('watch_debounce')
+    def watch_debounce_must_be_positive(cls, v):
+        if math.isnan(v) or v <= 0:
+            raise ValueError(f'watch_debounce must be positive, got {v}')
+        return v
+
+    @field_validator('watch_poll_interval')
+    def watch_poll_interval_must_be_positive(cls, v):
+        if math.isnan(v) or v <= 0:
+            raise ValueError(f'watch_poll_interval must be positive, got {v}')
+        return v
+
+    @field_validator('answer_cache_threshold')
+    def answer_cache_threshold_must_be_a_fraction(cls, v):
+        if v is None:
+            return v
+        if math.isnan(v) or not 0 < v <= 1:
+            raise ValueError(f'answer_cache_threshold must be above 0 and at most 1, got {v}')
+        return v
+
+    @field_validator('answer_cache_ttl')
+    def answer_cache_ttl_must_be_positive(cls, v):
+        if math.isnan(v) or v <= 0:
+            raise ValueError(f'answer_cache_ttl must be positive, got {v}')
+        return v
+
     @model_validator(mode='after')
     def set_back_references(self):
         for channel in self.channels:
@@ -69,18 +129,68 @@ class SlackBotConfig(BaseModel):
     embedding_model: str
     llm_model: str = "openai:gpt-5.6-terra"
     # Where downloaded embedding models are cached. Only used by the
-    # "huggingface" backend. Supports "~". Defaults to a .cache directory
+    # "huggingface" and "onnx" backends. Supports "~". Defaults to a .cache directory
     # inside each topic's docs_dir when unset.
     cache_dir: Optional[str] = None
     # Embedding model name. Backend-specific; when unset each backend uses its
-    # own default (OpenAI: text-embedding-3-small, HuggingFace: all-MiniLM-L6-v2).
+    # own default (OpenAI: text-embedding-3-small, HuggingFace: all-MiniLM-L6-v2,
+    # ONNX: sentence-transformers/all-MiniLM-L6-v2 or a local export directory).
     embeddings_model_name: Optional[str] = None
+    # "onnx" backend only: the export to load from the model's directory or
+    # Hub repository (a quantized one for int8), ONNX Runtime's intra-op
+    # threads (unset: every physical core), and texts per forward pass.
+    embeddings_onnx_file: Optional[str] = None
+    embeddings_threads: Optional[int] = None
+    embeddings_batch_size: int = 32
+    # OpenAI embedding requests in flight at once during a scan. This is a
+    # ceiling; the actual number adapts down on rate limits and back up after.
+    embeddings_max_concurrency: int = 4
+    # Optional tokens-per-minute budget for OpenAI embeddings, e.g. the org's
+    # limit. Unset relies on backing off from 429s alone.
+    embeddings_tokens_per_minute: Optional[int] = None
     # How many document chunks to send as context per query. Higher values
     # improve recall at the cost of more input tokens.
     retrieval_top_k: int = 5
     # Optional relevance floor (0..1). When set, chunks scoring below it are
     # dropped, so weak matches don't pad the context out to retrieval_top_k.
     retrieval_score_threshold: Optional[float] = None
+    # Queries arriving within this many milliseconds of each other are
+    # embedded in one call and searched together. 0 searches each alone.
+    retrieval_batch_window_ms: float = 5.0
+    # While a scan runs, edit its status message with progress (files read,
+    # chunks embedded, time left) at most this often, in seconds. 0 posts none.
+    scan_progress_interval: float = 15.0
+    # SQLite file that LLM token usage per topic, channel and user is written
+    # to, for the stats command. Unset keeps it in memory until restart.
+    usage_db: Optional[str] = "./data/usage.db"
+    # Generated summaries wait this many hours for approval, and each topic
+    # keeps at most max_pending_summaries of them (the oldest go first).
+    pending_summary_ttl_hours: float = 168.0
+    max_pending_summaries: int = 500
+    # How the prompt is laid out for the model. "inline" folds the retrieved
+    # documents and conversation history into the system prompt. "cached" keeps
+    # the system prompt to the static topic role, so providers can serve it from
+    # their prompt cache, and sends history and documents as messages after it.
+    prompt_layout: str = "inline"
+    # Merge exact and near-duplicate chunks at ingestion, keeping one copy
+    # that records every file it was found in.
+    dedup_chunks: bool = False
+    # Where chunk vectors are kept: "chroma" (default), "faiss", or "compact"
+    # (FAISS over quantized vectors, for large topics). The vector_* settings
+    # below only apply to "compact": vector_quantization is "sq8" (4x smaller)
+    # or "pq" (about 64x smaller); vector_dimensions truncates
+    # text-embedding-3-* vectors to a prefix; vector_rescore ("sq8", "fp16",
+    # "flat") re-ranks the top candidates against a more precise copy.
+    vector_store: str = "chroma"
+    vector_quantization: str = "sq8"
+    vector_dimensions: Optional[int] = None
+    vector_rescore: Optional[str] = None
+    # With vector_store "faiss": build each index to this directory once and
+    # memory-map it, so processes serving the same topic share one copy.
+    vector_index_dir: Optional[str] = None
+    # Keep one index per embedding model and documents tree, shared by every
+    # topic whose docs_dir is in it, instead of one index per topic.
+    shared_index: bool = False
     outies: List[OutieConfig]
 
     @field_validator('slack_bot_token')
@@ -108,6 +218,30 @@ class SlackBotConfig(BaseModel):
             )
         return data
 
+    @field_validator('embeddings_max_concurrency')
+    def concurrency_must_be_positive(cls, v):
+        if v < 1:
+            raise ValueError(f'embeddings_max_concurrency must be at least 1, got {v}')
+        return v
+
+    @field_validator('embeddings_tokens_per_minute')
+    def tokens_per_minute_must_be_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError(f'embeddings_tokens_per_minute must be positive, got {v}')
+        return v
+
+    @field_validator('embeddings_threads')
+    def threads_must_be_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError(f'embeddings_threads must be at least 1, got {v}')
+        return v
+
+    @field_validator('embeddings_batch_size')
+    def batch_size_must_be_positive(cls, v):
+        if v < 1:
+            raise ValueError(f'embeddings_batch_size must be at least 1, got {v}')
+        return v
+
     @field_validator('retrieval_top_k')
     def top_k_must_be_positive(cls, v):
         # Reaches the vector store as `k`; a non-positive value fails at query
@@ -132,13 +266,83 @@ class SlackBotConfig(BaseModel):
             )
         return v
 
+    @field_validator('retrieval_batch_window_ms')
+    def batch_window_must_not_be_negative(cls, v):
+        if math.isnan(v) or v < 0:
+            raise ValueError(f'retrieval_batch_window_ms must be 0 or more, got {v}')
+        return v
+
+    @field_validator('scan_progress_interval')
+    def scan_progress_interval_must_not_be_negative(cls, v):
+        if math.isnan(v) or v < 0:
+            raise ValueError(f'scan_progress_interval must be 0 or more, got {v}')
+        return v
+
+    @field_validator('pending_summary_ttl_hours')
+    def pending_summary_ttl_must_be_positive(cls, v):
+        if math.isnan(v) or v <= 0:
+            raise ValueError(f'pending_summary_ttl_hours must be positive, got {v}')
+        return v
+
+    @field_validator('max_pending_summaries')
+    def max_pending_summaries_must_be_positive(cls, v):
+        if v < 1:
+            raise ValueError(f'max_pending_summaries must be at least 1, got {v}')
+        return v
+
+    @field_validator('prompt_layout')
+    def prompt_layout_must_be_supported(cls, v):
+        supported_layouts = ['inline', 'cached']
+        if v not in supported_layouts:
+            raise ValueError(f'Unsupported prompt layout: {v}')
+        return v
+
+    @field_validator('vector_store')
+    def vector_store_must_be_supported(cls, v):
+        supported_stores = ['chroma', 'faiss', 'compact']
+        if v not in supported_stores:
+            raise ValueError(f'Unsupported vector store: {v}')
+        return v
+
+    @field_validator('vector_quantization')
+    def quantization_must_be_supported(cls, v):
+        if v not in ['sq8', 'pq']:
+            raise ValueError(f'Unsupported vector quantization: {v}')
+        return v
+
+    @field_validator('vector_rescore')
+    def rescore_must_be_supported(cls, v):
+        if v is not None and v not in ['sq8', 'fp16', 'flat']:
+            raise ValueError(f'Unsupported vector rescore precision: {v}')
+        return v
+
+    @field_validator('vector_dimensions')
+    def dimensions_must_be_positive(cls, v):
+        if v is not None and v < 1:
+            raise ValueError(f'vector_dimensions must be positive, got {v}')
+        return v
+
     @field_validator('embedding_model')
     def model_must_be_supported(cls, v):
-        supported_models = ['openai', 'huggingface', 'fake']
+        supported_models = ['openai', 'huggingface', 'onnx', 'fake']
         if v not in supported_models:
             raise ValueError(f'Unsupported embedding model: {v}')
         return v
     
+    @model_validator(mode='after')
+    def index_dir_needs_faiss(self):
+        # Only the FAISS store builds to disk; anywhere else the setting would
+        # be ignored and every process would keep its own copy regardless.
+        if self.vector_index_dir and self.vector_store != 'faiss':
+            raise ValueError(
+                f'vector_index_dir requires vector_store "faiss", got "{self.vector_store}"'
+            )
+        # A shared index grows topic by topic, so there is no one finished
+        # build to write out and map.
+        if self.vector_index_dir and self.shared_index:
+            raise ValueError('vector_index_dir cannot be combined with shared_index')
+        return self
+
     @model_validator(mode='after')
     def set_back_references(self):
         for outie in self.outies:
@@ -0,0 +1,225 @@
+"""Approved summaries, in an append-only SQLite table.
+
+One row per approved summary, indexed by thread and by time, so looking up
+a thread's summaries or the latest ones reads only those rows however many
+have been stored. Reads page through the table by row id rather than
+loading it whole. Every database call runs in a worker thread, off the
+event loop.
+
+Summaries used to be written one JSON file each into the same directory;
+the first time the store opens an empty table next to such files, it
+imports them in one transaction. The files are left where they are.
+
+Summaries generated but not yet approved wait in a second table of the same
+database (see ``PendingSummaries``), so a restart between "summary and file"
+and ``/approve`` does not throw away the LLM call that made them.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = "summaries.db"
+PAGE_SIZE = 500
+PENDING_TTL = 7 * 24 * 3600.0
+MAX_PENDING = 500
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS summaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        thread_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        data TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS summaries_by_thread ON summaries (thread_id, id)",
+    "CREATE INDEX IF NOT EXISTS summaries_by_time ON summaries (timestamp)",
+    """CREATE TABLE IF NOT EXISTS pending_summaries (
+        topic TEXT NOT NULL,
+        thread_id TEXT NOT NULL,
+        created REAL NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (topic, thread_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS pending_summaries_by_age ON pending_summaries (topic, created)",
+]
+
+# summary_<thread id>_<YYYYmmdd_HHMMSS>.json, as KnowledgeManager used to name them.
+_LEGACY_FILE_RE = re.compile(r"summary_(.+)_\d{8}_\d{6}\.json$")
+
+
+class SummaryStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, DATABASE_NAME)
+        # One connection, used from worker threads one at a time.
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            with db:
+                for statement in _SCHEMA:
+                    db.execute(statement)
+            self._db = db
+            self._import_legacy_files()
+        return self._db
+
+    def _import_legacy_files(self):
+        if self._db.execute("SELECT 1 FROM summaries LIMIT 1").fetchone():
+            return
+        rows = []
+        for file_path in sorted(glob.glob(os.path.join(self.directory, "summary_*.json"))):
+            match = _LEGACY_FILE_RE.search(os.path.basename(file_path))
+            try:
+                with open(file_path) as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.error(f"Error importing summary {file_path}: {e}")
+                continue
+            rows.append((match.group(1) if match else "", data.get("timestamp", ""), json.dumps(data)))
+        if rows:
+            self._write(rows)
+            logger.info(f"Imported {len(rows)} summary file(s) into {self.path}")
+
+    def _write(self, rows: List[Tuple[str, str, str]]):
+        with self._db:
+            self._db.executemany("INSERT INTO summaries (thread_id, timestamp, data) VALUES (?, ?, ?)", rows)
+
+    def _append(self, entries: List[Tuple[object, Dict]]):
+        with self._lock:
+            self._connect()
+            self._write([(str(thread_id), data.get("timestamp", ""), json.dumps(data))
+                         for thread_id, data in entries])
+
+    def _select(self, where: str, params: tuple, limit: int) -> List[Tuple[int, Dict]]:
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, thread_id, data FROM summaries WHERE {where} ORDER BY id LIMIT ?",
+                params + (limit,),
+            ).fetchall()
+        return [(row_id, {**json.loads(data), "thread_id": thread_id}) for row_id, thread_id, data in rows]
+
+    async def append(self, thread_id, data: Dict):
+        await self.append_many([(thread_id, data)])
+
+    async def append_many(self, entries: List[Tuple[object, Dict]]):
+        """Store several summaries in one transaction."""
+        if entries:
+            await asyncio.to_thread(self._append, entries)
+
+    async def pages(self, page_size: int = PAGE_SIZE, thread_id=None,
+                    since: Optional[str] = None, topic: Optional[str] = None) -> AsyncIterator[List[Dict]]:
+        """Stored summaries, oldest first, ``page_size`` at a time.
+
+        Optionally only one thread's, those stored at or after ``since`` (an
+        ISO timestamp), or one topic's.
+        """
+        conditions, params = ["id > ?"], []
+        if topic is not None:
+            conditions.append("json_extract(data, '$.topic') = ?")
+            params.append(topic)
+        if thread_id is not None:
+            conditions.append("thread_id = ?")
+            params.append(str(thread_id))
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        last_id = 0
+        while True:
+            rows = await asyncio.to_thread(
+                self._select, " AND ".join(conditions), (last_id, *params), page_size
+            )
+            if not rows:
+                return
+            yield [data for _, data in rows]
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def _run(self, operation, *args):
+        """Run ``operation(db, *args)`` under the lock, in a worker thread."""
+        def run():
+            with self._lock:
+                return operation(self._connect(), *args)
+        return asyncio.to_thread(run)
+
+    async def count(self) -> int:
+        return await self._run(lambda db: db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0])
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class PendingSummaries:
+    """One topic's generated summaries awaiting approval, by thread.
+
+    Kept in the ``SummaryStore``'s database. A summary is dropped once it is
+    approved (``pop``), ``ttl`` seconds after it was generated, or when the
+    topic has more than ``max_entries`` pending and it is the oldest.
+    """
+
+    def __init__(self, store: SummaryStore, topic: str, ttl: float = PENDING_TTL,
+                 max_entries: int = MAX_PENDING):
+        self.store = store
+        self.topic = topic
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _put(self, db: sqlite3.Connection, thread_id: str, data: Dict):
+        now = time.time()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO pending_summaries (topic, thread_id, created, data) VALUES (?, ?, ?, ?)",
+                (self.topic, thread_id, now, json.dumps(data)),
+            )
+            db.execute("DELETE FROM pending_summaries WHERE topic = ? AND created < ?",
+                       (self.topic, now - self.ttl))
+            db.execute(
+                "DELETE FROM pending_summaries WHERE topic = ? AND thread_id NOT IN ("
+                "SELECT thread_id FROM pending_summaries WHERE topic = ? ORDER BY created DESC LIMIT ?)",
+                (self.topic, self.topic, self.max_entries),
+            )
+
+    def _get(self, db: sqlite3.Connection, thread_id: str, remove: bool) -> Optional[Dict]:
+        row = db.execute(
+            "SELECT data FROM pending_summaries WHERE topic = ? AND thread_id = ? AND created >= ?",
+            (self.topic, thread_id, time.time() - self.ttl),
+        ).fetchone()
+        if remove:
+            with db:
+                db.execute("DELETE FROM pending_summaries WHERE topic = ? AND thread_id = ?",
+                           (self.topic, thread_id))
+        return json.loads(row[0]) if row else None
+
+    async def put(self, thread_id, data: Dict):
+        """Keep ``data`` as the thread's pending summary, replacing any before it."""
+        await self.store._run(self._put, str(thread_id), data)
+
+    async def get(self, thread_id) -> Optional[Dict]:
+        return await self.store._run(self._get, str(thread_id), False)
+
+    async def pop(self, thread_id) -> Optional[Dict]:
+        """The thread's pending summary, which is no longer pending; None if it has none."""
+        return await self.store._run(self._get, str(thread_id), True)
+
+    async def count(self) -> int:
+        def _count(db: sqlite3.Connection) -> int:
+            return db.execute(
+                "SELECT COUNT(*) FROM pending_summaries WHERE topic = ? AND created >= ?",
+                (self.topic, time.time() - self.ttl),
+            ).fetchone()[0]
+        return await self.store._run(_count)
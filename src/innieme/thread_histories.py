@@ -0,0 +1,95 @@
+"""Per-thread PydanticAI message histories, kept across turns.
+
+Each turn resends a thread's history, and an unchanged prefix is what the
+provider can cache, so a history is only ever appended to: by the engine,
+with each question and answer, and from the platform's own view of the
+thread, with whatever else was said there since the last turn. The platform
+sends its most recent messages, so the messages new since the last turn are
+those after the longest overlap with the messages it sent then.
+
+Histories are dropped after a day unused, and beyond ``max_threads`` the
+least recently used go first. A thread whose history was dropped is seeded
+again from the platform's context on its next turn.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Tuple
+
+from pydantic_ai.messages import ModelMessage
+
+from .conversation_engine import to_model_messages
+
+DEFAULT_MAX_THREADS = 1000
+DEFAULT_IDLE_TTL = 24 * 3600.0
+
+
+def _overlap(seen: List[Tuple[str, str]], messages: List[Tuple[str, str]]) -> int:
+    """How many of ``messages`` open with the end of ``seen``."""
+    for length in range(min(len(seen), len(messages)), 0, -1):
+        if seen[-length:] == messages[:length]:
+            return length
+    return 0
+
+
+@dataclass
+class ThreadHistory:
+    messages: List[ModelMessage] = field(default_factory=list)
+    # (role, content) of the platform's context at the last turn, the
+    # question asked then included.
+    seen: List[Tuple[str, str]] = field(default_factory=list)
+    # Held for a whole turn, so concurrent questions in one thread append
+    # their turns one after the other.
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = 0.0
+
+    def reconcile(self, context_messages: List[Dict[str, str]]):
+        """Append what the platform shows was said since the last turn.
+
+        The last context message is the question being asked now, which the
+        engine appends with its answer.
+        """
+        context = [(m["role"], m["content"]) for m in context_messages]
+        new = context[_overlap(self.seen, context[:-1]):-1] if context else []
+        if self.seen:
+            # The bot's replies to the last turn, which the engine has
+            # already appended in its own words.
+            while new and new[0][0] == "assistant":
+                del new[0]
+        self.messages.extend(to_model_messages([{"role": r, "content": c} for r, c in new]))
+        self.seen = context
+
+
+class ThreadHistories:
+    def __init__(self, max_threads: int = DEFAULT_MAX_THREADS, idle_ttl: float = DEFAULT_IDLE_TTL):
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        # Least recently used first, for eviction.
+        self._threads: "OrderedDict[Hashable, ThreadHistory]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def __contains__(self, thread_id: Hashable) -> bool:
+        return thread_id in self._threads
+
+    def get(self, thread_id: Hashable) -> ThreadHistory:
+        """The thread's history, new and empty if it has none."""
+        now = time.monotonic()
+        thread = self._threads.pop(thread_id, None) or ThreadHistory()
+        self._prune(now, room=1)
+        thread.last_used = now
+        self._threads[thread_id] = thread
+        return thread
+
+    def _prune(self, now: float, room: int = 0):
+        # A thread in the middle of a turn is kept, so its lock stays the one
+        # later turns wait on.
+        unlocked = [(t, h) for t, h in self._threads.items() if not h.lock.locked()]
+        idle = [t for t, h in unlocked if now - h.last_used >= self.idle_ttl]
+        excess = len(self._threads) + room - self.max_threads
+        least_recent = [t for t, _ in unlocked][:max(0, excess)]
+        for thread_id in set(idle) | set(least_recent):
+            del self._threads[thread_id]
@@ -0,0 +1,163 @@
+"""Per-request stage timing, with OpenTelemetry spans when it is installed.
+
+A bot handles each question inside ``request()``, and each stage of the
+answer (fetching the thread, embedding the query, searching, the LLM call,
+posting) inside ``span()``. Every stage becomes an OpenTelemetry span under
+the request's, exported wherever the process's tracer provider sends them
+(run under ``opentelemetry-instrument``, or configure the SDK yourself).
+Without ``opentelemetry`` the spans are skipped, but the timings are kept.
+
+When the request ends one log line sums it up, for example::
+
+    Request slack topic=ops total_ms=2140 fetch_context_ms=85 process_query_ms=1930
+    retrieval_ms=42 embed_query_ms=31 vector_search_ms=3 llm_ms=1880 post_ms=120
+    input_tokens=2310 output_tokens=164
+
+Stages nest (retrieval includes embed_query and vector_search), and a stage
+that runs more than once adds up. The same numbers are attached to the log
+record as ``timing``, for handlers that write structured logs.
+"""
+
+import contextlib
+import contextvars
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional
+
+from . import metrics
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # optional: timings are still logged without it
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = "innieme"
+
+
+@dataclass
+class RequestTiming:
+    name: str
+    attributes: Dict[str, object]
+    started: float
+    # Seconds per stage, and counters such as tokens, in the order first seen.
+    stages: Dict[str, float] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_counts(self, counts: Dict[str, int]):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def as_dict(self, total: float) -> Dict[str, object]:
+        timing = {"request": self.name, **self.attributes, "total_ms": round(total * 1000)}
+        timing.update({f"{stage}_ms": round(s * 1000) for stage, s in self.stages.items()})
+        timing.update(self.counts)
+        if self.error:
+            timing["error"] = self.error
+        return timing
+
+    def log_line(self, total: float) -> str:
+        fields = self.as_dict(total)
+        name = fields.pop("request")
+        return f"Request {name} " + " ".join(f"{k}={v}" for k, v in fields.items())
+
+
+_current: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    "innieme_request", default=None
+)
+
+
+def current() -> Optional[RequestTiming]:
+    """The timing of the request being handled, if any."""
+    return _current.get()
+
+
+def _otel_attributes(attributes: Dict[str, object]) -> Dict[str, object]:
+    # OpenTelemetry only takes primitives, and rejects None.
+    return {
+        key: value if isinstance(value, (bool, int, float, str)) else str(value)
+        for key, value in attributes.items()
+        if value is not None
+    }
+
+
+@contextlib.contextmanager
+def _otel_span(name: str, attributes: Dict[str, object]) -> Iterator[None]:
+    if otel_trace is None:
+        yield
+        return
+    tracer = otel_trace.get_tracer(TRACER_NAME)
+    with tracer.start_as_current_span(name, attributes=_otel_attributes(attributes)):
+        yield
+
+
+@contextlib.contextmanager
+def request(name: str, **attributes) -> Iterator[RequestTiming]:
+    """Time one request end to end, and log its stages when it finishes."""
+    timing = RequestTiming(name, {k: v for k, v in attributes.items() if v is not None},
+                           time.perf_counter())
+    token = _current.set(timing)
+    try:
+        with _otel_span(f"{name}.request", attributes):
+            yield timing
+    except BaseException as e:
+        timing.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        total = time.perf_counter() - timing.started
+        metrics.REQUESTS.inc(platform=name, topic=timing.attributes.get("topic"),
+                             outcome="error" if timing.error else "ok")
+        metrics.REQUEST_SECONDS.observe(total, platform=name)
+        logger.info(timing.log_line(total), extra={"timing": timing.as_dict(total)})
+
+
+@contextlib.contextmanager
+def span(stage: str, **attributes) -> Iterator[None]:
+    """Time one stage of the current request (a no-op outside one, bar the span)."""
+    started = time.perf_counter()
+    try:
+        with _otel_span(stage, attributes):
+            yield
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+        timing = _current.get()
+        if timing is not None:
+            timing.add_stage(stage, seconds)
+
+
+def record(stage: str, started_ns: int, ended_ns: int, **attributes):
+    """Add a stage that has already run, timed with ``time.time_ns()``.
+
+    For work done on the request's behalf elsewhere, such as an embedding
+    batched with other requests' in a shared task.
+    """
+    seconds = (ended_ns - started_ns) / 1e9
+    metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+    timing = _current.get()
+    if timing is not None:
+        timing.add_stage(stage, seconds)
+    if otel_trace is not None:
+        tracer = otel_trace.get_tracer(TRACER_NAME)
+        otel_span = tracer.start_span(stage, attributes=_otel_attributes(attributes),
+                                      start_time=started_ns)
+        otel_span.end(end_time=ended_ns)
+
+
+def count(**counts: Optional[int]):
+    """Add counters (tokens, chunks) to the current request and span."""
+    counts = {key: value for key, value in counts.items() if value is not None}
+    timing = _current.get()
+    if timing is not None:
+        timing.add_counts(counts)
+    if otel_trace is not None:
+        otel_span = otel_trace.get_current_span()
+        for key, value in counts.items():
+            otel_span.set_attribute(key, value)
@@ -0,0 +1,234 @@
+"""LLM token usage and cost, per topic, channel and user.
+
+Every answer and summary records its tokens, model, latency and (where
+``genai-prices`` knows the model) cost with a ``UsageTracker``. Records are
+summed in memory per day and (kind, topic, channel, user, model), and the
+sums are added to a SQLite table every ``flush_interval`` seconds, so a busy
+bot writes a handful of rows a minute however many questions it answers.
+
+``report()`` answers "where do the tokens go" for one topic, for the
+``@bot stats`` command: input and output tokens per answer next to the chunks
+and history messages sent with it, which is what ``retrieval_top_k`` and
+thread length trade against.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "./data/usage.db"
+FLUSH_INTERVAL = 60.0
+
+# Bold in each platform's markup; in Discord's, "*" is italics.
+_BOLD = {"slack": "*", "discord": "**"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    user TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cache_read_tokens INTEGER NOT NULL,
+    chunks INTEGER NOT NULL,
+    history_messages INTEGER NOT NULL,
+    latency_ms INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (day, kind, topic, channel, user, model)
+)
+"""
+
+# (day, kind, topic, channel, user, model)
+_Key = Tuple[str, str, str, str, str, str]
+
+
+@dataclass
+class UsageTotals:
+    requests: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    chunks: int = 0
+    history_messages: int = 0
+    latency_ms: int = 0
+    cost: float = 0.0
+
+    def add(self, other: "UsageTotals"):
+        for f in fields(self):
+            setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+
+
+_COLUMNS = [f.name for f in fields(UsageTotals)]
+
+
+def response_cost(result) -> Optional[float]:
+    """What a PydanticAI run cost in USD, or None when the model is not priced."""
+    from pydantic_ai.messages import ModelResponse
+
+    total = 0.0
+    try:
+        for message in result.new_messages():
+            if isinstance(message, ModelResponse):
+                total += float(message.cost().total_price)
+    except Exception:  # unknown model or provider; tokens are still counted
+        return None
+    return total
+
+
+class UsageTracker:
+    def __init__(self, path: Optional[str] = DEFAULT_PATH, flush_interval: float = FLUSH_INTERVAL):
+        """``path`` None keeps usage in memory for the life of the process."""
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending: Dict[_Key, UsageTotals] = {}
+        self._last_flush = time.monotonic()
+        self._flushing: Optional[asyncio.Task] = None
+        # One connection, used from worker threads one at a time.
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    def record(self, kind: str, topic: str, model: str, *, input_tokens: int = 0, output_tokens: int = 0,
+               cache_read_tokens: int = 0, chunks: int = 0, history_messages: int = 0,
+               latency: float = 0.0, cost: Optional[float] = None, error: bool = False):
+        """Count one LLM call. Channel and user come from the current request."""
+        timing = tracing.current()
+        attributes = timing.attributes if timing is not None else {}
+        key = (date.today().isoformat(), kind, topic, str(attributes.get("channel", "")),
+               str(attributes.get("user", "")), model)
+        self._pending.setdefault(key, UsageTotals()).add(UsageTotals(
+            requests=1, errors=int(error), input_tokens=input_tokens, output_tokens=output_tokens,
+            cache_read_tokens=cache_read_tokens, chunks=chunks, history_messages=history_messages,
+            latency_ms=round(latency * 1000), cost=cost or 0.0,
+        ))
+        if time.monotonic() - self._last_flush >= self.flush_interval and self._flushing is None:
+            self._flushing = asyncio.get_running_loop().create_task(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            # The sums stay pending and go out with the next flush.
+            logger.error(f"Could not write usage to {self.path}: {e}")
+        finally:
+            self._flushing = None
+
+    async def flush(self):
+        """Add everything recorded since the last flush to the database."""
+        pending, self._pending = self._pending, {}
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception:
+            for key, totals in pending.items():
+                self._pending.setdefault(key, UsageTotals()).add(totals)
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            path = self.path or ":memory:"
+            if self.path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(_SCHEMA)
+        return self._db
+
+    def _write(self, pending: Dict[_Key, UsageTotals]):
+        columns = ", ".join(_COLUMNS)
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _COLUMNS)
+        with self._db_lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    f"INSERT INTO usage (day, kind, topic, channel, user, model, {columns}) "
+                    f"VALUES ({', '.join('?' * (6 + len(_COLUMNS)))}) "
+                    f"ON CONFLICT (day, kind, topic, channel, user, model) DO UPDATE SET {updates}",
+                    [key + tuple(getattr(totals, c) for c in _COLUMNS) for key, totals in pending.items()],
+                )
+
+    def _query(self, group_by: str, topic: str, since: str) -> List[Tuple]:
+        sums = ", ".join(f"SUM({c})" for c in _COLUMNS)
+        with self._db_lock:
+            return self._connect().execute(
+                f"SELECT {group_by}, {sums} FROM usage WHERE topic = ? AND day >= ? "
+                f"GROUP BY {group_by} ORDER BY SUM(input_tokens + output_tokens) DESC",
+                (topic, since),
+            ).fetchall()
+
+    async def totals(self, topic: str, days: int = 7, by: str = "kind") -> Dict[str, UsageTotals]:
+        """Usage of ``topic`` over the last ``days`` days, per ``by`` (kind, channel, user or model)."""
+        if by not in ("kind", "channel", "user", "model"):
+            raise ValueError(f"Cannot group usage by {by}")
+        await self.flush()
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = await asyncio.to_thread(self._query, by, topic, since)
+        return {row[0]: UsageTotals(*row[1:]) for row in rows}
+
+    async def report(self, topic: str, days: int = 7, top: int = 5, markup: str = "slack") -> str:
+        """The ``stats`` command's text for one topic, in ``markup``: "slack"
+        or "discord". They differ only in bold; mentions are written alike."""
+        bold = _BOLD[markup]
+        kinds = await self.totals(topic, days)
+        if not kinds:
+            return f"No LLM usage recorded for {bold}{topic}{bold} in the last {days} days."
+        lines = [f"LLM usage for {bold}{topic}{bold}, last {days} days:"]
+        for kind, totals in kinds.items():
+            n = totals.requests
+            line = (f"• {n:,} {_noun(kind, n)}: {totals.input_tokens // n:,} input tokens "
+                    f"({_percent(totals.cache_read_tokens, totals.input_tokens)} cached), "
+                    f"{totals.output_tokens // n:,} output tokens and "
+                    f"{totals.latency_ms / n / 1000:.1f}s each")
+            if kind == "answer":
+                line += (f"; {totals.chunks / n:.1f} chunks and "
+                         f"{totals.history_messages / n:.1f} history messages sent per answer")
+            if totals.errors:
+                line += f"; {totals.errors:,} failed"
+            lines.append(line)
+        cost = sum(totals.cost for totals in kinds.values())
+        tokens = sum(totals.input_tokens + totals.output_tokens for totals in kinds.values())
+        lines.append(f"Total: {tokens:,} tokens" + (f", about ${cost:,.2f}" if cost else ""))
+        for by, label, mention in (("channel", "By channel", "<#{}>"), ("user", "By user", "<@{}>")):
+            groups = [(name, totals) for name, totals in (await self.totals(topic, days, by)).items() if name]
+            if groups:
+                lines.append(f"{label}: " + ", ".join(
+                    f"{mention.format(name)} {totals.input_tokens + totals.output_tokens:,}"
+                    for name, totals in groups[:top]
+                ))
+        return "\n".join(lines)
+
+    async def close(self):
+        """Flush what is pending and close the database."""
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def _noun(kind: str, n: int) -> str:
+    if n == 1:
+        return kind
+    return "summaries" if kind == "summary" else f"{kind}s"
+
+
+def _percent(part: int, whole: int) -> str:
+    return f"{100 * part / whole:.0f}%" if whole else "0%"
@@ -1,8 +1,10 @@
-from langchain.vectorstores.base import VectorStore
-from langchain.embeddings.base import Embeddings
-from langchain_chroma.vectorstores import Chroma
-from langchain_community.vectorstores import FAISS
+from langchain_core.vectorstores import VectorStore
+from langchain_core.embeddings import Embeddings
 
+# The backends (langchain_chroma, faiss and langchain_community) are imported
+# where they are used, so a bot only pays for loading the one it is set up with.
+
+import re
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional
 
@@ -14,10 +16,32 @@ class VectorStoreFactory(ABC):
         pass
 
     @abstractmethod
-    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str, metadatas: Optional[List[Dict]] = None) -> VectorStore:
-        """Create a vector store from texts"""
+    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str,
+                          metadatas: Optional[List[Dict]] = None,
+                          ids: Optional[List[str]] = None) -> VectorStore:
+        """Create a vector store from texts.
+
+        ``ids`` names each text, so it can later be deleted or replaced.
+        """
         pass
 
+    def update_metadata(self, store: VectorStore, ids: List[str], metadatas: List[Dict]):
+        """Set keys in the metadata of stored texts, keeping their vectors
+        and their other keys."""
+        raise NotImplementedError(f"{type(self).__name__} cannot update metadata in place")
+
+
+def _update_faiss_metadata(store: VectorStore, ids: List[str], metadatas: List[Dict]):
+    from .mapped_faiss import MappedFAISS
+
+    if isinstance(store, MappedFAISS):
+        store._make_private()
+    for id_, metadata in zip(ids, metadatas):
+        document = store.docstore.search(id_)
+        if isinstance(document, str):  # the docstore's "not found" message
+            raise KeyError(id_)
+        document.metadata = {**document.metadata, **metadata}
+
 class ChromaVectorStoreFactory(VectorStoreFactory):
     # Cosine is the right metric for text embeddings (OpenAI's are normalised),
     # and it is what keeps relevance scores in a usable 0..1 range. Chroma
@@ -26,24 +50,118 @@ class ChromaVectorStoreFactory(VectorStoreFactory):
     COLLECTION_METADATA = {"hnsw:space": "cosine"}
 
     def create_empty_store(self, collection_name: str, embeddings: Embeddings) -> VectorStore:
+        from langchain_chroma.vectorstores import Chroma
+
         return Chroma(
             collection_name=collection_name,
             embedding_function=embeddings,
             collection_metadata=self.COLLECTION_METADATA,
         )
 
-    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str, metadatas: Optional[List[Dict]] = None) -> VectorStore:
+    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str,
+                          metadatas: Optional[List[Dict]] = None,
+                          ids: Optional[List[str]] = None) -> VectorStore:
+        from langchain_chroma.vectorstores import Chroma
+
         return Chroma.from_texts(
             texts,
             embeddings,
             collection_name=collection_name,
             metadatas=metadatas,
+            ids=ids,
             collection_metadata=self.COLLECTION_METADATA,
         )
 
+    def update_metadata(self, store: VectorStore, ids: List[str], metadatas: List[Dict]):
+        # Chroma merges the given keys into the stored metadata.
+        store._collection.update(ids=ids, metadatas=metadatas)
+
 class FAISSVectorStoreFactory(VectorStoreFactory):
+    """In-process FAISS.
+
+    With ``index_dir`` set, each scan's index is built to disk once and
+    memory-mapped, so processes serving the same topic share one copy of it
+    and a process that finds a matching build loads it without embedding.
+    """
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.index_dir = index_dir
+
+    def create_empty_store(self, collection_name: str, embeddings: Embeddings) -> VectorStore:
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+
+        # FAISS.from_texts([]) fails: a flat index needs its dimension up
+        # front, and the only way to learn it is to embed something.
+        dimension = len(embeddings.embed_query("dimension probe"))
+        return FAISS(embeddings, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+
+    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str,
+                          metadatas: Optional[List[Dict]] = None,
+                          ids: Optional[List[str]] = None) -> VectorStore:
+        from langchain_community.vectorstores import FAISS
+        from .mapped_faiss import build_or_load
+
+        if self.index_dir and texts:
+            # Builds are keyed by their contents, not the (timestamped)
+            # collection name, so another process's scan finds this one;
+            # they are grouped by the name's topic part.
+            topic = re.sub(r"_\d+$", "", collection_name)
+            return build_or_load(self.index_dir, texts, embeddings, metadatas, ids, name=topic)
+        return FAISS.from_texts(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def update_metadata(self, store: VectorStore, ids: List[str], metadatas: List[Dict]):
+        _update_faiss_metadata(store, ids, metadatas)
+
+
+class CompactFAISSVectorStoreFactory(VectorStoreFactory):
+    """FAISS over quantized vectors, for topics too large to hold as float32.
+
+    ``quantization`` is "sq8" (int8 scalar codes, 4x smaller) or "pq"
+    (product quantization, about 64x smaller). ``dimensions`` truncates
+    Matryoshka embeddings (text-embedding-3-*) before indexing. ``rescore``
+    keeps a second, more precise copy ("sq8", "fp16" or "flat") that the top
+    ``rescore_factor * k`` candidates are re-ranked against.
+    """
+
+    def __init__(self,
+                 quantization: str = "sq8",
+                 dimensions: Optional[int] = None,
+                 rescore: Optional[str] = None,
+                 rescore_factor: int = 4):
+        self.quantization = quantization
+        self.dimensions = dimensions
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+
+    def _store(self, embeddings: Embeddings) -> VectorStore:
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        from .compact_index import CompactIndex, TruncatedEmbeddings
+
+        if self.dimensions:
+            embeddings = TruncatedEmbeddings(embeddings, self.dimensions)
+        index = CompactIndex(self.quantization, self.rescore, self.rescore_factor)
+        # L2 over normalised vectors ranks exactly as cosine does, and a
+        # squared distance d is a cosine of 1 - d/2, which keeps relevance
+        # scores (and so retrieval_score_threshold) on the same scale as Chroma.
+        return FAISS(
+            embeddings, index, InMemoryDocstore(), {},
+            normalize_L2=True,
+            relevance_score_fn=lambda distance: max(0.0, 1.0 - distance / 2),
+        )
+
     def create_empty_store(self, collection_name: str, embeddings: Embeddings) -> VectorStore:
-        return FAISS.from_texts([], embeddings)
+        return self._store(embeddings)
+
+    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str,
+                          metadatas: Optional[List[Dict]] = None,
+                          ids: Optional[List[str]] = None) -> VectorStore:
+        store = self._store(embeddings)
+        if texts:
+            store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
 
-    def create_from_texts(self, texts: List[str], embeddings: Embeddings, collection_name: str, metadatas: Optional[List[Dict]] = None) -> VectorStore:
-        return FAISS.from_texts(texts, embeddings, metadatas=metadatas)
\ No newline at end of file
+    def update_metadata(self, store: VectorStore, ids: List[str], metadatas: List[Dict]):
+        _update_faiss_metadata(store, ids, metadatas)
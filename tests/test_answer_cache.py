@@ -0,0 +1,94 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+from pydantic_ai.messages import ModelResponse, TextPart
+from pydantic_ai.models.function import FunctionModel
+
+from innieme import answer_cache
+from innieme.answer_cache import AnswerCache
+
+
+class WordEmbeddings(Embeddings):
+    WORDS = ["refund", "invoice", "deploy"]
+
+    def _vector(self, text):
+        return [float(w in text) for w in self.WORDS] + [0.1]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def test_matches_similar_questions_of_the_same_generation_and_role():
+    cache = AnswerCache(threshold=0.9)
+    cache.put("how do refunds work?", [1, 0, 0.1], "Within 30 days.", generation=1, role="r")
+
+    assert cache.get([1, 0, 0.12], 1, "r") == "Within 30 days."
+    assert cache.get([0, 1, 0.1], 1, "r") is None
+    assert cache.get([1, 0, 0.1], 1, "another role") is None
+    # A stale entry is dropped, not just skipped.
+    assert cache.get([1, 0, 0.1], 2, "r") is None
+    assert len(cache) == 0
+
+
+def test_entries_expire_and_are_bounded(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(threshold=0.9, ttl=60, max_entries=2)
+    for i in range(3):
+        cache.put(f"q{i}", [1, i, 0], f"a{i}", 1, "r")
+    assert len(cache) == 2
+    assert cache.get([1, 0, 0], 1, "r") != "a0"
+
+    now[0] += 61
+    assert cache.get([1, 1, 0], 1, "r") is None
+    assert cache.clear() == 0
+
+
+@pytest.mark.asyncio
+async def test_engine_answers_repeated_first_questions_from_the_cache(tmp_path, monkeypatch):
+    from innieme.conversation_engine import ConversationEngine
+    from innieme.discord_bot_config import DiscordBotConfig, OutieConfig, TopicConfig
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import ExistingEmbeddingsFactory
+    from innieme.knowledge_manager import KnowledgeManager
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test_key")
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "refunds.md").write_text("Refund requests are answered within a week.")
+    bot = DiscordBotConfig(discord_token="t", embeddings_api_key="k", llm_api_key="k",
+                           embedding_model="fake", outies=[])
+    outie = OutieConfig(outie_id=1, topics=[], bot=bot)
+    topic = TopicConfig(name="cache", role="Helpful.", docs_dir=str(tmp_path / "docs"), channels=[],
+                        outie=outie, answer_cache_threshold=0.95)
+    processor = DocumentProcessor("cache", topic.docs_dir, ExistingEmbeddingsFactory(WordEmbeddings()),
+                                  FAISSVectorStoreFactory())
+    await processor.scan_and_vectorize()
+    engine = ConversationEngine(topic, processor, KnowledgeManager(summaries_path=str(tmp_path / "s")),
+                                answer_cache=AnswerCache(topic.answer_cache_threshold))
+
+    calls = []
+
+    def answer(messages, info):
+        calls.append(messages)
+        return ModelResponse(parts=[TextPart(f"answer {len(calls)}")])
+
+    async def ask(query, history=()):
+        context = [*history, {"role": "user", "content": query}]
+        return await engine.process_query(query, context)
+
+    with engine.agent.override(model=FunctionModel(answer)):
+        assert await ask("refund timing?") == "answer 1"
+        # Same meaning, new thread: no LLM call.
+        assert await ask("when is my refund due?") == "answer 1"
+        assert len(calls) == 1
+        # A follow-up depends on its thread, and is never served from cache.
+        follow_up = [{"role": "user", "content": "refund timing?"}, {"role": "assistant", "content": "answer 1"}]
+        assert await ask("refund timing?", follow_up) == "answer 2"
+        # A different question misses.
+        assert await ask("how do I deploy?") == "answer 3"
+        # A rescan makes the cached answers stale.
+        await processor.scan_and_vectorize()
+        assert await ask("refund timing?") == "answer 4"
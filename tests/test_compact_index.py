@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from innieme.compact_index import CompactIndex, TruncatedEmbeddings
+from innieme.vector_store_factory import CompactFAISSVectorStoreFactory
+
+
+def _unit_vectors(n, d, seed=0):
+    """Unit vectors around 40 shared centres, clustered as text embeddings are."""
+    centres = np.random.default_rng(42).standard_normal((40, d))
+    rng = np.random.default_rng(seed)
+    x = centres[rng.integers(0, len(centres), n)] + 0.6 * rng.standard_normal((n, d))
+    x = x.astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _recall(index, corpus, queries, k=10):
+    exact = np.argsort(((queries[:, None, :] - corpus[None, :, :]) ** 2).sum(-1), axis=1)[:, :k]
+    _, found = index.search(queries, k)
+    return np.mean([len(set(e) & set(f)) / k for e, f in zip(exact, found)])
+
+
+@pytest.mark.parametrize("quantization,rescore,min_recall", [
+    ("sq8", None, 0.9),
+    ("pq", "flat", 0.9),
+])
+def test_recall_against_exact_search(quantization, rescore, min_recall):
+    corpus = _unit_vectors(2000, 64)
+    queries = _unit_vectors(20, 64, seed=1)
+    index = CompactIndex(quantization, rescore=rescore, rescore_factor=8)
+    index.add(corpus)
+    assert _recall(index, corpus, queries) >= min_recall
+
+
+def test_rescoring_recovers_product_quantization_recall():
+    corpus = _unit_vectors(2000, 64)
+    queries = _unit_vectors(20, 64, seed=1)
+    plain, rescored = CompactIndex("pq"), CompactIndex("pq", rescore="fp16", rescore_factor=8)
+    plain.add(corpus)
+    rescored.add(corpus)
+    assert _recall(rescored, corpus, queries) > _recall(plain, corpus, queries)
+    assert plain.memory_bytes() < 2000 * 64 * 4 / 8
+
+
+def test_small_first_batch_waits_for_a_training_sample():
+    first, rest = _unit_vectors(5, 32), _unit_vectors(1200, 32, seed=2)
+    index = CompactIndex("pq", rescore="fp16")
+    index.add(first)
+    assert not index.is_trained
+    _, found = index.search(first[:1], 1)
+    assert found[0][0] == 0
+
+    index.add(rest)
+    assert index.is_trained and index.ntotal == 1205
+    # Trained on everything, with the first vectors still first.
+    assert index.base.sa_code_size() < 32
+    assert np.allclose(index.reconstruct(0), first[0], atol=1e-2)
+    corpus = np.vstack([first, rest])
+    assert _recall(index, corpus, _unit_vectors(20, 32, seed=1)) >= 0.9
+
+
+class WordEmbeddings(Embeddings):
+    WORDS = ["cars", "plants", "boats", "trains"]
+
+    def _vector(self, text):
+        v = [float(w in text) for w in self.WORDS] + [0.1] * 4
+        return v
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def test_store_searches_deletes_and_truncates():
+    factory = CompactFAISSVectorStoreFactory("sq8", dimensions=4, rescore="flat")
+    texts = ["about cars", "about plants", "about boats"]
+    store = factory.create_from_texts(
+        texts, WordEmbeddings(), "c",
+        metadatas=[{"source": t} for t in texts], ids=["a", "b", "c"],
+    )
+    assert store.index.d == 4
+    assert store.similarity_search("cars", k=1)[0].page_content == "about cars"
+    (doc, score), = store.similarity_search_with_relevance_scores("plants", k=1)
+    assert doc.page_content == "about plants" and score == pytest.approx(1.0, abs=0.02)
+
+    store.delete(ids=["a"])
+    assert store.similarity_search("boats", k=1)[0].page_content == "about boats"
+    assert store.similarity_search("cars", k=3)[0].page_content != "about cars"
+
+
+def test_empty_store_accepts_later_additions():
+    store = CompactFAISSVectorStoreFactory().create_empty_store("c", WordEmbeddings())
+    assert store.similarity_search("cars", k=2) == []
+    store.add_texts(["about cars"])
+    assert store.similarity_search("cars", k=1)[0].page_content == "about cars"
+
+
+def test_truncated_embeddings_are_renormalised():
+    vector = TruncatedEmbeddings(WordEmbeddings(), 2).embed_query("cars plants")
+    assert np.linalg.norm(vector) == pytest.approx(1.0)
+    assert len(vector) == 2
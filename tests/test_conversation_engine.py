@@ -188,3 +188,122 @@ async def test_engine_falls_back_to_defaults_for_older_configs():
     processor.search_documents.assert_awaited_once_with(
         "q", top_k=5, score_threshold=None
     )
+
+
+def _capturing_model(seen):
+    from pydantic_ai.messages import ModelResponse, TextPart
+    from pydantic_ai.models.function import FunctionModel
+
+    def capture(messages, info):
+        seen.append(list(messages))
+        return ModelResponse(parts=[TextPart(f"answer {len(seen)}")])
+
+    return FunctionModel(capture)
+
+
+@pytest.mark.asyncio
+async def test_cached_layout_keeps_system_prompt_static(topic_config, tmp_path):
+    """The cached layout sends only the role as instructions; the rest follows"""
+    from unittest.mock import AsyncMock, Mock
+
+    topic_config.outie.bot.prompt_layout = "cached"
+    processor = Mock()
+    processor.search_documents = AsyncMock(return_value=[
+        Mock(page_content="Refunds within 30 days.", metadata={"source": "policy.md"}),
+    ])
+    engine = ConversationEngine(
+        topic=topic_config,
+        document_processor=processor,
+        knowledge_manager=KnowledgeManager(summaries_path=str(tmp_path / "summaries")),
+    )
+
+    seen = []
+    with engine.agent.override(model=_capturing_model(seen)):
+        await engine.process_query(
+            query="And for sale items?",
+            context_messages=[
+                {"role": "user", "content": "What is the refund policy?"},
+                {"role": "assistant", "content": "30 days."},
+                {"role": "user", "content": "And for sale items?"},
+            ],
+        )
+
+    messages = seen[-1]
+    request = messages[-1]
+    assert request.instructions == "You are a helpful assistant."
+    content = request.parts[-1].content
+    assert content[-1] == "And for sale items?"
+    assert "[source: policy.md]" in content[0]
+    # History arrives as real messages, not text.
+    assert messages[0].parts[0].content == "What is the refund policy?"
+    assert messages[1].parts[0].content == "30 days."
+
+
+@pytest.mark.asyncio
+async def test_message_history_is_appended_per_turn(conversation_engine):
+    """Each turn extends the thread's history instead of re-rendering it"""
+    from innieme.conversation_engine import to_model_messages
+
+    history = to_model_messages([{"role": "user", "content": "Hello"},
+                                 {"role": "assistant", "content": "Hi there!"}])
+    seen = []
+    with conversation_engine.agent.override(model=_capturing_model(seen)):
+        first = await conversation_engine.process_query(
+            "Tell me more.", context_messages=[], message_history=history)
+        await conversation_engine.process_query(
+            "And then?", context_messages=[], message_history=history)
+
+    assert len(history) == 6
+    assert history[3].parts[0].content == first
+    # The second request resent the first turn unchanged as its prefix.
+    assert seen[1][:4] == history[:4]
+    # History carries the question only; documents stay out of it.
+    assert history[2].parts[0].content == "Tell me more."
+    assert "Conversation history" not in (seen[1][-1].instructions or "")
+
+
+def test_history_is_cut_back_by_half_and_opens_with_a_request():
+    from pydantic_ai.messages import ModelRequest
+    from innieme.conversation_engine import MAX_HISTORY_MESSAGES, _append_turn
+
+    history = []
+    for i in range(MAX_HISTORY_MESSAGES // 2 + 1):
+        _append_turn(history, f"q{i}", f"a{i}")
+    assert len(history) <= MAX_HISTORY_MESSAGES // 2
+    assert isinstance(history[0], ModelRequest)
+    assert history[-1].parts[0].content == f"a{MAX_HISTORY_MESSAGES // 2}"
+
+
+def test_cache_point_marks_the_last_question():
+    from pydantic_ai.messages import CachePoint
+    from innieme.conversation_engine import to_model_messages, _with_cache_point
+
+    history = to_model_messages([{"role": "user", "content": "q"},
+                                 {"role": "assistant", "content": "a"}])
+    marked = _with_cache_point(history)
+    assert isinstance(marked[0].parts[0].content[-1], CachePoint)
+    # The stored history is not modified.
+    assert history[0].parts[0].content == "q"
+
+
+def test_cache_settings_are_provider_specific():
+    from innieme.conversation_engine import _cache_settings
+    assert _cache_settings("anthropic:claude-sonnet-5", "k") == {"anthropic_cache_instructions": True}
+    assert _cache_settings("openai:gpt-5.6-terra", "k") == {"openai_prompt_cache_key": "k"}
+    assert _cache_settings("test", "k") == {}
+
+
+def test_format_chunk_names_every_file_a_merged_chunk_came_from():
+    from innieme.conversation_engine import _format_chunk
+    from unittest.mock import Mock
+    doc = Mock(page_content="Drain, then reboot.",
+               metadata={"source": "/docs/runbook.pdf", "also_in": "/docs/runbook.md\n/old/runbook.docx"})
+    assert _format_chunk(doc).startswith("[source: runbook.pdf; also in: runbook.md, runbook.docx]")
+
+
+def test_format_chunk_includes_page_and_section():
+    from innieme.conversation_engine import _format_chunk
+    from unittest.mock import Mock
+    doc = Mock(page_content="Reboot it.",
+               metadata={"source": "/docs/manual.pdf", "page": 12, "heading": "Runbook > Restart"})
+    assert _format_chunk(doc).startswith("[source: manual.pdf, page 12, section: Runbook > Restart]")
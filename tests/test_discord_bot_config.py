@@ -110,6 +110,7 @@ class TestDiscordRetrievalAndExclusionConfig:
         assert c.retrieval_score_threshold is None
         assert c.embeddings_model_name is None
         assert c.cache_dir is None
+        assert c.prompt_layout == "inline"
 
     def test_retrieval_top_k_must_be_positive(self):
         for bad in (0, -1):
@@ -126,6 +127,11 @@ class TestDiscordRetrievalAndExclusionConfig:
             c = DiscordBotConfig(**self._base(retrieval_score_threshold=good))
             assert c.retrieval_score_threshold == good
 
+    def test_prompt_layout_must_be_supported(self):
+        assert DiscordBotConfig(**self._base(prompt_layout="cached")).prompt_layout == "cached"
+        with pytest.raises(ValidationError):
+            DiscordBotConfig(**self._base(prompt_layout="sideways"))
+
     def test_bot_level_docs_exclude_raises_rather_than_being_ignored(self):
         """Misplacing it must fail loudly, not parse and silently do nothing"""
         with pytest.raises(ValidationError) as exc_info:
@@ -145,3 +151,24 @@ class TestDiscordRetrievalAndExclusionConfig:
             name="t2", role="r", docs_dir=str(docs),
             channels=[ChannelConfig(guild_id=1, channel_id=3)],
         ).docs_exclude is None
+
+    def test_mmr_settings_are_per_topic_and_validated(self, tmp_path):
+        docs = tmp_path / "docs"
+        docs.mkdir()
+        base = dict(name="t", role="r", docs_dir=str(docs),
+                    channels=[ChannelConfig(guild_id=1, channel_id=2)])
+        topic = TopicConfig(**base, mmr_lambda=0.6, mmr_fetch_k=30)
+        assert (topic.mmr_lambda, topic.mmr_fetch_k) == (0.6, 30)
+        assert TopicConfig(**base).mmr_lambda is None
+        for bad in (dict(mmr_lambda=1.5), dict(mmr_lambda=float("nan")), dict(mmr_fetch_k=0)):
+            with pytest.raises(ValidationError):
+                TopicConfig(**base, **bad)
+
+    def test_watch_is_off_by_default_and_debounce_validated(self, tmp_path):
+        base = dict(name="t", role="r", docs_dir=str(tmp_path),
+                    channels=[ChannelConfig(guild_id=1, channel_id=2)])
+        topic = TopicConfig(**base)
+        assert (topic.watch, topic.watch_debounce) == (False, 2.0)
+        assert TopicConfig(**base, watch=True, watch_debounce=0.5).watch
+        with pytest.raises(ValidationError):
+            TopicConfig(**base, watch_debounce=-1)
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from innieme import doc_watcher
+from innieme.doc_watcher import DocumentWatcher, diff_snapshots, snapshot
+
+
+def test_snapshot_diff_reports_created_modified_and_deleted(tmp_path):
+    (tmp_path / "kept.md").write_text("same")
+    (tmp_path / "edited.md").write_text("before")
+    (tmp_path / "gone.md").write_text("bye")
+    (tmp_path / ".cache").mkdir()
+    (tmp_path / ".cache" / "model.bin").write_text("x")
+    before = snapshot(str(tmp_path))
+
+    (tmp_path / "edited.md").write_text("after, and longer")
+    (tmp_path / "gone.md").unlink()
+    (tmp_path / "new.md").write_text("hi")
+    changed = diff_snapshots(before, snapshot(str(tmp_path)))
+
+    assert {p.rsplit("/", 1)[-1] for p in changed} == {"edited.md", "gone.md", "new.md"}
+
+
+def test_snapshot_prunes_excluded_directories(tmp_path, monkeypatch):
+    from innieme.document_processor import DocumentProcessor
+
+    (tmp_path / "notes.md").write_text("kept")
+    (tmp_path / "CLAUDE.md").write_text("excluded")
+    (tmp_path / "archive").mkdir()
+    (tmp_path / "archive" / "old.md").write_text("excluded")
+    processor = DocumentProcessor("t", str(tmp_path), None, None, docs_exclude=["CLAUDE.md", "archive/*"])
+    listed = []
+    real_scandir = doc_watcher.os.scandir
+    monkeypatch.setattr(doc_watcher.os, "scandir", lambda path: listed.append(path) or real_scandir(path))
+
+    files = snapshot(str(tmp_path), processor.is_excluded_path)
+
+    assert {p.rsplit("/", 1)[-1] for p in files} == {"notes.md"}
+    assert listed == [str(tmp_path)]
+
+
+@pytest.mark.asyncio
+async def test_burst_of_changes_is_delivered_as_one_batch(tmp_path):
+    batches = []
+    delivered = asyncio.Event()
+
+    async def on_change(paths):
+        batches.append(paths)
+        delivered.set()
+
+    watcher = DocumentWatcher(str(tmp_path), on_change, debounce=0.2)
+    task = asyncio.create_task(watcher._deliver())
+    for name in ("a.md", "b.md", "a.md", ".hidden.md"):
+        watcher._add([str(tmp_path / name)])
+        await asyncio.sleep(0.05)
+    assert not batches  # still inside the quiet period
+
+    await asyncio.wait_for(delivered.wait(), timeout=2)
+    watcher._stop.set()
+    await asyncio.wait_for(task, timeout=2)
+
+    assert batches == [{str(tmp_path / "a.md"), str(tmp_path / "b.md")}]
+
+
+@pytest.mark.asyncio
+async def test_polling_fallback_sees_new_files(tmp_path):
+    seen = asyncio.Event()
+    batches = []
+
+    async def on_change(paths):
+        batches.append(paths)
+        seen.set()
+
+    watcher = DocumentWatcher(
+        str(tmp_path), on_change, debounce=0.05, poll_interval=0.05, force_polling=True
+    )
+    watcher.start()
+    await asyncio.sleep(0.1)
+    (tmp_path / "new.md").write_text("hello")
+    await asyncio.wait_for(seen.wait(), timeout=5)
+    await watcher.stop()
+
+    assert batches == [{str(tmp_path / "new.md")}]
+
+
+@pytest.mark.asyncio
+async def test_failing_update_does_not_stop_the_watcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_watcher, "MAX_BATCH_DELAY_SECONDS", 1.0)
+    calls = []
+
+    async def on_change(paths):
+        calls.append(paths)
+        raise RuntimeError("embeddings down")
+
+    watcher = DocumentWatcher(str(tmp_path), on_change, debounce=0.01)
+    task = asyncio.create_task(watcher._deliver())
+    watcher._add([str(tmp_path / "a.md")])
+    await asyncio.sleep(0.1)
+    watcher._add([str(tmp_path / "b.md")])
+    await asyncio.sleep(0.1)
+    watcher._stop.set()
+    await asyncio.wait_for(task, timeout=2)
+
+    assert len(calls) == 2
@@ -62,8 +62,9 @@ def document_processor(test_docs_dir) -> DocumentProcessor:
 @pytest.mark.asyncio
 async def test_extract_from_txt(document_processor, sample_txt_file):
     """Test text extraction from a TXT file"""
-    text = await document_processor._extract_from_txt(str(sample_txt_file))
-    assert text is not None
+    segments = await document_processor._extract_text(str(sample_txt_file))
+    assert segments is not None
+    text = "".join(segment.text for segment in segments)
     assert "This is a test document" in text
     assert "It has multiple lines" in text
 
@@ -173,6 +174,34 @@ async def test_search_documents_falls_back_when_scoring_unavailable(document_pro
     results = await document_processor.search_documents("q", top_k=5, score_threshold=0.5)
     assert results == [doc]
 
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("score_threshold", [None, 0.5])
+async def test_unbatched_faiss_search_embeds_the_query_off_the_event_loop(test_docs_dir, score_threshold):
+    """Without batching, the query is still embedded in a worker thread"""
+    import threading
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+    class ThreadRecordingEmbeddings(FakeEmbeddings):
+        threads = []
+
+        def embed_query(self, text):
+            self.threads.append(threading.current_thread())
+            return super().embed_query(text)
+
+    (test_docs_dir / "cars.md").write_text("Notes about cars.")
+    (test_docs_dir / "plants.md").write_text("Notes about plants.")
+    processor = DocumentProcessor("faiss", str(test_docs_dir),
+                                  ExistingEmbeddingsFactory(ThreadRecordingEmbeddings()),
+                                  FAISSVectorStoreFactory(), query_batch_window=0)
+    await processor.scan_and_vectorize()
+
+    docs = await processor.search_documents("cars", top_k=1, score_threshold=score_threshold)
+
+    assert [doc.page_content for doc in docs] == ["Notes about cars."]
+    assert ThreadRecordingEmbeddings.threads
+    assert threading.main_thread() not in ThreadRecordingEmbeddings.threads
+
 class TestDocsExclude:
     """Scanning skips files that are instructions rather than content."""
 
@@ -228,6 +257,38 @@ class TestDocsExclude:
         sources = {os.path.basename(d.metadata["source"]) for d in results}
         assert sources == {"Northwind.md"}
 
+    def test_walk_prunes_excluded_and_hidden_directories(self, tmp_path, monkeypatch):
+        (tmp_path / "keep.md").write_text("kept")
+        (tmp_path / "notes.bin").write_bytes(b"\x00")
+        for hidden in (".cache", ".git"):
+            (tmp_path / hidden).mkdir()
+            (tmp_path / hidden / "model.txt").write_text("weights")
+        (tmp_path / "archive" / "2019").mkdir(parents=True)
+        (tmp_path / "archive" / "2019" / "old.md").write_text("old")
+        (tmp_path / "current").mkdir()
+        (tmp_path / "current" / "CLAUDE.md").write_text("instructions")
+        p = self._processor(tmp_path, exclude=["CLAUDE.md", "archive/*"])
+
+        listed = []
+        real_scandir = os.scandir
+        monkeypatch.setattr(os, "scandir", lambda d: listed.append(d) or real_scandir(d))
+        listing = p._find_documents()
+
+        assert listing.files == [str(tmp_path / "keep.md")]
+        assert listing.excluded == [str(tmp_path / "current" / "CLAUDE.md")]
+        assert listing.pruned == [str(tmp_path / "archive")]
+        assert sorted(listed) == [str(tmp_path), str(tmp_path / "current")]
+
+    @pytest.mark.asyncio
+    async def test_pruned_directories_are_reported(self, tmp_path):
+        (tmp_path / "Northwind.md").write_text("Northwind notes.")
+        (tmp_path / "archive").mkdir()
+        (tmp_path / "archive" / "old.md").write_text("Old notes.")
+        p = self._processor(tmp_path, exclude=["archive/"])
+        response = await p.scan_and_vectorize()
+        assert "1 out of 1 references" in response
+        assert "(1 directory excluded; see logs)" in response
+
     @pytest.mark.asyncio
     async def test_nothing_reported_when_no_exclusions_match(self, tmp_path):
         (tmp_path / "Northwind.md").write_text("Northwind notes.")
@@ -289,3 +350,250 @@ async def test_empty_files_are_not_treated_as_failures(document_processor, test_
 
     assert "no documents found to process" in result
     assert document_processor.vectorstore is not None
+
+
+class TestChunkDedup:
+    """Copies of the same content are embedded once, with every source kept."""
+
+    def test_near_duplicate_text_is_merged(self):
+        from innieme.chunk_dedup import ChunkDeduplicator
+        text = " ".join(f"word{i}" for i in range(150))
+        dedup = ChunkDeduplicator()
+        assert dedup.add(text, "manual-v1.pdf")
+        assert not dedup.add(text.upper(), "manual-v1.md")  # exact after normalising
+        assert not dedup.add(text.replace("word75", "word75b"), "manual-v2.pdf")
+        assert len(dedup.chunks) == 1
+        assert dedup.chunks[0].also_in == ["manual-v1.md", "manual-v2.pdf"]
+        assert dedup.merged == 2
+
+    def test_distinct_text_is_kept(self):
+        from innieme.chunk_dedup import ChunkDeduplicator
+        dedup = ChunkDeduplicator()
+        dedup.add(" ".join(f"alpha{i}" for i in range(100)), "a.md")
+        dedup.add(" ".join(f"beta{i}" for i in range(100)), "b.md")
+        assert len(dedup.chunks) == 2
+        assert dedup.merged == 0
+
+    @pytest.mark.asyncio
+    async def test_scan_stores_one_chunk_with_all_sources(self, document_processor, test_docs_dir):
+        body = "The restart procedure is to drain the node, then reboot it."
+        (test_docs_dir / "runbook.md").write_text(body)
+        (test_docs_dir / "runbook-copy.txt").write_text(body)
+        document_processor.dedup_chunks = True
+
+        result = await document_processor.scan_and_vectorize()
+
+        assert "1 chunks created from 2 out of 2 references" in result
+        assert "1 duplicate chunks merged" in result
+        [doc] = await document_processor.search_documents("restart", top_k=5)
+        sources = {os.path.basename(doc.metadata["source"])} | {
+            os.path.basename(p) for p in doc.metadata["also_in"].split("\n")
+        }
+        assert sources == {"runbook.md", "runbook-copy.txt"}
+
+    @pytest.mark.asyncio
+    async def test_dedup_is_opt_in(self, document_processor, test_docs_dir):
+        body = "Identical text in two files."
+        (test_docs_dir / "a.md").write_text(body)
+        (test_docs_dir / "b.md").write_text(body)
+        result = await document_processor.scan_and_vectorize()
+        assert "2 chunks created" in result
+
+
+class TestMMR:
+    """MMR trades a little relevance for chunks that are not copies of each other."""
+
+    def test_mmr_select_skips_redundant_candidates(self):
+        from innieme.retrieval import mmr_select
+        query = [1.0, 0.0]
+        candidates = [[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]]
+        assert mmr_select(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+        assert mmr_select(query, candidates, 2, lambda_mult=0.3) == [0, 2]
+
+    def test_mmr_select_handles_no_candidates(self):
+        from innieme.retrieval import mmr_select
+        assert mmr_select([1.0, 0.0], [], 3, 0.5) == []
+
+    @pytest.mark.asyncio
+    async def test_search_uses_mmr_when_lambda_is_set(self, test_docs_dir):
+        class AxisEmbeddings(Embeddings):
+            def _vec(self, text):
+                if "trucks" in text:
+                    return [0.98, 0.2, 0.0]
+                if "cars" in text:
+                    return [1.0, 0.0, 0.0]
+                return [0.7, 0.0, 0.7]
+
+            def embed_documents(self, texts):
+                return [self._vec(t) for t in texts]
+
+            def embed_query(self, text):
+                return [1.0, 0.0, 0.0]
+
+        (test_docs_dir / "cars.md").write_text("All about cars.")
+        (test_docs_dir / "trucks.md").write_text("All about cars and trucks.")
+        (test_docs_dir / "boats.md").write_text("All about boats.")
+        processor = DocumentProcessor(
+            "testing", str(test_docs_dir),
+            ExistingEmbeddingsFactory(AxisEmbeddings()),
+            ChromaVectorStoreFactory(),
+            mmr_lambda=0.3, mmr_fetch_k=3,
+        )
+        await processor.scan_and_vectorize()
+
+        results = await processor.search_documents("q", top_k=2)
+
+        names = [os.path.basename(d.metadata["source"]) for d in results]
+        assert names[0] == "cars.md"
+        assert "boats.md" in names  # the near-copy "trucks" chunk was passed over
+
+
+class TestSegments:
+    """Chunks carry the page or heading they came from."""
+
+    def test_markdown_splits_on_headings_with_their_path(self):
+        from innieme.extractors import split_markdown
+        segments = list(split_markdown(
+            "Intro line.\n# Operations\nOverview.\n## Runbook\nRestart it.\n"
+            "```\n# not a heading\n```\n# Billing\nInvoices.\n".splitlines(keepends=True)
+        ))
+        assert [s.metadata.get("heading") for s in segments] == [
+            None, "Operations", "Operations > Runbook", "Billing",
+        ]
+        assert segments[2].metadata["section"] == "Operations"
+        assert "# not a heading" in segments[2].text
+
+    @pytest.mark.asyncio
+    async def test_docx_splits_on_heading_styles(self, document_processor, test_docs_dir):
+        from innieme.extractors import extract_docx
+        import docx
+        path = test_docs_dir / "guide.docx"
+        doc = docx.Document()
+        doc.add_paragraph("Preamble.")
+        doc.add_heading("Runbook", level=1)
+        doc.add_paragraph("Drain the node.")
+        doc.add_heading("Restart", level=2)
+        doc.add_paragraph("Reboot it.")
+        doc.save(str(path))
+
+        segments = list(extract_docx(str(path)))
+
+        assert [s.metadata.get("heading") for s in segments] == [
+            None, "Runbook", "Runbook > Restart",
+        ]
+        assert "Reboot it." in segments[2].text
+
+    @pytest.mark.asyncio
+    async def test_chunks_carry_heading_metadata_and_can_be_filtered(
+        self, document_processor, test_docs_dir
+    ):
+        (test_docs_dir / "ops.md").write_text(
+            "# Runbook\nRestart the cars service.\n# Billing\nInvoices for plants.\n"
+        )
+        await document_processor.scan_and_vectorize()
+
+        results = await document_processor.search_documents(
+            "anything", top_k=5, filter={"section": "Billing"}
+        )
+
+        assert len(results) == 1
+        assert results[0].metadata["heading"] == "Billing"
+        assert "Invoices" in results[0].page_content
+
+
+class TestIncrementalUpdate:
+    """update_files replaces only the chunks of the paths that changed."""
+
+    @staticmethod
+    def _sources(processor):
+        stored = processor.vectorstore.get()
+        return sorted(os.path.basename(m["source"]) for m in stored["metadatas"])
+
+    @pytest.mark.asyncio
+    async def test_modified_added_and_deleted_files(self, document_processor, test_docs_dir):
+        (test_docs_dir / "cars.md").write_text("Notes about cars.")
+        (test_docs_dir / "plants.md").write_text("Notes about plants.")
+        await document_processor.scan_and_vectorize()
+
+        (test_docs_dir / "cars.md").write_text("Revised notes about cars and engines.")
+        (test_docs_dir / "boats.md").write_text("Notes about boats.")
+        (test_docs_dir / "plants.md").unlink()
+        result = await document_processor.update_files([
+            str(test_docs_dir / name) for name in ("cars.md", "boats.md", "plants.md")
+        ])
+
+        assert "reindexed 2 file(s)" in result and "removed 1" in result
+        assert self._sources(document_processor) == ["boats.md", "cars.md"]
+        stored = document_processor.vectorstore.get()
+        assert any("engines" in text for text in stored["documents"])
+        assert not any(text == "Notes about cars." for text in stored["documents"])
+
+    @pytest.mark.asyncio
+    async def test_deleted_directory_and_excluded_files(self, document_processor, test_docs_dir):
+        (test_docs_dir / "old").mkdir()
+        (test_docs_dir / "old" / "a.md").write_text("Archived notes.")
+        (test_docs_dir / "keep.md").write_text("Current notes.")
+        await document_processor.scan_and_vectorize()
+
+        (test_docs_dir / "old" / "a.md").unlink()
+        (test_docs_dir / "old").rmdir()
+        (test_docs_dir / "CLAUDE.md").write_text("Instructions, excluded by default.")
+        await document_processor.update_files([
+            str(test_docs_dir / "old"), str(test_docs_dir / "CLAUDE.md"),
+        ])
+
+        assert self._sources(document_processor) == ["keep.md"]
+
+    @pytest.mark.asyncio
+    async def test_deleting_a_canonical_copy_reindexes_its_duplicates(
+        self, document_processor, test_docs_dir
+    ):
+        text = "The same runbook text about restarting the service."
+        (test_docs_dir / "a.md").write_text(text)
+        (test_docs_dir / "b.md").write_text(text)
+        document_processor.dedup_chunks = True
+        await document_processor.scan_and_vectorize()
+        assert self._sources(document_processor) == ["a.md"]
+
+        (test_docs_dir / "a.md").unlink()
+        await document_processor.update_files([str(test_docs_dir / "a.md")])
+
+        assert self._sources(document_processor) == ["b.md"]
+
+    @pytest.mark.asyncio
+    async def test_failed_extraction_keeps_old_chunks(self, document_processor, test_docs_dir):
+        from unittest.mock import AsyncMock, patch
+        (test_docs_dir / "cars.md").write_text("Notes about cars.")
+        await document_processor.scan_and_vectorize()
+
+        with patch.object(document_processor, '_extract_text', AsyncMock(return_value=None)):
+            await document_processor.update_files([str(test_docs_dir / "cars.md")])
+
+        assert self._sources(document_processor) == ["cars.md"]
+
+    @pytest.mark.asyncio
+    async def test_changed_files_are_embedded_off_the_event_loop(self, test_docs_dir):
+        import threading
+        from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+        class ThreadRecordingEmbeddings(FakeEmbeddings):
+            threads = []
+
+            def embed_documents(self, texts):
+                self.threads.append(threading.current_thread())
+                return super().embed_documents(texts)
+
+        (test_docs_dir / "cars.md").write_text("Notes about cars.")
+        processor = DocumentProcessor("faiss", str(test_docs_dir),
+                                      ExistingEmbeddingsFactory(ThreadRecordingEmbeddings()),
+                                      FAISSVectorStoreFactory())
+        await processor.scan_and_vectorize()
+        ThreadRecordingEmbeddings.threads.clear()
+
+        (test_docs_dir / "cars.md").write_text("Revised notes about cars.")
+        await processor.update_files([str(test_docs_dir / "cars.md")])
+
+        assert ThreadRecordingEmbeddings.threads
+        assert threading.main_thread() not in ThreadRecordingEmbeddings.threads
+        docs = await processor.search_documents("cars", top_k=5)
+        assert [doc.page_content for doc in docs] == ["Revised notes about cars."]
@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from innieme.embedding_executor import AdaptiveLimiter, BatchedEmbeddings, TokenRateLimiter
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class RecordingEmbeddings(Embeddings):
+    """Embeds each text as [len(text)], failing as scripted."""
+
+    def __init__(self, fail=None):
+        self.calls = []
+        self.fail = fail or (lambda texts, attempt: None)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+            attempt = sum(1 for c in self.calls if c == list(texts))
+        error = self.fail(texts, attempt)
+        if error:
+            raise error
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+def _batched(inner, **kwargs):
+    kwargs.setdefault("count_tokens", len)
+    return BatchedEmbeddings(inner, sleep=lambda s: None, **kwargs)
+
+
+def test_batches_are_packed_by_tokens_and_results_keep_order():
+    inner = RecordingEmbeddings()
+    texts = ["aaaa", "bb", "cccccc", "d", "aaaa"]
+    vectors = _batched(inner, max_batch_tokens=7).embed_documents(texts)
+
+    assert vectors == [[4.0], [2.0], [6.0], [1.0], [4.0]]
+    # The repeated "aaaa" is embedded once; no batch goes over 7 tokens.
+    assert sorted(map(tuple, inner.calls)) == [("aaaa", "bb"), ("cccccc", "d")]
+
+
+def test_rate_limited_batch_is_retried_and_halves_concurrency():
+    inner = RecordingEmbeddings(fail=lambda texts, attempt: RateLimitError() if attempt < 3 else None)
+    embeddings = _batched(inner, max_concurrency=8)
+    before = embeddings.limiter.limit
+
+    assert embeddings.embed_documents(["hello"]) == [[5.0]]
+    assert len(inner.calls) == 3
+    assert embeddings.limiter.limit < before
+
+
+def test_non_retryable_error_fails_fast():
+    inner = RecordingEmbeddings(fail=lambda texts, attempt: ValueError("bad input"))
+    with pytest.raises(ValueError):
+        _batched(inner).embed_documents(["hello"])
+    assert len(inner.calls) == 1
+
+
+def test_failed_run_resumes_without_re_embedding_finished_batches():
+    broken = {"on": True}
+    inner = RecordingEmbeddings(
+        fail=lambda texts, attempt: RateLimitError() if broken["on"] and "zz" in texts else None
+    )
+    cache = {}
+    texts = ["aa", "bb", "zz"]
+    with pytest.raises(RateLimitError):
+        _batched(inner, max_batch_tokens=2, max_retries=1, resume_cache=cache).embed_documents(texts)
+    assert len(cache) == 2
+
+    broken["on"] = False
+    inner.calls.clear()
+    vectors = _batched(inner, max_batch_tokens=2, resume_cache=cache).embed_documents(texts)
+
+    assert vectors == [[2.0], [2.0], [2.0]]
+    assert inner.calls == [["zz"]]
+    assert cache == {}
+
+
+def test_queries_retry_briefly_and_skip_the_scan_limiter():
+    class FlakyQueries(RecordingEmbeddings):
+        def embed_query(self, text):
+            self.calls.append(text)
+            raise RateLimitError()
+
+    slept = []
+    inner = FlakyQueries()
+    embeddings = BatchedEmbeddings(inner, sleep=slept.append, max_concurrency=1, retry_base_delay=30)
+    # A scan holds every slot; the query does not wait for one.
+    embeddings.limiter.acquire()
+
+    with pytest.raises(RateLimitError):
+        embeddings.embed_query("hello")
+    assert len(inner.calls) == 2
+    assert len(slept) == 1 and slept[0] <= 1.0
+
+
+def test_limiter_additive_increase_multiplicative_decrease():
+    limiter = AdaptiveLimiter(initial=4, maximum=8, decrease_cooldown=0)
+    for _ in range(4):
+        limiter.on_success(0.1)
+    assert limiter.limit == 4  # +1/limit per success: one round earns one slot
+    limiter.on_success(0.1)
+    assert limiter.limit == 5
+    limiter.on_overload()
+    assert limiter.limit == 2
+    limiter.on_success(limiter.latency_target + 1)  # too slow counts as overload
+    assert limiter.limit == 1
+
+
+def test_token_bucket_waits_for_budget():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenRateLimiter(600, clock=lambda: now[0], sleep=sleep)
+    bucket.acquire(600)
+    bucket.acquire(100)  # 10 tokens a second
+    assert slept == [pytest.approx(10.0)]
@@ -0,0 +1,117 @@
+import pytest
+
+from innieme import extractors
+from innieme.extractors import (
+    extract_csv,
+    extract_html,
+    extract_pptx,
+    extract_txt,
+    extractor_for,
+    register_extractor,
+    sniff_mime_type,
+)
+
+
+def test_html_skips_scripts_and_splits_on_headings(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text(
+        "<html><head><title>ignored</title><style>p {}</style></head><body>"
+        "<p>Intro.</p><script>var secret = 1;</script>"
+        "<h1>Runbook</h1><p>Drain the node.</p>"
+        "<h2>Restart &amp; verify</h2><p>Reboot it.</p>"
+        "</body></html>"
+    )
+
+    segments = list(extract_html(str(path)))
+
+    assert [s.metadata.get("heading") for s in segments] == [
+        None, "Runbook", "Runbook > Restart & verify",
+    ]
+    text = "".join(s.text for s in segments)
+    assert "secret" not in text and "ignored" not in text
+    assert "Reboot it." in segments[2].text
+
+
+def test_csv_rows_carry_column_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractors, "CSV_ROWS_PER_SEGMENT", 2)
+    path = tmp_path / "hosts.csv"
+    path.write_text("host,owner\nweb1,alice\nweb2,bob\ndb1,carol\n")
+
+    segments = list(extract_csv(str(path)))
+
+    assert [s.metadata["row"] for s in segments] == [2, 4]
+    assert segments[0].text == "host: web1; owner: alice\nhost: web2; owner: bob"
+    assert segments[1].text == "host: db1; owner: carol"
+
+
+def test_pptx_one_segment_per_slide(tmp_path):
+    pptx = pytest.importorskip("pptx")
+    presentation = pptx.Presentation()
+    for title in ("Overview", "Rollout"):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = title
+    path = tmp_path / "deck.pptx"
+    presentation.save(str(path))
+
+    segments = list(extract_pptx(str(path)))
+
+    assert [(s.metadata["slide"], s.text.strip()) for s in segments] == [
+        (1, "Overview"), (2, "Rollout"),
+    ]
+
+
+def test_large_text_is_yielded_in_bounded_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractors, "MAX_SEGMENT_CHARS", 100)
+    path = tmp_path / "big.txt"
+    path.write_text("".join(f"line {i:04d} of the file\n" for i in range(50)))
+
+    segments = list(extract_txt(str(path)))
+
+    assert len(segments) > 1
+    assert all(len(s.text) < 200 for s in segments)
+    assert "".join(s.text for s in segments) == path.read_text()
+
+
+def test_missing_extension_is_sniffed_by_content(tmp_path):
+    html = tmp_path / "export"
+    html.write_text("<!DOCTYPE html><html><body><p>Hi</p></body></html>")
+    binary = tmp_path / "blob"
+    binary.write_bytes(b"\x00\x01\x02")
+
+    assert sniff_mime_type(str(html)) == "text/html"
+    assert extractor_for(str(html)) is extract_html
+    assert extractor_for(str(binary)) is None
+
+
+def test_unknown_extension_is_skipped_unread(tmp_path, monkeypatch):
+    html = tmp_path / "export.dat"
+    html.write_text("<!DOCTYPE html><html><body><p>Hi</p></body></html>")
+    (tmp_path / "build.ksh").write_text("echo hi")
+    monkeypatch.setattr(extractors, "sniff_mime_type", lambda path: pytest.fail(f"{path} was read"))
+
+    assert extractor_for(str(html)) is None
+    assert extractor_for(str(tmp_path / "build.ksh")) is None
+
+
+def test_registered_extractor_is_found_by_extension(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractors, "_EXTRACTORS_BY_EXTENSION", dict(extractors._EXTRACTORS_BY_EXTENSION))
+
+    @register_extractor([".LOG"])
+    def extract_log(file_path):
+        yield extractors.TextSegment("log text")
+
+    assert extractor_for(str(tmp_path / "app.log")) is extract_log
+
+
+def test_pptx_is_only_picked_up_with_python_pptx(monkeypatch):
+    import importlib.util
+
+    monkeypatch.setattr(extractors, "_EXTRACTORS_BY_EXTENSION", {})
+    monkeypatch.setattr(extractors, "_EXTRACTORS_BY_MIME_TYPE", {})
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: None)
+    extractors._register_pptx()
+    assert extractor_for("deck.pptx") is None
+
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: object())
+    extractors._register_pptx()
+    assert extractor_for("deck.pptx") is extract_pptx
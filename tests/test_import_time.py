@@ -0,0 +1,75 @@
+"""Cold-start guards: run in a fresh interpreter, since this one has already
+imported everything the other tests use."""
+
+import json
+import os
+import subprocess
+import sys
+
+# Backends a bot should only load once its config selects them.
+BACKENDS = [
+    "langchain_openai",
+    "langchain_huggingface",
+    "langchain_chroma",
+    "langchain_community",
+    "chromadb",
+    "faiss",
+    "torch",
+    "onnxruntime",
+]
+
+# Generous, so a slow runner does not fail it, but far below the seconds that
+# importing langchain or a backend costs.
+HELP_BUDGET_SECONDS = 0.5
+# Constructing a bot imports langchain_core, pydantic_ai and the chat SDK,
+# about 3 seconds on a development machine. About three times that, so only
+# a bot that starts loading much more than it needs fails it.
+FAKE_BOT_BUDGET_SECONDS = 8.0
+
+FAKE_BOT = """
+from innieme.discord_bot_config import DiscordBotConfig, OutieConfig, TopicConfig
+from innieme.discord_bot import DiscordBot
+
+config = DiscordBotConfig(discord_token="token", embeddings_api_key="key", llm_api_key="key",
+                          embedding_model="fake", vector_store=%r, outies=[])
+outie = OutieConfig(outie_id=1, topics=[], bot=config)
+config.outies.append(outie)
+outie.topics.append(TopicConfig(name="topic", role="role", docs_dir=%r, channels=[], outie=outie))
+DiscordBot(config=config)
+"""
+
+
+def run_timed(code):
+    """Seconds ``code`` took in a new interpreter, and the top-level modules it loaded."""
+    script = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "try:\n" + "".join(f"    {line}\n" for line in code.strip().splitlines()) +
+        "except SystemExit:\n"
+        "    pass\n"
+        "elapsed = time.perf_counter() - started\n"
+        "print(json.dumps([elapsed, sorted({m.split('.')[0] for m in sys.modules})]))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True,
+                            text=True, check=True)
+    elapsed, modules = json.loads(result.stdout.strip().splitlines()[-1])
+    return elapsed, set(modules)
+
+
+def test_help_loads_nothing_heavy():
+    elapsed, modules = run_timed(
+        "sys.argv = ['innieme', '--help']\n"
+        "from innieme.cli.run_unified_bot import main\n"
+        "main()"
+    )
+    assert not modules & {"langchain", "langchain_core", "pydantic_ai", "discord", "slack_bolt"}
+    assert elapsed < HELP_BUDGET_SECONDS, f"innieme --help took {elapsed:.2f}s"
+
+
+def test_fake_embeddings_bot_skips_unused_backends(tmp_path):
+    for store in ("chroma", "faiss", "compact"):
+        elapsed, modules = run_timed(FAKE_BOT % (store, str(tmp_path)))
+        loaded = sorted(modules & set(BACKENDS))
+        assert not loaded, f"a {store} bot loaded {loaded} before scanning ({elapsed:.2f}s)"
+        assert elapsed < FAKE_BOT_BUDGET_SECONDS, f"a {store} bot took {elapsed:.2f}s to start"
@@ -33,9 +33,9 @@ async def test_generate_summary_stores_pending(knowledge_manager):
             thread_id=99,
             conversation_text="user: Hello\nassistant: Hi!",
         )
-    assert 99 in knowledge_manager.pending_summaries
-    assert "summary" in knowledge_manager.pending_summaries[99]
-    assert "timestamp" in knowledge_manager.pending_summaries[99]
+    pending = await knowledge_manager.pending_summaries.get(99)
+    assert "summary" in pending
+    assert "timestamp" in pending
 
 
 @pytest.mark.asyncio
@@ -47,9 +47,12 @@ async def test_store_summary_persists_to_disk(knowledge_manager, tmp_path):
         )
     result = await knowledge_manager.store_summary(7)
     assert result is True
-    assert 7 not in knowledge_manager.pending_summaries
-    json_files = list((tmp_path / "summaries").glob("*.json"))
-    assert len(json_files) == 1
+    assert await knowledge_manager.pending_summaries.get(7) is None
+    # Readable by a fresh manager over the same directory.
+    reopened = KnowledgeManager(summaries_path=str(tmp_path / "summaries"))
+    stored = await reopened.load_summaries(thread_id=7)
+    assert len(stored) == 1
+    assert stored[0]["thread_id"] == "7"
 
 
 @pytest.mark.asyncio
@@ -58,6 +61,32 @@ async def test_store_summary_returns_false_for_missing_thread(knowledge_manager)
     assert result is False
 
 
+@pytest.mark.asyncio
+async def test_pending_summaries_survive_a_restart_and_expire(tmp_path, monkeypatch):
+    from innieme import summary_store
+
+    now = [1000.0]
+    monkeypatch.setattr(summary_store.time, "time", lambda: now[0])
+    path = str(tmp_path / "summaries")
+    manager = KnowledgeManager(summaries_path=path, topic_name="ops", pending_ttl=60, max_pending=2)
+    with manager.summary_agent.override(model=TestModel()):
+        for thread_id in (1, 2, 3):
+            await manager.generate_summary(thread_id, "user: hi\nassistant: hello")
+            now[0] += 1
+    # Bounded: the oldest went.
+    assert await manager.pending_summaries.count() == 2
+    assert await manager.pending_summaries.get(1) is None
+
+    manager.summary_store.close()
+    restarted = KnowledgeManager(summaries_path=path, topic_name="ops", pending_ttl=60)
+    # Another topic sharing the directory has its own.
+    assert await KnowledgeManager(summaries_path=path, topic_name="other").pending_summaries.count() == 0
+    assert await restarted.store_summary(2)
+
+    now[0] += 60
+    assert not await restarted.store_summary(3)
+
+
 @pytest.mark.asyncio
 async def test_load_summaries(knowledge_manager, tmp_path):
     with knowledge_manager.summary_agent.override(model=TestModel()):
@@ -77,3 +106,113 @@ async def test_load_summaries(knowledge_manager, tmp_path):
     for s in summaries:
         assert "summary" in s
         assert "timestamp" in s
+
+
+@pytest.mark.asyncio
+async def test_summaries_are_read_a_page_at_a_time(knowledge_manager):
+    store = knowledge_manager.summary_store
+    await store.append_many([
+        (i % 3, {"summary": f"s{i}", "timestamp": f"2026-01-{i + 1:02d}T00:00:00"}) for i in range(25)
+    ])
+
+    pages = [page async for page in knowledge_manager.iter_summaries(page_size=10)]
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [s["summary"] for s in pages[0][:3]] == ["s0", "s1", "s2"]
+
+    assert len(await knowledge_manager.load_summaries(thread_id=1)) == 8
+    assert [s["summary"] for s in await knowledge_manager.load_summaries(since="2026-01-24")] == ["s23", "s24"]
+    assert len(await knowledge_manager.load_summaries(limit=4)) == 4
+    assert await store.count() == 25
+
+
+@pytest.mark.asyncio
+async def test_summary_files_from_older_versions_are_imported(tmp_path):
+    import json
+
+    directory = tmp_path / "summaries"
+    directory.mkdir()
+    (directory / "summary_1712.5_20250102_030405.json").write_text(
+        json.dumps({"summary": "old", "timestamp": "2025-01-02T03:04:05"})
+    )
+    manager = KnowledgeManager(summaries_path=str(directory))
+
+    summaries = await manager.load_summaries()
+    assert summaries == [{"summary": "old", "timestamp": "2025-01-02T03:04:05", "thread_id": "1712.5"}]
+    # Once: a second manager finds them already in the store.
+    assert len(await KnowledgeManager(summaries_path=str(directory)).load_summaries()) == 1
+
+
+@pytest.mark.asyncio
+async def test_approved_summaries_are_searchable_and_survive_a_rescan(tmp_path):
+    from langchain_core.embeddings import Embeddings
+
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import ExistingEmbeddingsFactory
+    from innieme.knowledge_manager import summary_source
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+    class WordEmbeddings(Embeddings):
+        WORDS = ["cars", "plants", "rockets"]
+
+        def embed_documents(self, texts):
+            return [self.embed_query(t) for t in texts]
+
+        def embed_query(self, text):
+            return [float(w in text.lower()) for w in self.WORDS] + [0.1]
+
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "cars.txt").write_text("Cars have four wheels.")
+    processor = DocumentProcessor("ops", str(tmp_path / "docs"), ExistingEmbeddingsFactory(WordEmbeddings()),
+                                  FAISSVectorStoreFactory())
+    await processor.scan_and_vectorize()
+    manager = KnowledgeManager(summaries_path=str(tmp_path / "summaries"), topic_name="ops",
+                               document_processor=processor)
+
+    async def approve(thread_id, summary, title):
+        await manager.pending_summaries.put(thread_id, {"summary": summary, "key_points": ["Watered weekly"],
+                                                        "suggested_title": title, "topic": "ops",
+                                                        "timestamp": "2026-01-01T00:00:00"})
+        assert await manager.store_summary(thread_id)
+
+    async def sources(query):
+        return [doc.metadata["source"] for doc in await processor.search_documents(query, top_k=5)]
+
+    await approve(7, "Plants need light.", "Plant care")
+    found = await processor.search_documents("plants", top_k=1)
+    assert found[0].metadata["source"] == summary_source(7)
+    assert found[0].metadata["heading"] == "Plant care"
+    assert "- Watered weekly" in found[0].page_content
+
+    # Approving the thread again replaces its chunks.
+    await approve(7, "Rockets need fuel.", "Rocket care")
+    assert (await sources("rockets plants")).count(summary_source(7)) == 1
+    assert "Rockets" in (await processor.search_documents("rockets", top_k=1))[0].page_content
+
+    # Another topic's summaries in the same store are not indexed.
+    await manager.summary_store.append(9, {"summary": "Plants elsewhere.", "topic": "other",
+                                           "timestamp": "2026-01-02T00:00:00"})
+    await processor.scan_and_vectorize()
+    assert summary_source(7) not in await sources("rockets plants")
+    assert await manager.index_stored_summaries() == 2
+    assert set(await sources("rockets plants")) == {summary_source(7), str(tmp_path / "docs" / "cars.txt")}
+    assert "Rockets" in (await processor.search_documents("rockets", top_k=1))[0].page_content
+
+
+@pytest.mark.asyncio
+async def test_a_scan_succeeds_when_its_summaries_cannot_be_indexed(caplog):
+    from types import SimpleNamespace
+    from innieme.innie import Topic
+
+    async def scan(progress):
+        return "Scanned 3 files"
+
+    async def index_stored_summaries():
+        raise RuntimeError("summary store unavailable")
+
+    topic = Topic.__new__(Topic)
+    topic.config = SimpleNamespace(name="ops")
+    topic.document_processor = SimpleNamespace(scan_and_vectorize=scan)
+    topic.knowledge_manager = SimpleNamespace(index_stored_summaries=index_stored_summaries)
+
+    assert await topic.scan_and_vectorize() == "Scanned 3 files"
+    assert "Could not index stored summaries for topic ops: summary store unavailable" in caplog.text
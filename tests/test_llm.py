@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+import pytest
+
+from innieme import llm
+from innieme.conversation_engine import ConversationEngine
+from innieme.knowledge_manager import KnowledgeManager
+
+
+def _topic():
+    from unittest.mock import Mock
+
+    topic = Mock()
+    topic.outie.bot.prompt_layout = "inline"
+    return topic
+
+
+@pytest.mark.asyncio
+async def test_models_are_shared_per_provider_model_and_key(tmp_path):
+    from unittest.mock import Mock
+
+    engines = [ConversationEngine(_topic(), Mock(), Mock(), model="openai:gpt-test", llm_api_key="k1")
+               for _ in range(2)]
+    manager = KnowledgeManager(model="openai:gpt-test", llm_api_key="k1", summaries_path=str(tmp_path))
+
+    model = engines[0].agent.model
+    assert engines[1].agent.model is model
+    assert manager.summary_agent.model is model
+    assert llm.build_model("openai:gpt-test", "k2") is not model
+    assert llm.build_model("anthropic:claude-test", "k1") is not model
+    # Without a key pydantic-ai resolves the model string itself.
+    assert llm.build_model("openai:gpt-test", "") == "openai:gpt-test"
+
+    # Every provider sends through the one client.
+    client = llm.http_client()
+    assert model._provider.client._client is client
+    assert llm.build_model("anthropic:claude-test", "k1")._provider.client._client is client
+    await llm.close()
+
+
+def test_models_keep_working_after_close_and_in_a_new_event_loop(monkeypatch):
+    """start → stop → start → answer, as a bot restarted in-process does."""
+    from pydantic_ai import Agent
+
+    pools = []
+
+    def reply(request):
+        return httpx.Response(200, json={
+            "id": "c1", "object": "chat.completion", "created": 0, "model": "gpt-restart",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"answer {len(pools)}"}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    def new_pool():
+        pools.append(httpx.AsyncClient(transport=httpx.MockTransport(reply)))
+        return pools[-1]
+
+    monkeypatch.setattr(llm, "_new_pool", new_pool)
+    # Built once, like the agents of a bot's topics.
+    agent = Agent(llm.build_model("openai:gpt-restart", "k"))
+
+    async def run_bot():
+        try:
+            return (await agent.run("hello")).output
+        finally:
+            await llm.close()
+
+    assert asyncio.run(run_bot()) == "answer 1"
+    assert pools[0].is_closed
+    assert asyncio.run(run_bot()) == "answer 2"
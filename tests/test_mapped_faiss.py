@@ -0,0 +1,143 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from innieme.mapped_faiss import (
+    BUILDING_MARKER, READY_FILE, STALE_BUILD_SECONDS, MappedFAISS, SQLitePositionMap, prune_builds,
+)
+from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+
+class CountingEmbeddings(Embeddings):
+    WORDS = ["cars", "plants", "boats", "trains"]
+    model = "counting"
+
+    def __init__(self):
+        self.embedded = 0
+
+    def _vector(self, text):
+        return [float(w in text) for w in self.WORDS] + [0.1]
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+TEXTS = ["about cars", "about plants", "about boats"]
+METADATAS = [{"source": t} for t in TEXTS]
+IDS = ["a", "b", "c"]
+
+
+def build(index_dir, embeddings, texts=TEXTS):
+    return FAISSVectorStoreFactory(index_dir=str(index_dir)).create_from_texts(
+        texts, embeddings, "topic_123", metadatas=METADATAS[:len(texts)], ids=IDS[:len(texts)]
+    )
+
+
+def test_build_is_mapped_and_searchable(tmp_path):
+    store = build(tmp_path, CountingEmbeddings())
+    assert isinstance(store, MappedFAISS) and store.is_mapped
+    assert isinstance(store.index_to_docstore_id, SQLitePositionMap)
+    (build_dir,) = [d for d in os.listdir(tmp_path / "topic")]
+    assert os.path.exists(os.path.join(tmp_path, "topic", build_dir, READY_FILE))
+
+    doc, = store.similarity_search("plants", k=1)
+    assert doc.page_content == "about plants" and doc.metadata == {"source": "about plants"}
+
+
+def test_second_process_loads_the_build_without_embedding(tmp_path):
+    build(tmp_path, CountingEmbeddings())
+    embeddings = CountingEmbeddings()
+    store = build(tmp_path, embeddings)
+    assert embeddings.embedded == 0
+    assert store.similarity_search("boats", k=1)[0].page_content == "about boats"
+    assert len(os.listdir(tmp_path / "topic")) == 1
+
+
+def test_changed_documents_get_a_new_build(tmp_path):
+    build(tmp_path, CountingEmbeddings())
+    embeddings = CountingEmbeddings()
+    build(tmp_path, embeddings, texts=TEXTS[:2])
+    assert embeddings.embedded == 2
+    assert len(os.listdir(tmp_path / "topic")) == 2
+
+
+def test_old_builds_are_deleted_per_topic(tmp_path):
+    other = FAISSVectorStoreFactory(index_dir=str(tmp_path)).create_from_texts(
+        TEXTS, CountingEmbeddings(), "other_1", ids=IDS
+    )
+    first = build(tmp_path, CountingEmbeddings())
+    first_dir = first.directory
+    os.utime(os.path.join(first_dir, READY_FILE), (1, 1))
+    build(tmp_path, CountingEmbeddings(), texts=TEXTS[:2])
+    latest = build(tmp_path, CountingEmbeddings(), texts=TEXTS[:1])
+
+    # The newest two of this topic are kept; the other topic's build too.
+    assert len(os.listdir(tmp_path / "topic")) == 2
+    assert not os.path.exists(first_dir)
+    assert os.path.exists(other.directory)
+    # A store already mapped keeps working, and can be closed once replaced.
+    assert first.similarity_search("cars", k=1)[0].page_content == "about cars"
+    first.close_mapping()
+    assert latest.similarity_search("cars", k=1)[0].page_content == "about cars"
+
+
+def test_pruning_keeps_live_builds_in_progress_and_deletes_abandoned_ones(tmp_path):
+    current = build(tmp_path, CountingEmbeddings()).directory
+    host = socket.gethostname()
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    builds = {
+        "live": f"{current}x{BUILDING_MARKER}{host}-{os.getpid()}",
+        "dead": f"{current}x{BUILDING_MARKER}{host}-{finished.pid}",
+        "remote": f"{current}x{BUILDING_MARKER}elsewhere-1",
+        "stale": f"{current}x{BUILDING_MARKER}elsewhere-2",
+    }
+    for path in builds.values():
+        os.makedirs(path)
+        # write_store finishes the directory, READY included, before the rename.
+        open(os.path.join(path, READY_FILE), "w").close()
+    old = os.path.getmtime(builds["stale"]) - STALE_BUILD_SECONDS - 1
+    os.utime(builds["stale"], (old, old))
+
+    prune_builds(str(tmp_path / "topic"), current, keep=1)
+
+    assert {name for name, path in builds.items() if os.path.exists(path)} == {"live", "remote"}
+    assert os.path.exists(current)
+
+
+def test_a_failed_rename_is_raised_unless_another_build_finished(tmp_path, monkeypatch):
+    def rename(src, dst):
+        raise PermissionError(dst)
+
+    monkeypatch.setattr(os, "rename", rename)
+    with pytest.raises(PermissionError):
+        build(tmp_path, CountingEmbeddings())
+    assert os.listdir(tmp_path / "topic") == []
+
+
+def test_updates_copy_the_index_and_leave_the_build_intact(tmp_path):
+    store = build(tmp_path, CountingEmbeddings())
+    store.delete(ids=["a"])
+    store.add_texts(["about trains"], metadatas=[{"source": "trains"}], ids=["d"])
+    assert not store.is_mapped
+    assert store.similarity_search("trains", k=1)[0].page_content == "about trains"
+    assert "about cars" not in [d.page_content for d in store.similarity_search("cars", k=3)]
+
+    embeddings = CountingEmbeddings()
+    reloaded = build(tmp_path, embeddings)
+    assert embeddings.embedded == 0
+    assert reloaded.similarity_search("cars", k=1)[0].page_content == "about cars"
+
+
+def test_without_index_dir_the_store_is_in_memory(tmp_path):
+    store = FAISSVectorStoreFactory().create_from_texts(TEXTS, CountingEmbeddings(), "c")
+    assert not isinstance(store, MappedFAISS)
+    assert os.listdir(tmp_path) == []
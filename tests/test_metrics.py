@@ -0,0 +1,85 @@
+import urllib.request
+
+import pytest
+
+from innieme import metrics
+
+
+@pytest.fixture
+def enabled():
+    metrics.enable()
+    yield
+    metrics.disable()
+
+
+def test_nothing_is_recorded_while_disabled():
+    before = metrics.SCANS.value(topic="disabled", outcome="ok")
+    metrics.SCANS.inc(topic="disabled", outcome="ok")
+    metrics.SCAN_SECONDS.observe(3.0, topic="disabled")
+    assert metrics.SCANS.value(topic="disabled", outcome="ok") == before
+    assert metrics.SCAN_SECONDS.count(topic="disabled") == 0
+
+
+def test_text_format(enabled):
+    registry = metrics.Registry()
+    counter = metrics.Counter("test_format_total", "A test counter", ["topic"], registry=registry)
+    counter.inc(topic='say "hi"')
+    counter.inc(2, topic='say "hi"')
+    histogram = metrics.Histogram("test_format_seconds", "A test histogram", buckets=(0.1, 1),
+                                  registry=registry)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(7)
+
+    assert registry.render().splitlines() == [
+        "# HELP test_format_total A test counter",
+        "# TYPE test_format_total counter",
+        'test_format_total{topic="say \\"hi\\""} 3.0',
+        "# HELP test_format_seconds A test histogram",
+        "# TYPE test_format_seconds histogram",
+        'test_format_seconds_bucket{le="0.1"} 1',
+        'test_format_seconds_bucket{le="1.0"} 2',
+        'test_format_seconds_bucket{le="+Inf"} 3',
+        "test_format_seconds_sum 7.55",
+        "test_format_seconds_count 3",
+    ]
+
+
+def test_endpoint_serves_the_registry(enabled):
+    server = metrics.serve(0)
+    try:
+        metrics.LLM_REQUESTS.inc(topic="endpoint", outcome="ok")
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert 'innieme_llm_requests_total{topic="endpoint",outcome="ok"}' in body
+        assert "# TYPE innieme_request_seconds histogram" in body
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_scans_and_queries_are_counted(enabled, tmp_path):
+    from innieme import tracing
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import ExistingEmbeddingsFactory
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+    from langchain_core.embeddings import FakeEmbeddings
+
+    (tmp_path / "a.md").write_text("alpha")
+    (tmp_path / "b.md").write_text("beta")
+    processor = DocumentProcessor("metrics", str(tmp_path), ExistingEmbeddingsFactory(FakeEmbeddings(size=4)),
+                                  FAISSVectorStoreFactory())
+    scans = metrics.SCANS.value(topic="metrics", outcome="ok")
+    await processor.scan_and_vectorize()
+    assert metrics.SCANS.value(topic="metrics", outcome="ok") == scans + 1
+    assert metrics.INDEXED_FILES.value(topic="metrics") == 2
+    assert metrics.INDEXED_CHUNKS.value(topic="metrics") == 2
+
+    requests = metrics.REQUESTS.value(platform="test", topic="metrics", outcome="ok")
+    with tracing.request("test", topic="metrics"):
+        await processor.search_documents("alpha", top_k=1)
+    assert metrics.REQUESTS.value(platform="test", topic="metrics", outcome="ok") == requests + 1
+    assert metrics.STAGE_SECONDS.count(stage="embed_query") > 0
+    assert metrics.PENDING_QUERIES.value() == 0
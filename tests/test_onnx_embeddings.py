@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+tokenizers = pytest.importorskip("tokenizers")
+
+from innieme.embeddings_factory import OnnxEmbeddingsFactory  # noqa: E402
+from innieme.onnx_embeddings import OnnxEmbeddings, mean_pool  # noqa: E402
+
+VOCAB = ["[PAD]", "[UNK]", "cars", "plants", "boats", "about", "notes"]
+DIM = 4
+
+
+# A minimal ONNX protobuf writer, enough for one Gather node, so the tests run
+# a real onnxruntime session without needing the onnx package.
+def _varint(n):
+    out = b""
+    while True:
+        byte, n = n & 0x7F, n >> 7
+        out += bytes([byte | (0x80 if n else 0)])
+        if not n:
+            return out
+
+
+def _field(number, value):
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _tensor_type(elem_type, dims):
+    shape = b"".join(
+        _field(1, _field(2, d) if isinstance(d, str) else _field(1, d)) for d in dims
+    )
+    return _field(1, _field(1, elem_type) + _field(2, shape))
+
+
+def _value_info(name, elem_type, dims):
+    return _field(1, name) + _field(2, _tensor_type(elem_type, dims))
+
+
+def write_lookup_model(path, table: np.ndarray):
+    """An ONNX model mapping input_ids to rows of ``table``, per token."""
+    FLOAT, INT64 = 1, 7
+    initializer = (
+        b"".join(_field(1, d) for d in table.shape) + _field(2, FLOAT)
+        + _field(8, "table") + _field(9, table.astype("<f4").tobytes())
+    )
+    node = _field(1, "table") + _field(1, "input_ids") + _field(2, "last_hidden_state") + _field(4, "Gather")
+    graph = (
+        _field(1, node) + _field(2, "lookup") + _field(5, initializer)
+        + _field(11, _value_info("input_ids", INT64, ["batch", "sequence"]))
+        + _field(12, _value_info("last_hidden_state", FLOAT, ["batch", "sequence", table.shape[1]]))
+    )
+    model = _field(1, 8) + _field(8, _field(1, "") + _field(2, 13)) + _field(7, graph)
+    with open(path, "wb") as f:
+        f.write(model)
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    from tokenizers import Tokenizer
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+
+    tokenizer = Tokenizer(WordLevel({w: i for i, w in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+    (tmp_path / "onnx").mkdir()
+    table = np.random.default_rng(0).standard_normal((len(VOCAB), DIM)).astype(np.float32)
+    write_lookup_model(tmp_path / "onnx" / "model.onnx", table)
+    return tmp_path, table
+
+
+def expected(table, text):
+    ids = [VOCAB.index(w) if w in VOCAB else 1 for w in text.split()]
+    mean = table[ids].mean(axis=0)
+    return mean / np.linalg.norm(mean)
+
+
+def test_mean_pool_ignores_padding():
+    tokens = np.array([[[1.0, 0.0], [0.0, 1.0], [9.0, 9.0]]], dtype=np.float32)
+    pooled = mean_pool(tokens, np.array([[1, 1, 0]]))
+    assert pooled[0] == pytest.approx([2 ** -0.5, 2 ** -0.5])
+
+
+def test_vectors_match_pooled_token_embeddings(model_dir):
+    path, table = model_dir
+    embeddings = OnnxEmbeddings(str(path), batch_size=2, threads=1)
+    texts = ["notes about cars", "plants", "about boats and plants", "cars"]
+    vectors = embeddings.embed_documents(texts)
+    for text, vector in zip(texts, vectors):
+        assert vector == pytest.approx(expected(table, text).tolist(), abs=1e-5)
+    assert embeddings.embed_query("cars") == pytest.approx(vectors[3], abs=1e-6)
+    assert embeddings.embed_documents([]) == []
+
+
+def test_factory_loads_each_model_once(model_dir):
+    path, _ = model_dir
+    first = OnnxEmbeddingsFactory(cache_dir=str(path), model_name=str(path), threads=1)
+    second = OnnxEmbeddingsFactory(cache_dir=str(path), model_name=str(path), threads=1)
+    assert first.create_embeddings() is second.create_embeddings()
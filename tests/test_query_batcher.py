@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from innieme.query_batcher import QueryBatcher
+from innieme.vector_store_factory import ChromaVectorStoreFactory, FAISSVectorStoreFactory
+
+
+class RecordingEmbeddings(Embeddings):
+    WORDS = ["cars", "plants", "boats", "trains"]
+
+    def __init__(self):
+        self.calls = []
+
+    def _vector(self, text):
+        return [float(w in text) for w in self.WORDS] + [0.1]
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return self._vector(text)
+
+
+TEXTS = ["about cars", "about plants", "about boats", "about trains"]
+
+
+@pytest.fixture(params=["chroma", "faiss"])
+def store(request):
+    factory = ChromaVectorStoreFactory() if request.param == "chroma" else FAISSVectorStoreFactory()
+    embeddings = RecordingEmbeddings()
+    store = factory.create_from_texts(
+        TEXTS, embeddings, f"batch_{id(embeddings)}",
+        metadatas=[{"source": t, "even": i % 2 == 0} for i, t in enumerate(TEXTS)],
+    )
+    embeddings.calls.clear()
+    return store
+
+
+@pytest.mark.asyncio
+async def test_concurrent_searches_share_one_embedding_call(store):
+    batcher = QueryBatcher(window=0.01)
+    queries = ["cars", "plants", "boats"]
+    results = await asyncio.gather(*(batcher.search(store, q, k=2) for q in queries))
+
+    assert store.embeddings.calls == [queries]
+    for query, result in zip(queries, results):
+        expected = store.similarity_search_with_relevance_scores(query, k=2)
+        assert [doc.page_content for doc, _ in result] == [doc.page_content for doc, _ in expected]
+        assert [score for _, score in result] == pytest.approx([score for _, score in expected])
+
+
+@pytest.mark.asyncio
+async def test_each_caller_gets_its_own_k_and_filter(store):
+    batcher = QueryBatcher(window=0.01)
+    top1, top3, even = await asyncio.gather(
+        batcher.search(store, "cars", k=1),
+        batcher.search(store, "cars", k=3),
+        batcher.search(store, "cars", k=4, filter={"even": True}),
+    )
+    assert [doc.page_content for doc, _ in top1] == ["about cars"]
+    assert len(top3) == 3 and top3[0][0].page_content == "about cars"
+    assert sorted(doc.page_content for doc, _ in even) == ["about boats", "about cars"]
+    assert len(store.embeddings.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_only_faiss_is_searched_on_the_event_loop(store, monkeypatch):
+    import threading
+
+    from innieme import query_batcher
+
+    threads = []
+    search_by_vectors = query_batcher.search_by_vectors
+    monkeypatch.setattr(query_batcher, "search_by_vectors",
+                        lambda *args: threads.append(threading.current_thread()) or search_by_vectors(*args))
+
+    [(doc, _)] = await QueryBatcher(window=0.001).search(store, "cars", k=1)
+
+    assert doc.page_content == "about cars"
+    on_loop = threads == [threading.main_thread()]
+    assert on_loop == query_batcher.is_faiss(store)
+
+
+@pytest.mark.asyncio
+async def test_a_full_batch_runs_without_waiting(store):
+    batcher = QueryBatcher(window=60, max_batch_size=2)
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.search(store, "cars", k=1), batcher.embed(store.embeddings, "boats")),
+        timeout=5,
+    )
+    assert results[0][0][0].page_content == "about cars"
+    assert results[1] == store.embeddings.embed_query("boats")
+
+
+@pytest.mark.asyncio
+async def test_embedding_errors_reach_every_caller():
+    class Failing(RecordingEmbeddings):
+        def embed_documents(self, texts):
+            raise ConnectionError("provider down")
+
+    batcher = QueryBatcher(window=0.01)
+    embeddings = Failing()
+    results = await asyncio.gather(
+        batcher.embed(embeddings, "a"), batcher.embed(embeddings, "b"), return_exceptions=True
+    )
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_processor_searches_are_batched(tmp_path):
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import ExistingEmbeddingsFactory
+
+    for text in TEXTS:
+        (tmp_path / f"{text.split()[1]}.md").write_text(text)
+    embeddings = RecordingEmbeddings()
+    processor = DocumentProcessor("batching", str(tmp_path), ExistingEmbeddingsFactory(embeddings),
+                                  FAISSVectorStoreFactory(), query_batch_window=0.01)
+    await processor.scan_and_vectorize()
+    embeddings.calls.clear()
+
+    results = await asyncio.gather(
+        processor.search_documents("cars", top_k=1),
+        processor.search_documents("boats", top_k=1, score_threshold=0.5),
+    )
+    assert [[d.page_content for d in r] for r in results] == [["about cars"], ["about boats"]]
+    assert embeddings.calls == [["cars", "boats"]]
@@ -0,0 +1,187 @@
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from innieme.document_processor import DocumentProcessor
+from innieme.embeddings_factory import ExistingEmbeddingsFactory
+from innieme.shared_index import SharedIndex
+from innieme.vector_store_factory import ChromaVectorStoreFactory, FAISSVectorStoreFactory
+
+
+class CountingEmbeddings(Embeddings):
+    WORDS = ["cars", "plants", "boats"]
+
+    def __init__(self):
+        self.embedded = []
+
+    def _vector(self, text):
+        return [float(w in text.lower()) for w in self.WORDS] + [0.1]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture(params=["chroma", "faiss"])
+def setup(request, tmp_path):
+    """Topic "all" over docs/, topic "vehicles" over docs/vehicles, one shared index."""
+    docs = tmp_path / "docs"
+    (docs / "vehicles").mkdir(parents=True)
+    (docs / "plants.md").write_text("Notes about plants.")
+    (docs / "vehicles" / "cars.md").write_text("Notes about cars.")
+    embeddings = CountingEmbeddings()
+    factory = ChromaVectorStoreFactory() if request.param == "chroma" else FAISSVectorStoreFactory()
+    shared = SharedIndex("docs", ExistingEmbeddingsFactory(embeddings), factory)
+    processors = {
+        name: DocumentProcessor(name, str(path), ExistingEmbeddingsFactory(embeddings), factory,
+                                shared_index=shared)
+        for name, path in (("all", docs), ("vehicles", docs / "vehicles"))
+    }
+    return docs, embeddings, shared, processors
+
+
+def contents(docs):
+    return sorted(doc.page_content for doc in docs)
+
+
+@pytest.mark.asyncio
+async def test_overlapping_topics_embed_shared_chunks_once(setup):
+    docs, embeddings, shared, processors = setup
+    for processor in processors.values():
+        await processor.scan_and_vectorize()
+
+    assert sorted(embeddings.embedded) == ["Notes about cars.", "Notes about plants."]
+    assert len(shared) == 2
+    assert processors["all"].vectorstore is processors["vehicles"].vectorstore
+
+
+@pytest.mark.asyncio
+async def test_searches_stay_within_the_topic(setup):
+    docs, embeddings, shared, processors = setup
+    for processor in processors.values():
+        await processor.scan_and_vectorize()
+
+    assert contents(await processors["vehicles"].search_documents("plants", top_k=5)) == [
+        "Notes about cars."
+    ]
+    assert contents(await processors["all"].search_documents("plants", top_k=5)) == [
+        "Notes about cars.", "Notes about plants."
+    ]
+    assert await processors["vehicles"].search_documents(
+        "cars", top_k=5, filter={"page": 1}
+    ) == []
+
+
+@pytest.mark.asyncio
+async def test_a_chunk_stays_while_any_topic_holds_it(setup):
+    docs, embeddings, shared, processors = setup
+    for processor in processors.values():
+        await processor.scan_and_vectorize()
+
+    (docs / "vehicles" / "cars.md").unlink()
+    await processors["vehicles"].update_files([str(docs / "vehicles" / "cars.md")])
+    assert await processors["vehicles"].search_documents("cars", top_k=5) == []
+    assert "Notes about cars." in contents(await processors["all"].search_documents("cars", top_k=5))
+
+    await processors["all"].update_files([str(docs / "vehicles" / "cars.md")])
+    assert len(shared) == 1
+
+
+@pytest.mark.asyncio
+async def test_rescan_re_embeds_nothing_unchanged(setup):
+    docs, embeddings, shared, processors = setup
+    for processor in processors.values():
+        await processor.scan_and_vectorize()
+    embeddings.embedded.clear()
+
+    (docs / "boats.md").write_text("Notes about boats.")
+    await processors["all"].scan_and_vectorize()
+
+    assert embeddings.embedded == ["Notes about boats."]
+    assert contents(await processors["vehicles"].search_documents("boats", top_k=5)) == [
+        "Notes about cars."
+    ]
+
+
+def test_topics_share_the_outermost_docs_dir_containing_theirs():
+    from types import SimpleNamespace
+    from innieme.innie import Topic
+
+    topics = [SimpleNamespace(docs_dir=d) for d in ("/docs", "/docs/math", "/other", "/docs2")]
+    outie = SimpleNamespace(topics=topics)
+    outie.bot = SimpleNamespace(outies=[outie])
+    assert [Topic._docs_root(outie, t) for t in topics] == ["/docs", "/docs", "/other", "/docs2"]
+
+
+@pytest.mark.asyncio
+async def test_topics_only_see_the_duplicates_they_scan(setup):
+    docs, embeddings, shared, _ = setup
+    (docs / "vehicles" / "secret.md").write_text("Notes about cars.")
+    factory = shared.vector_store_factory
+    all_docs = DocumentProcessor("all", str(docs), ExistingEmbeddingsFactory(embeddings), factory,
+                                 shared_index=shared, dedup_chunks=True)
+    vehicles = DocumentProcessor("vehicles", str(docs / "vehicles"), ExistingEmbeddingsFactory(embeddings),
+                                 factory, shared_index=shared, docs_exclude=["secret.md"], dedup_chunks=True)
+    await all_docs.scan_and_vectorize()
+    await vehicles.scan_and_vectorize()
+
+    [seen_by_all] = await all_docs.search_documents("cars", top_k=1)
+    assert seen_by_all.metadata["also_in"].endswith("secret.md")
+    [seen_by_vehicles] = await vehicles.search_documents("cars", top_k=1)
+    assert "also_in" not in seen_by_vehicles.metadata
+    assert not any(key.startswith("topic:") for key in seen_by_vehicles.metadata)
+
+
+@pytest.mark.asyncio
+async def test_retagged_chunks_keep_their_metadata_and_only_the_store_holds_text(setup):
+    docs, _, shared, processors = setup
+    for processor in processors.values():
+        await processor.scan_and_vectorize()
+
+    [doc] = await processors["all"].search_documents("cars", top_k=1)
+    assert doc.metadata["source"].endswith("cars.md")
+    held = [value for name, value in vars(shared).items() if name != "vectorstore"]
+    assert "Notes about" not in repr(held)
+
+
+@pytest.mark.asyncio
+async def test_shared_scans_embed_off_the_event_loop_and_report_progress(setup):
+    import threading
+
+    from innieme.scan_progress import ScanProgress
+
+    docs, embeddings, shared, processors = setup
+    threads = []
+    embed_documents = embeddings.embed_documents
+    embeddings.embed_documents = lambda texts: threads.append(threading.current_thread()) or embed_documents(texts)
+
+    progress = ScanProgress("all")
+    await processors["all"].scan_and_vectorize(progress)
+    (docs / "boats.md").write_text("Notes about boats.")
+    await processors["all"].scan_and_vectorize()
+
+    assert threads and threading.main_thread() not in threads
+    assert progress.chunks_total == progress.chunks_embedded == 2
+    assert "Notes about boats." in contents(await processors["all"].search_documents("boats", top_k=5))
+
+
+@pytest.mark.asyncio
+async def test_chroma_retags_off_the_event_loop_and_faiss_on_it(setup):
+    import threading
+
+    docs, _, shared, processors = setup
+    factory = shared.vector_store_factory
+    threads = []
+    update_metadata = factory.update_metadata
+    factory.update_metadata = lambda *args: threads.append(threading.current_thread()) or update_metadata(*args)
+
+    for processor in processors.values():
+        await processor.scan_and_vectorize()
+
+    assert threads
+    # FAISS is changed on the loop, where it is searched; Chroma in a thread.
+    on_loop = [thread is threading.main_thread() for thread in threads]
+    assert all(on_loop) if isinstance(factory, FAISSVectorStoreFactory) else not any(on_loop)
+    assert contents(await processors["vehicles"].search_documents("cars", top_k=5)) == ["Notes about cars."]
@@ -1,5 +1,5 @@
 from pydantic import ValidationError
-from innieme.slack_bot_config import OutieConfig, SlackBotConfig
+from innieme.slack_bot_config import OutieConfig, SlackBotConfig, TopicConfig, ChannelConfig
 
 import pytest
 
@@ -281,3 +281,88 @@ def test_valid_retrieval_bounds_are_accepted():
             embeddings_api_key="k", llm_api_key="k",
             embedding_model="fake", retrieval_score_threshold=good, outies=[])
         assert c.retrieval_score_threshold == good
+
+
+def test_prompt_layout_defaults_to_inline_and_is_validated():
+    """Existing configs keep the inline layout; typos fail at load"""
+    base = dict(
+        slack_bot_token="xoxb-t", slack_app_token="xapp-t",
+        embeddings_api_key="k", llm_api_key="k",
+        embedding_model="fake", outies=[])
+    assert SlackBotConfig(**base).prompt_layout == "inline"
+    assert SlackBotConfig(**base, prompt_layout="cached").prompt_layout == "cached"
+    with pytest.raises(ValidationError):
+        SlackBotConfig(**base, prompt_layout="cache")
+
+
+def test_mmr_settings_are_per_topic_and_validated(tmp_path):
+    """MMR is tuned per topic, next to the docs it retrieves from"""
+    base = dict(name="t", role="r", docs_dir=str(tmp_path),
+                channels=[ChannelConfig(channel_id="C1")])
+    topic = TopicConfig(**base, mmr_lambda=0.6, mmr_fetch_k=30)
+    assert (topic.mmr_lambda, topic.mmr_fetch_k) == (0.6, 30)
+    assert TopicConfig(**base).mmr_lambda is None
+    for bad in (dict(mmr_lambda=-0.1), dict(mmr_fetch_k=0)):
+        with pytest.raises(ValidationError):
+            TopicConfig(**base, **bad)
+
+
+def test_watch_is_off_by_default_and_debounce_validated(tmp_path):
+    base = dict(name="t", role="r", docs_dir=str(tmp_path),
+                channels=[ChannelConfig(channel_id="C1")])
+    topic = TopicConfig(**base)
+    assert (topic.watch, topic.watch_debounce) == (False, 2.0)
+    assert TopicConfig(**base, watch=True, watch_debounce=0.5).watch
+    with pytest.raises(ValidationError):
+        TopicConfig(**base, watch_debounce=0)
+
+
+def test_embedding_throughput_settings_are_validated():
+    base = dict(slack_bot_token="xoxb-t", slack_app_token="xapp-t", embeddings_api_key="k",
+                llm_api_key="k", embedding_model="fake", outies=[])
+    config = SlackBotConfig(**base, embeddings_max_concurrency=8, embeddings_tokens_per_minute=1_000_000)
+    assert (config.embeddings_max_concurrency, config.embeddings_tokens_per_minute) == (8, 1_000_000)
+    for bad in (dict(embeddings_max_concurrency=0), dict(embeddings_tokens_per_minute=0)):
+        with pytest.raises(ValidationError):
+            SlackBotConfig(**base, **bad)
+
+
+def test_vector_store_settings_are_validated():
+    base = dict(slack_bot_token="xoxb-t", slack_app_token="xapp-t", embeddings_api_key="k",
+                llm_api_key="k", embedding_model="fake", outies=[])
+    config = SlackBotConfig(**base, vector_store="compact", vector_quantization="pq",
+                            vector_dimensions=512, vector_rescore="fp16")
+    assert config.vector_store == "compact"
+    assert SlackBotConfig(**base).vector_store == "chroma"
+    for bad in (dict(vector_store="pinecone"), dict(vector_quantization="int4"),
+                dict(vector_rescore="exact"), dict(vector_dimensions=0)):
+        with pytest.raises(ValidationError):
+            SlackBotConfig(**base, **bad)
+
+
+def test_vector_index_dir_requires_faiss():
+    base = dict(slack_bot_token="xoxb-t", slack_app_token="xapp-t", embeddings_api_key="k",
+                llm_api_key="k", embedding_model="fake", outies=[])
+    config = SlackBotConfig(**base, vector_store="faiss", vector_index_dir="~/indexes")
+    assert config.vector_index_dir == "~/indexes"
+    with pytest.raises(ValidationError):
+        SlackBotConfig(**base, vector_index_dir="~/indexes")
+
+
+def test_shared_index_cannot_be_mapped():
+    base = dict(slack_bot_token="xoxb-t", slack_app_token="xapp-t", embeddings_api_key="k",
+                llm_api_key="k", embedding_model="fake", outies=[])
+    assert SlackBotConfig(**base, shared_index=True).shared_index
+    with pytest.raises(ValidationError):
+        SlackBotConfig(**base, vector_store="faiss", vector_index_dir="~/i", shared_index=True)
+
+
+def test_onnx_embedding_settings_are_validated():
+    base = dict(slack_bot_token="xoxb-t", slack_app_token="xapp-t", embeddings_api_key="k",
+                llm_api_key="k", outies=[])
+    config = SlackBotConfig(**base, embedding_model="onnx", embeddings_threads=2,
+                            embeddings_onnx_file="onnx/model_qint8_avx512.onnx")
+    assert (config.embeddings_threads, config.embeddings_batch_size) == (2, 32)
+    for bad in (dict(embeddings_threads=0), dict(embeddings_batch_size=0)):
+        with pytest.raises(ValidationError):
+            SlackBotConfig(**base, embedding_model="onnx", **bad)
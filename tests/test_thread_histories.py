@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+
+from innieme.thread_histories import ThreadHistories, ThreadHistory
+
+
+def _text(history):
+    return [(type(m).__name__, m.parts[0].content) for m in history.messages]
+
+
+def _user(content):
+    return {"role": "user", "content": content}
+
+
+def _bot(content):
+    return {"role": "assistant", "content": content}
+
+
+def test_first_turn_is_seeded_from_the_thread_context():
+    history = ThreadHistory()
+    history.reconcile([_user("starter"), _bot("earlier reply"), _user("question")])
+    assert _text(history) == [("ModelRequest", "starter"), ("ModelResponse", "earlier reply")]
+
+
+def test_later_turns_append_only_messages_posted_since():
+    history = ThreadHistory()
+    history.reconcile([_user("starter"), _user("q1")])
+    # What the engine appends for the first turn.
+    history.messages += [ModelRequest(parts=[UserPromptPart(content="q1")]),
+                         ModelResponse(parts=[TextPart(content="a1")])]
+    history.reconcile([_user("starter"), _user("q1"), _bot("a1 as posted"), _user("aside"), _user("q2")])
+    assert [content for _, content in _text(history)] == ["starter", "q1", "a1", "aside"]
+
+
+def test_a_window_that_slid_past_the_last_turn_is_appended_whole():
+    history = ThreadHistory()
+    history.reconcile([_user(f"m{i}") for i in range(3)])
+    before = len(history.messages)
+    history.reconcile([_bot("reply"), _user("m7"), _user("m8"), _user("q")])
+    assert [content for _, content in _text(history)][before:] == ["m7", "m8"]
+
+
+def test_least_recently_used_and_idle_threads_are_dropped():
+    threads = ThreadHistories(max_threads=2, idle_ttl=3600)
+    first = threads.get("a")
+    threads.get("b")
+    assert threads.get("a") is first
+    threads.get("c")
+    assert "b" not in threads and "a" in threads and len(threads) == 2
+
+    threads.idle_ttl = 0
+    threads.get("d")
+    assert list(threads._threads) == ["d"]
+
+
+@pytest.mark.asyncio
+async def test_a_thread_mid_turn_is_kept_and_turns_run_one_at_a_time():
+    threads = ThreadHistories(max_threads=1)
+    order = []
+
+    async def turn(name):
+        history = threads.get("a")
+        async with history.lock:
+            order.append(f"{name} start")
+            threads.get("other")
+            await asyncio.sleep(0)
+            order.append(f"{name} end")
+
+    await asyncio.gather(turn("one"), turn("two"))
+
+    assert order == ["one start", "one end", "two start", "two end"]
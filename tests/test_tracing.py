@@ -0,0 +1,86 @@
+import logging
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from pydantic_ai.models.test import TestModel
+
+from innieme import tracing
+
+
+class WordEmbeddings(Embeddings):
+    WORDS = ["refund", "invoice", "deploy"]
+
+    def _vector(self, text):
+        return [float(w in text) for w in self.WORDS] + [0.1]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def test_request_logs_stages_and_counts(caplog):
+    with caplog.at_level(logging.INFO, logger="innieme.tracing"):
+        with tracing.request("slack", topic="ops") as timing:
+            with tracing.span("retrieval"):
+                pass
+            with tracing.span("llm"):
+                tracing.count(input_tokens=100, output_tokens=20)
+            with tracing.span("llm"):
+                tracing.count(input_tokens=50, output_tokens=None)
+
+    assert list(timing.stages) == ["retrieval", "llm"]
+    record = caplog.records[-1]
+    assert record.getMessage().startswith("Request slack topic=ops total_ms=")
+    assert record.timing["input_tokens"] == 150
+    assert "output_tokens" in record.timing and record.timing["output_tokens"] == 20
+    assert {"retrieval_ms", "llm_ms"} <= set(record.timing)
+
+
+def test_spans_outside_a_request_are_harmless():
+    with tracing.span("retrieval", top_k=5, topic=None):
+        tracing.count(chunks=3)
+    tracing.record("embed_query", 0, 1_000_000)
+    assert tracing.current() is None
+
+
+def test_a_failed_request_still_logs(caplog):
+    with caplog.at_level(logging.INFO, logger="innieme.tracing"):
+        with pytest.raises(RuntimeError):
+            with tracing.request("discord"):
+                raise RuntimeError("boom")
+    assert caplog.records[-1].timing["error"] == "RuntimeError"
+
+
+@pytest.mark.asyncio
+async def test_query_stages_are_timed(tmp_path, monkeypatch):
+    from innieme.conversation_engine import ConversationEngine
+    from innieme.discord_bot_config import DiscordBotConfig, OutieConfig, TopicConfig
+    from innieme.document_processor import DocumentProcessor
+    from innieme.embeddings_factory import ExistingEmbeddingsFactory
+    from innieme.knowledge_manager import KnowledgeManager
+    from innieme.vector_store_factory import FAISSVectorStoreFactory
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test_key")
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "refunds.md").write_text("Refund requests are answered within a week.")
+    bot = DiscordBotConfig(discord_token="t", embeddings_api_key="k", llm_api_key="k",
+                           embedding_model="fake", outies=[])
+    outie = OutieConfig(outie_id=1, topics=[], bot=bot)
+    bot.outies.append(outie)
+    topic = TopicConfig(name="tracing", role="Helpful.", docs_dir=str(tmp_path / "docs"),
+                        channels=[], outie=outie)
+    processor = DocumentProcessor("tracing", topic.docs_dir, ExistingEmbeddingsFactory(WordEmbeddings()),
+                                  FAISSVectorStoreFactory(), query_batch_window=0.001)
+    await processor.scan_and_vectorize()
+    engine = ConversationEngine(topic, processor, KnowledgeManager(summaries_path=str(tmp_path / "s")))
+
+    with engine.agent.override(model=TestModel()):
+        with tracing.request("test") as timing:
+            await engine.process_query("refund?", [{"role": "user", "content": "refund?"}])
+
+    assert {"retrieval", "embed_query", "vector_search", "llm"} <= set(timing.stages)
+    assert timing.stages["embed_query"] <= timing.stages["retrieval"]
+    assert timing.counts["chunks"] == 1
+    assert timing.counts["input_tokens"] > 0 and timing.counts["output_tokens"] > 0